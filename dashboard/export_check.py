@@ -0,0 +1,130 @@
+"""
+Check of the incremental exporter (export_cloudwatch_metrics.py) against StubCloudWatch and a local directory.
+
+Invocations are generated over two days crossing midnight and exported in successive runs. Checks:
+    - get_metric_data is paged through without losing datapoints
+    - the first run exports the lookback window into date partitions, with the statistics of the samples
+      (invocation counts, p50 <= p95 <= p99 <= maximum duration)
+    - a rerun at the same time writes nothing, and a later run only appends the datapoints after the high-water marks
+    - a run that fails before saving the high-water marks overwrites its part files when rerun, without duplicates
+Reports the time of the first run.
+
+Usage:
+    $ python export_check.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from export_cloudwatch_metrics import (FUNCTIONS, LocalStorage, StubCloudWatch, export_metrics, get_series,
+                                       get_series_key, get_state_key)
+
+PREFIX = 'plagiarism-detector-dashboard'
+STAGES = ['total', 'matcher', 'paraphrase']
+
+
+def check(condition, message):
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    return condition
+
+
+def read_series(directory, series):
+    """
+    Returns the records of every part file of the series, by date partition.
+    """
+    storage = LocalStorage(directory)
+    series_dir = os.path.join(directory, PREFIX, series['function'], series['name'])
+    partitions = {}
+    for partition in sorted(os.listdir(series_dir)) if os.path.isdir(series_dir) else []:
+        for part in sorted(os.listdir(os.path.join(series_dir, partition))):
+            partitions.setdefault(partition, []).extend(storage.read_json(os.path.join(PREFIX, series['function'], series['name'], partition, part)))
+
+    return partitions
+
+
+def read_all(directory):
+    return {get_series_key(series): [record for records in read_series(directory, series).values() for record in records]
+            for series in get_series(FUNCTIONS, STAGES)}
+
+
+def count_files(directory):
+    return sum(len(files) for _, _, files in os.walk(directory))
+
+
+class FailingStorage(LocalStorage):
+    """
+    Local storage failing when the high-water marks are saved.
+    """
+
+    def write_json(self, key, data):
+        if key == get_state_key(PREFIX):
+            raise IOError('state write failed')
+        super().write_json(key, data)
+
+
+def main():
+    start = datetime(2023, 4, 6, 12, tzinfo=timezone.utc)
+    end = start + timedelta(days=2)
+    stub = StubCloudWatch.generate(FUNCTIONS, STAGES, start, end, page_size=997)
+    kwargs = {'functions': FUNCTIONS, 'stages': STAGES, 'prefix': PREFIX, 'period': 60, 'lookback_days': 1, 'settle_minutes': 5}
+    directory = tempfile.mkdtemp()
+    passed = True
+    try:
+        first_now = start + timedelta(days=1)
+        run_start = time.perf_counter()
+        summary = export_metrics(stub, LocalStorage(directory), now=first_now, **kwargs)
+        run_seconds = time.perf_counter() - run_start
+        passed &= check(summary['requests'] > 1, f"get_metric_data is paged through ({summary['requests']} requests)")
+
+        series = {get_series_key(s): s for s in get_series(FUNCTIONS, STAGES)}
+        invocations = read_series(directory, series['plagiarism_1ton/invocations'])
+        window_end = first_now - timedelta(minutes=5)
+        n_samples = sum(1 for timestamp, _ in stub.samples[('AWS/Lambda', 'Invocations', 'plagiarism_1ton')] if timestamp < window_end)
+        n_exported = sum(record['value'] for records in invocations.values() for record in records)
+        passed &= check(sorted(invocations) == ['date=2023-04-06', 'date=2023-04-07'] and n_exported == n_samples,
+                        f'the first run exports {n_samples} invocations into the date partitions {sorted(invocations)}')
+
+        records = read_all(directory)
+        by_time = {name: {record['time']: record['value'] for record in records[f'plagiarism_1to1/{name}']}
+                   for name in ['duration_p50', 'duration_p95', 'duration_p99', 'duration_max']}
+        passed &= check(by_time['duration_p50'] and all(by_time['duration_p50'][t] <= by_time['duration_p95'][t] <= by_time['duration_p99'][t]
+                                                        <= by_time['duration_max'][t] for t in by_time['duration_p50']),
+                        'duration p50 <= p95 <= p99 <= maximum in every period')
+        passed &= check(all(records[f'plagiarism_1ton/{stage}_ms_p95'] for stage in STAGES), 'the stage durations are exported')
+
+        n_files = count_files(directory)
+        summary = export_metrics(stub, LocalStorage(directory), now=first_now, **kwargs)
+        passed &= check(summary['datapoints'] == 0 and count_files(directory) == n_files, 'a rerun at the same time writes nothing')
+
+        summary = export_metrics(stub, LocalStorage(directory), now=first_now + timedelta(hours=3), **kwargs)
+        later_records = read_all(directory)
+        new_points = sum(len(later_records[key]) - len(records[key]) for key in records)
+        unique = all(len({record['time'] for record in points}) == len(points) and [record['time'] for record in points] == sorted(record['time'] for record in points)
+                     for points in later_records.values())
+        passed &= check(summary['datapoints'] == new_points > 0 and unique and all(later_records[key][:len(records[key])] == records[key] for key in records),
+                        f"a later run appends {summary['datapoints']} new datapoints without duplicates")
+
+        failed = False
+        try:
+            export_metrics(stub, FailingStorage(directory), now=first_now + timedelta(hours=6), **kwargs)
+        except IOError:
+            failed = True
+        summary = export_metrics(stub, LocalStorage(directory), now=first_now + timedelta(hours=7), **kwargs)
+        final_records = read_all(directory)
+        unique = all(len({record['time'] for record in points}) == len(points) for points in final_records.values())
+        passed &= check(failed and unique and sum(map(len, final_records.values())) == sum(map(len, later_records.values())) + summary['datapoints'],
+                        'a failed run is rerun without duplicate datapoints')
+
+        print(f'     first run: {run_seconds * 1000:.0f} ms for a day of {len(series)} series')
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print('all checks passed' if passed else 'some checks failed')
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,431 @@
+"""
+Incremental export of the plagiarism detector's CloudWatch metrics to S3, for the QuickSight dashboard.
+
+For every Lambda function, the AWS/Lambda invocations, errors and duration (average, maximum, p50, p95, p99) are
+exported, along with the per-stage durations the handlers log as EMF metrics (see lambda/app/metrics.py). Only the
+datapoints after the high-water mark of each series (its last exported timestamp) are fetched: get_metric_data is paged
+through, and the new datapoints are written as new part files in date partitions, e.g.
+    plagiarism-detector-dashboard/plagiarism_1ton/duration_p95/date=2023-04-06/20230406T000000Z.json
+so a run never re-exports or rewrites the history. The high-water marks are kept in
+    plagiarism-detector-dashboard/_state/high_water_marks.json
+A part file is named after the start of the run's time window, so a run that fails before saving the high-water marks
+overwrites its part files when rerun instead of duplicating them.
+
+`--source stub` exports from StubCloudWatch, which generates invocations in memory, and `--local-dir` writes to a local
+directory instead of S3, so the exporter can be run without AWS access (boto3 is only imported for CloudWatch & S3).
+
+Usage:
+    $ python export_cloudwatch_metrics.py
+    $ python export_cloudwatch_metrics.py --functions plagiarism_1ton=plagiarism_detector_1ton --stages total matcher
+    $ python export_cloudwatch_metrics.py --source stub --local-dir /tmp/dashboard
+"""
+import argparse
+import json
+import math
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+## CONFIG
+S3_BUCKET_NAME = os.environ.get('DASHBOARD_BUCKET', 'nus-sambaash') # bucket of the dashboard datasets
+S3_PREFIX = os.environ.get('DASHBOARD_PREFIX', 'plagiarism-detector-dashboard') # prefix of the partitioned datasets
+FUNCTIONS = {'plagiarism_1to1': 'plagiarism_detector_1to1', # Lambda function name -> handler name (EMF dimension)
+             'plagiarism_1ton': 'plagiarism_detector_1ton'}
+STAGES = ['total', 'document_read', 'sentence_splitting', 'matcher', 'paraphrase', 'containment', 'lcs', 'final_prediction'] # EMF <stage>_ms metrics
+EMF_NAMESPACE = 'PlagiarismDetector' # namespace of the handlers' EMF metrics
+PERIOD = 60 # seconds per datapoint
+LOOKBACK_DAYS = 14 # history exported on the first run (1-minute datapoints are kept for 15 days)
+SETTLE_MINUTES = 5 # the most recent minutes are left for the next run, as CloudWatch may still aggregate them
+MAX_QUERIES = 500 # limit of get_metric_data queries per request
+
+LAMBDA_SERIES = [('invocations', 'Invocations', 'Sum'), # (series name, AWS/Lambda metric, statistic)
+                 ('errors', 'Errors', 'Sum'),
+                 ('duration_avg', 'Duration', 'Average'),
+                 ('duration_max', 'Duration', 'Maximum'),
+                 ('duration_p50', 'Duration', 'p50'),
+                 ('duration_p95', 'Duration', 'p95'),
+                 ('duration_p99', 'Duration', 'p99')]
+STAGE_STATS = ['Average', 'p50', 'p95', 'p99'] # statistics of each stage duration
+
+
+######## SERIES ########
+
+def get_series(functions, stages):
+    """
+    Returns the metric series to export for each function: its Lambda metrics and the durations of the stages.
+
+    Args:
+        functions (dict): Lambda function name -> handler name, the function dimension of the EMF metrics.
+        stages (list): stages whose <stage>_ms EMF metric is exported.
+    """
+    series_lst = []
+    for function_name, handler_name in functions.items():
+        for name, metric_name, stat in LAMBDA_SERIES:
+            series_lst.append({'function': function_name, 'name': name, 'namespace': 'AWS/Lambda', 'metric_name': metric_name,
+                               'dimensions': [{'Name': 'FunctionName', 'Value': function_name}], 'stat': stat})
+        for stage in stages:
+            for stat in STAGE_STATS:
+                series_lst.append({'function': function_name, 'name': f'{stage}_ms_{stat.lower()}', 'namespace': EMF_NAMESPACE,
+                                   'metric_name': f'{stage}_ms', 'dimensions': [{'Name': 'function', 'Value': handler_name}], 'stat': stat})
+
+    return series_lst
+
+
+def get_series_key(series):
+    return f"{series['function']}/{series['name']}"
+
+
+def get_queries(series_lst, period):
+    """
+    Returns the get_metric_data queries of the series, with IDs q0, q1, ...
+    """
+    return [{'Id': f'q{i}',
+             'Label': get_series_key(series),
+             'MetricStat': {'Metric': {'Namespace': series['namespace'], 'MetricName': series['metric_name'], 'Dimensions': series['dimensions']},
+                            'Period': period,
+                            'Stat': series['stat']}}
+            for i, series in enumerate(series_lst)]
+
+
+######## CLOUDWATCH ########
+
+def get_metric_datapoints(cloudwatch, series_lst, start_time, end_time, period):
+    """
+    Retrieves the datapoints of the series between start_time (inclusive) and end_time (exclusive), paging through
+    get_metric_data and splitting the queries into requests of at most MAX_QUERIES.
+
+    Returns:
+        datapoints (dict): series key -> list of (timestamp, value), in ascending time order.
+        requests (int): number of get_metric_data requests made.
+    """
+    datapoints = {get_series_key(series): [] for series in series_lst}
+    requests = 0
+    for chunk_start in range(0, len(series_lst), MAX_QUERIES):
+        chunk = series_lst[chunk_start:chunk_start + MAX_QUERIES]
+        keys = {f'q{i}': get_series_key(series) for i, series in enumerate(chunk)}
+        kwargs = {'MetricDataQueries': get_queries(chunk, period), 'StartTime': start_time, 'EndTime': end_time,
+                  'ScanBy': 'TimestampAscending'}
+        while True:
+            response = cloudwatch.get_metric_data(**kwargs)
+            requests += 1
+            for result in response['MetricDataResults']:
+                datapoints[keys[result['Id']]] += zip(result['Timestamps'], result['Values'])
+            if not response.get('NextToken'):
+                break
+            kwargs['NextToken'] = response['NextToken']
+
+    return {key: sorted(points, key=lambda point: point[0]) for key, points in datapoints.items()}, requests
+
+
+def get_percentile(values, percentile):
+    """
+    Returns the nearest-rank percentile of values.
+    """
+    values = sorted(values)
+    rank = max(1, math.ceil(percentile / 100 * len(values)))
+
+    return values[rank - 1]
+
+
+def get_statistic(values, stat):
+    """
+    Returns a CloudWatch statistic (Sum, Average, Maximum, Minimum, SampleCount or pNN) of the sample values.
+    """
+    if stat == 'Sum':
+        return float(sum(values))
+    if stat == 'Average':
+        return sum(values) / len(values)
+    if stat == 'Maximum':
+        return float(max(values))
+    if stat == 'Minimum':
+        return float(min(values))
+    if stat == 'SampleCount':
+        return float(len(values))
+    if stat.startswith('p'):
+        return float(get_percentile(values, float(stat[1:])))
+    raise ValueError(f'Unsupported statistic {stat}')
+
+
+class StubCloudWatch:
+    """
+    Local stand-in for the CloudWatch client's get_metric_data, aggregating in-memory samples into period statistics
+    and returning them page_size datapoints at a time.
+
+    Args:
+        samples (dict): (namespace, metric name, function dimension value) -> list of (timestamp, value).
+        page_size (int): maximum number of datapoints per response (100,800 in CloudWatch).
+    """
+
+    def __init__(self, samples, page_size=100800):
+        self.samples = samples
+        self.page_size = page_size
+        self.last_request = None
+        self.datapoints = []
+
+    @classmethod
+    def generate(cls, functions, stages, start_time, end_time, invocations_per_minute=3, seed=0, page_size=100800):
+        """
+        Returns a stub whose functions are invoked at random between start_time and end_time, with random durations,
+        errors and stage durations.
+        """
+        rng = random.Random(seed)
+        samples = {}
+        for function_name, handler_name in functions.items():
+            timestamp = start_time
+            while True:
+                timestamp += timedelta(seconds=rng.expovariate(invocations_per_minute / 60))
+                if timestamp >= end_time:
+                    break
+                stage_ms = {stage: rng.lognormvariate(4, 1) for stage in stages if stage != 'total'}
+                total_ms = sum(stage_ms.values()) + rng.lognormvariate(3, 0.5)
+                stage_ms['total'] = total_ms
+                samples.setdefault(('AWS/Lambda', 'Invocations', function_name), []).append((timestamp, 1))
+                samples.setdefault(('AWS/Lambda', 'Errors', function_name), []).append((timestamp, int(rng.random() < 0.02)))
+                samples.setdefault(('AWS/Lambda', 'Duration', function_name), []).append((timestamp, total_ms + 5))
+                for stage in stages:
+                    samples.setdefault((EMF_NAMESPACE, f'{stage}_ms', handler_name), []).append((timestamp, stage_ms[stage]))
+
+        return cls(samples, page_size)
+
+    def get_statistics(self, query, start_time, end_time):
+        """
+        Returns the (timestamp, value) datapoints of a query in ascending time order, one per period with samples.
+        """
+        stat = query['MetricStat']
+        metric = stat['Metric']
+        period = stat['Period']
+        samples = self.samples.get((metric['Namespace'], metric['MetricName'], metric['Dimensions'][0]['Value']), [])
+        periods = {}
+        for timestamp, value in samples:
+            if start_time <= timestamp < end_time:
+                seconds = int(timestamp.timestamp()) // period * period
+                periods.setdefault(seconds, []).append(value)
+
+        return [(datetime.fromtimestamp(seconds, timezone.utc), get_statistic(values, stat['Stat']))
+                for seconds, values in sorted(periods.items())]
+
+    def get_metric_data(self, MetricDataQueries, StartTime, EndTime, ScanBy='TimestampDescending', NextToken=None, **kwargs):
+        request = json.dumps([MetricDataQueries, StartTime.isoformat(), EndTime.isoformat(), ScanBy], sort_keys=True)
+        if request != self.last_request:
+            # the datapoints of a request are computed once, for its first page
+            self.datapoints = []
+            for query in MetricDataQueries:
+                points = self.get_statistics(query, StartTime, EndTime)
+                self.datapoints += [(query['Id'], timestamp, value)
+                                    for timestamp, value in (points if ScanBy == 'TimestampAscending' else points[::-1])]
+            self.last_request = request
+        datapoints = self.datapoints
+        offset = int(NextToken or 0)
+        page = datapoints[offset:offset + self.page_size]
+        more = offset + self.page_size < len(datapoints)
+
+        results = {query['Id']: {'Id': query['Id'], 'Label': query.get('Label', query['Id']), 'Timestamps': [], 'Values': [],
+                                 'StatusCode': 'PartialData' if more else 'Complete'}
+                   for query in MetricDataQueries}
+        for query_id, timestamp, value in page:
+            results[query_id]['Timestamps'].append(timestamp)
+            results[query_id]['Values'].append(value)
+        response = {'MetricDataResults': list(results.values())}
+        if more:
+            response['NextToken'] = str(offset + self.page_size)
+
+        return response
+
+
+######## STORAGE ########
+
+class S3Storage:
+    """
+    JSON objects in an S3 bucket.
+    """
+
+    def __init__(self, bucket):
+        import boto3
+
+        self.bucket = bucket
+        self.s3_client = boto3.client('s3')
+
+    def read_json(self, key):
+        """
+        Returns the JSON object at key, or None if it does not exist.
+        """
+        try:
+            return json.loads(self.s3_client.get_object(Bucket=self.bucket, Key=key)['Body'].read())
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+
+    def write_json(self, key, data):
+        self.s3_client.put_object(Bucket=self.bucket, Key=key, Body=json.dumps(data).encode('UTF-8'), ContentType='application/json')
+
+    def get_uri(self, key):
+        return f's3://{self.bucket}/{key}'
+
+
+class LocalStorage:
+    """
+    JSON files in a local directory, laid out like the S3 bucket.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def read_json(self, key):
+        """
+        Returns the JSON file at key, or None if it does not exist.
+        """
+        try:
+            with open(os.path.join(self.directory, key)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def write_json(self, key, data):
+        filepath = os.path.join(self.directory, key)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, 'w') as f:
+            json.dump(data, f)
+
+    def get_uri(self, key):
+        return os.path.abspath(os.path.join(self.directory, key))
+
+
+def get_state_key(prefix):
+    return f'{prefix}/_state/high_water_marks.json'
+
+
+def get_partition_key(prefix, series, day, window_start):
+    """
+    Returns the key of a part file of the series: one per date partition & run, named after the start of the run's
+    time window.
+    """
+    return f"{prefix}/{series['function']}/{series['name']}/date={day}/{window_start:%Y%m%dT%H%M%SZ}.json"
+
+
+def write_manifest(storage, prefix, functions):
+    """
+    Writes the QuickSight manifest covering the partitions of every function.
+    """
+    manifest = {'fileLocations': [{'URIPrefixes': [storage.get_uri(f'{prefix}/{function_name}/') for function_name in functions]}],
+                'globalUploadSettings': {'format': 'JSON'}}
+    storage.write_json(f'{prefix}/quicksight_manifest.json', manifest)
+
+
+######## EXPORT ########
+
+def get_time_window(high_water_marks, series_lst, period, lookback_days, settle_minutes, now):
+    """
+    Returns the (start, end) of the datapoints to retrieve: from the period after the earliest high-water mark of the
+    series (or lookback_days ago for a series never exported), to the last complete period settle_minutes ago.
+    """
+    end_seconds = int((now - timedelta(minutes=settle_minutes)).timestamp()) // period * period
+    start_seconds = end_seconds
+    for series in series_lst:
+        high_water_mark = high_water_marks.get(get_series_key(series))
+        if high_water_mark is None:
+            series_start = int((now - timedelta(days=lookback_days)).timestamp()) // period * period
+        else:
+            series_start = int(datetime.fromisoformat(high_water_mark).timestamp()) + period
+        start_seconds = min(start_seconds, series_start)
+
+    return datetime.fromtimestamp(start_seconds, timezone.utc), datetime.fromtimestamp(end_seconds, timezone.utc)
+
+
+def format_metric_data(series, points):
+    """
+    Converts datapoints into records that can be ingested by QuickSight.
+    """
+    return [{'value': value, 'time': timestamp.isoformat(), 'function': series['function'], 'metric': series['name']}
+            for timestamp, value in points]
+
+
+def export_metrics(cloudwatch, storage, functions=FUNCTIONS, stages=STAGES, prefix=S3_PREFIX, period=PERIOD,
+                   lookback_days=LOOKBACK_DAYS, settle_minutes=SETTLE_MINUTES, now=None):
+    """
+    Exports the datapoints of every series after its high-water mark to new part files, then advances the high-water
+    marks.
+
+    Args:
+        cloudwatch: CloudWatch client (or StubCloudWatch).
+        storage: S3Storage or LocalStorage the partitions & high-water marks are written to.
+        now (datetime): end of the export, default the current time.
+
+    Returns:
+        summary (dict): time window, number of get_metric_data requests, datapoints & part files written.
+    """
+    now = now or datetime.now(timezone.utc)
+    series_lst = get_series(functions, stages)
+    high_water_marks = storage.read_json(get_state_key(prefix)) or {}
+    start_time, end_time = get_time_window(high_water_marks, series_lst, period, lookback_days, settle_minutes, now)
+    summary = {'start_time': start_time.isoformat(), 'end_time': end_time.isoformat(), 'requests': 0, 'datapoints': 0, 'files': 0}
+    if start_time >= end_time:
+        return summary
+
+    datapoints, summary['requests'] = get_metric_datapoints(cloudwatch, series_lst, start_time, end_time, period)
+    for series in series_lst:
+        key = get_series_key(series)
+        high_water_mark = high_water_marks.get(key)
+        points = [point for point in datapoints[key]
+                  if high_water_mark is None or point[0] > datetime.fromisoformat(high_water_mark)]
+        partitions = {}
+        for point in points:
+            partitions.setdefault(point[0].date().isoformat(), []).append(point)
+        for day, day_points in partitions.items():
+            storage.write_json(get_partition_key(prefix, series, day, start_time), format_metric_data(series, day_points))
+        if points:
+            high_water_marks[key] = points[-1][0].isoformat()
+        summary['datapoints'] += len(points)
+        summary['files'] += len(partitions)
+
+    write_manifest(storage, prefix, functions)
+    storage.write_json(get_state_key(prefix), high_water_marks)
+
+    return summary
+
+
+def lambda_handler(event, context):
+    """
+    Scheduled (e.g. EventBridge) entry point. The event may override the functions, stages, period and lookback_days.
+    """
+    import boto3
+
+    event = event or {}
+    return export_metrics(boto3.client('cloudwatch'), S3Storage(S3_BUCKET_NAME),
+                          functions=event.get('functions', FUNCTIONS),
+                          stages=event.get('stages', STAGES),
+                          period=event.get('period', PERIOD),
+                          lookback_days=event.get('lookback_days', LOOKBACK_DAYS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--functions', nargs='+', default=None,
+                        help='Lambda functions as <function name>=<handler name> (default plagiarism_1to1 & plagiarism_1ton)')
+    parser.add_argument('--stages', nargs='*', default=STAGES, help='stages whose EMF duration metric is exported')
+    parser.add_argument('--period', type=int, default=PERIOD, help='seconds per datapoint')
+    parser.add_argument('--lookback-days', type=float, default=LOOKBACK_DAYS, help='history exported on the first run')
+    parser.add_argument('--settle-minutes', type=float, default=SETTLE_MINUTES, help='most recent minutes left for the next run')
+    parser.add_argument('--prefix', default=S3_PREFIX, help='prefix of the partitioned datasets')
+    parser.add_argument('--bucket', default=S3_BUCKET_NAME, help='S3 bucket to export to')
+    parser.add_argument('--local-dir', default=None, help='export to this local directory instead of S3')
+    parser.add_argument('--source', choices=['cloudwatch', 'stub'], default='cloudwatch',
+                        help='stub exports generated invocations instead of CloudWatch metrics')
+    args = parser.parse_args()
+
+    functions = dict(function.split('=', 1) if '=' in function else (function, function) for function in args.functions) \
+        if args.functions else FUNCTIONS
+    now = datetime.now(timezone.utc)
+    if args.source == 'stub':
+        cloudwatch = StubCloudWatch.generate(functions, args.stages, now - timedelta(days=args.lookback_days), now)
+    else:
+        import boto3
+        cloudwatch = boto3.client('cloudwatch')
+    storage = LocalStorage(args.local_dir) if args.local_dir else S3Storage(args.bucket)
+
+    summary = export_metrics(cloudwatch, storage, functions, args.stages, args.prefix, args.period, args.lookback_days,
+                             args.settle_minutes, now)
+    print(f"{summary['start_time']} - {summary['end_time']}: {summary['datapoints']} datapoints in {summary['files']} files "
+          f"({summary['requests']} get_metric_data requests)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+Lambda entry module of the POST /get_batch_matches API (plagiarism_detector_batch).
+"""
+import json
+
+from batch_matching import get_batch_matching_output
+from compiled_functions import (add_batch_output_data, final_model_name,
+                                get_response_object, ngrams_lst, s3_bucket,
+                                s3_output_data_filepath, sentbert_model_name,
+                                warm_up_models, warm_up_models_on_init)
+from metrics import instrument_handler
+
+if warm_up_models_on_init:
+    warm_up_models(sentbert_model_name, final_model_name, ngrams_lst)
+
+@instrument_handler
+def plagiarism_detector_batch(event, context):
+    """
+    Lambda function handler for the POST /get_batch_matches API request.
+    """
+    response_object = get_response_object()
+    try:
+        event_dict = json.dumps(event)
+        request_body = json.loads(event_dict)['body']
+
+        user_id = json.loads(request_body)['user_id']
+        input_doc_names = json.loads(request_body)['input_doc_names']
+        source_doc_names = json.loads(request_body).get('source_doc_names')
+
+        response = get_batch_matching_output(sentbert_model_name, final_model_name, ngrams_lst, input_doc_names, source_doc_names)
+        add_batch_output_data(user_id, response, "n-m", s3_bucket, s3_output_data_filepath, 'all' if source_doc_names is None else ','.join(source_doc_names))
+
+        response_object['statusCode'] = 200
+        response_object['body'] = json.dumps(response, default=str)
+
+    except KeyError as e:
+        response_object['statusCode'] = 400
+        response_object['body'] = f"Missing input keys, please check your API input. {str(e)}"
+
+    except Exception as e:
+        response_object['statusCode'] = 500
+        response_object['body'] = str(e)
+
+    return response_object
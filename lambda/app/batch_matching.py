@@ -0,0 +1,294 @@
+import difflib
+from statistics import mean
+
+from compiled_functions import (get_feature_dict, get_matching_texts,
+                                get_n_avg_containment_scores,
+                                get_non_direct_texts, get_preprocessed_sent,
+                                get_sentence_texts, get_source_sentences,
+                                load_final_predictor, load_s3_model,
+                                modified_output_lists, np,
+                                read_content_index, read_s3_pdf,
+                                read_source_database, resolve_doc_name,
+                                s3_bucket, s3_content_index_filepath,
+                                s3_webis_data_filepath, sklearn_pairwise,
+                                sklearn_text, textmatcher)
+from metrics import count, timer
+
+######## BATCH N×M PREPROCESSING FUNCTIONS ########
+
+def prepare_batch_documents(docs, prepared_cache):
+    """
+    Preprocesses every document of a batch once: sentence split, sentence Text objects, document Text object and source sentences.
+    A document appearing several times (e.g. both as input and as source) is prepared once and shared.
+
+    Args:
+        docs (list[tuple]): List of (doc_name, doc) tuples.
+        prepared_cache (dict): Already prepared documents, keyed by doc_name. Updated in place.
+
+    Returns:
+        prepared_docs (list[dict]): One dictionary per document with keys doc_name, doc, input_text_lst, input_sent_texts, source_text & source_sent.
+    """
+    prepared_docs = []
+
+    for doc_name, doc in docs:
+        if doc_name not in prepared_cache:
+            input_text_lst = get_preprocessed_sent(doc)
+            with timer('text_construction'):
+                source_text = textmatcher.Text(doc)
+            prepared_cache[doc_name] = {'doc_name': doc_name,
+                                        'doc': doc,
+                                        'input_text_lst': input_text_lst,
+                                        'input_sent_texts': get_sentence_texts(input_text_lst),
+                                        'source_text': source_text,
+                                        'source_sent': get_source_sentences(doc)}
+        prepared_docs.append(prepared_cache[doc_name])
+
+    return prepared_docs
+
+def add_batch_embeddings(model, input_docs, source_docs):
+    """
+    Encodes all distinct candidate input sentences and source sentences of a batch in a single call, and stores each document's embeddings.
+
+    Args:
+        model (SentenceTransformer): Sentence Transformer model.
+        input_docs (list[dict]): Prepared input documents.
+        source_docs (list[dict]): Prepared source documents.
+    """
+    sentence_ids = {}
+    doc_sentence_ids = []
+
+    for doc in input_docs:
+        candidate_idx = [i for i, input_sent_dict in enumerate(doc['input_text_lst']) if len(input_sent_dict['sentence'].split()) > 3]
+        doc['candidate_idx'] = candidate_idx
+        doc_sentence_ids.append((doc, 'input_embeddings', [sentence_ids.setdefault(doc['input_text_lst'][i]['sentence'], len(sentence_ids)) for i in candidate_idx]))
+
+    for doc in source_docs:
+        doc_sentence_ids.append((doc, 'source_embeddings', [sentence_ids.setdefault(sentence, len(sentence_ids)) for sentence in doc['source_sent']]))
+
+    with timer('bert_encoding'):
+        embeddings = np.asarray(model.encode(list(sentence_ids))) if sentence_ids else np.zeros((0, 0))
+    count('encoded_sentences', len(sentence_ids))
+
+    for doc, key, ids in doc_sentence_ids:
+        doc[key] = embeddings[ids] if ids else np.zeros((0, embeddings.shape[1]))
+
+    return None
+
+
+######## BATCH N×M FEATURE GENERATION FUNCTIONS ########
+
+def get_batch_containment_matrices(input_docs, source_docs, ngrams_lst):
+    """
+    Returns the containment scores of every input document against every source document, for each n-gram size.
+    Uses a single n-gram count matrix over the whole batch; the intersection of two count vectors is (|a| + |b| - |a - b|) / 2.
+
+    Args:
+        input_docs (list[dict]): Prepared input documents.
+        source_docs (list[dict]): Prepared source documents.
+        ngrams_lst (lst): List of selected n_grams used to generate containment scores.
+
+    Returns:
+        containment_matrices (dict): Key is f"c_{n}", value is an array of shape (n_inputs, n_sources).
+    """
+    containment_matrices = {}
+    texts = [doc['doc'] for doc in input_docs] + [doc['doc'] for doc in source_docs]
+
+    for ngram in ngrams_lst:
+        with timer('count_vectors'):
+            counts = sklearn_text.CountVectorizer(analyzer='word', ngram_range=(ngram, ngram)).fit_transform(texts).astype(np.float64)
+        input_counts = counts[:len(input_docs)]
+        source_counts = counts[len(input_docs):]
+        input_totals = np.asarray(input_counts.sum(axis=1)).ravel()
+        source_totals = np.asarray(source_counts.sum(axis=1)).ravel()
+
+        l1_distances = sklearn_pairwise.pairwise_distances(input_counts, source_counts, metric='manhattan')
+        intersections = (input_totals[:, None] + source_totals[None, :] - l1_distances) / 2
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            containment_matrices[f"c_{ngram}"] = intersections / input_totals[:, None]
+
+    return containment_matrices
+
+def get_batch_lcs_matrix(input_docs, source_docs):
+    """
+    Returns the LCS score (see get_lcm_score) of every input document against every source document.
+    The lookup table of each source document is built once and reused for all input documents.
+
+    Args:
+        input_docs (list[dict]): Prepared input documents.
+        source_docs (list[dict]): Prepared source documents.
+
+    Returns:
+        lcs_matrix (arr): Array of shape (n_inputs, n_sources).
+    """
+    lcs_matrix = np.zeros((len(input_docs), len(source_docs)))
+
+    for j, source_doc in enumerate(source_docs):
+        matcher = difflib.SequenceMatcher(None, '', source_doc['doc'])
+        for i, input_doc in enumerate(input_docs):
+            matcher.set_seq1(input_doc['doc'])
+            max_len = max(len(input_doc['doc']), len(source_doc['doc']))
+            lcs_matrix[i, j] = matcher.find_longest_match(0, len(input_doc['doc']), 0, len(source_doc['doc'])).size / max_len
+
+    return lcs_matrix
+
+def batch_pair_matching_texts(input_doc, source_doc, similarity_matrix):
+    """
+    Returns the matching texts and average scores of one input & source document pair, given the precomputed sentence similarity matrix.
+    Mirrors one_one_matching_texts without re-tokenising or re-encoding either document.
+
+    Args:
+        input_doc (dict): Prepared input document.
+        source_doc (dict): Prepared source document.
+        similarity_matrix (arr): Cosine similarities of the input document's candidate sentences against the source document's sentences.
+
+    Returns:
+        plagiarised_text (list): Concatenation of direct matching and paraphrasing texts, sorted by starting character index.
+        direct_avg_score (float): Average direct matching cosine similarity score over number of sentences in input document.
+        paraphrase_avg_score (float): Average paraphrase cosine similarity score over number of sentences in input document.
+    """
+    input_text_lst = [input_sent_dict.copy() for input_sent_dict in input_doc['input_text_lst']]
+    direct_output, match_lst = get_matching_texts(input_text_lst, source_doc['source_text'], source_doc['doc_name'], input_doc['input_sent_texts'])
+    nonmatch_ids = set(id(input_sent_dict) for input_sent_dict in get_non_direct_texts(input_text_lst, match_lst))
+
+    paraphrase_output = []
+    if len(source_doc['source_sent']) > 0:
+        for row, i in enumerate(input_doc['candidate_idx']):
+            if id(input_text_lst[i]) not in nonmatch_ids:
+                continue
+            score = float(similarity_matrix[row].max())
+            if score > 0.7:
+                temp = input_text_lst[i]
+                temp['source_sentence'] = source_doc['source_sent'][similarity_matrix[row].argmax()]
+                temp['source_doc_name'] = source_doc['doc_name']
+                temp['score'] = score
+                paraphrase_output.append(temp)
+
+    plagiarised_text = sorted(direct_output + paraphrase_output, key=lambda d: d['start_char_index'])
+    new_direct_output, new_paraphrase_output = modified_output_lists(direct_output, paraphrase_output, 0.95)
+
+    input_doc_len = len(input_text_lst)
+    direct_avg_score = sum(output['score'] for output in new_direct_output) / input_doc_len if input_doc_len else 0
+    paraphrase_avg_score = sum(output['score'] for output in new_paraphrase_output) / input_doc_len if input_doc_len else 0
+
+    return plagiarised_text, direct_avg_score, paraphrase_avg_score
+
+
+######## BATCH N×M MATCHING OUTPUT GENERATION FUNCTIONS ########
+
+def batch_matching_texts(sentence_trans_model, ngrams_lst, input_docs, source_docs, excluded_pairs=None):
+    """
+    N×M matching function - compares every input document with every source document, preprocessing and encoding each document once.
+
+    Args:
+        sentence_trans_model (SentenceTransformer): Sentence Transformer model.
+        ngrams_lst (lst): List of selected n_grams used to generate containment scores.
+        input_docs (list[tuple]): List of (input_doc_name, input_doc) tuples.
+        source_docs (list[tuple]): List of (source_doc_name, source_doc) tuples.
+        excluded_pairs (set[tuple]): (input index, source index) pairs not to compare, e.g. a document with itself.
+
+    Returns:
+        matching_texts_lst (list[list[tuple]]): For each input document, one_one_matching_texts output for each compared source document, in source order.
+    """
+    excluded_pairs = excluded_pairs or set()
+    prepared_cache = {}
+    prepared_inputs = prepare_batch_documents(input_docs, prepared_cache)
+    prepared_sources = prepare_batch_documents(source_docs, prepared_cache)
+    add_batch_embeddings(sentence_trans_model, prepared_inputs, prepared_sources)
+
+    containment_matrices = get_batch_containment_matrices(prepared_inputs, prepared_sources, ngrams_lst)
+    lcs_matrix = get_batch_lcs_matrix(prepared_inputs, prepared_sources)
+    source_bounds = np.cumsum([0] + [len(doc['source_sent']) for doc in prepared_sources])
+    all_source_embeddings = np.concatenate([doc['source_embeddings'] for doc in prepared_sources]) if prepared_sources else None
+
+    matching_texts_lst = []
+
+    for i, input_doc in enumerate(prepared_inputs):
+        if len(input_doc['candidate_idx']) > 0 and all_source_embeddings is not None and len(all_source_embeddings) > 0:
+            similarity_matrix = sklearn_pairwise.cosine_similarity(input_doc['input_embeddings'], all_source_embeddings)
+        else:
+            similarity_matrix = np.zeros((len(input_doc['candidate_idx']), int(source_bounds[-1])))
+
+        input_matching_texts = []
+        for j, source_doc in enumerate(prepared_sources):
+            if (i, j) in excluded_pairs:
+                continue
+            plagiarised_text, direct_avg_score, paraphrase_avg_score = batch_pair_matching_texts(input_doc, source_doc, similarity_matrix[:, source_bounds[j]:source_bounds[j + 1]])
+            containment_scores = {key_name: float(matrix[i, j]) for key_name, matrix in containment_matrices.items()}
+            input_matching_texts.append((plagiarised_text, direct_avg_score, paraphrase_avg_score, containment_scores, float(lcs_matrix[i, j])))
+
+        matching_texts_lst.append(input_matching_texts)
+
+    return matching_texts_lst
+
+def get_batch_flag_score_predictions(final_model_name, features_lst):
+    """
+    Returns the flag and probability predictions of the trained final model for every row of features, in a single vectorised call.
+
+    Args:
+        final_model_name (str): Filepath of trained final model.
+        features_lst (list[dict]): Features of each input document, as returned by get_feature_dict.
+
+    Returns:
+        plagiarism_flags (arr): Predicted class of each row.
+        plagiarism_scores (arr): Probability of each row being flagged as plagiarised.
+    """
+    return load_final_predictor(s3_bucket, final_model_name).predict(features_lst)
+
+def get_batch_matching_output(sentbert_model_name, final_model_name, ngrams_lst, input_doc_names, source_doc_names=None):
+    """
+    Batch N×M matching function - given a list of input documents, compare each with the other input documents and the database of documents in S3
+    (or with the given source documents only) and return the plagiarised flag, score and plagiarised texts of every input document.
+
+    Args:
+        sentbert_model_name (str): Filepath of trained Sentence Transformer model.
+        final_model_name (str): Filepath of trained final model.
+        ngrams_lst (lst): List of selected n_grams used to generate containment scores.
+        input_doc_names (list[str]): Names of input documents in S3.
+        source_doc_names (list[str]): Optional names of source documents in S3. Defaults to the other input documents and the documents database.
+
+    Returns:
+        output_lst (list[dict]): One dictionary per input document with the same keys as the 1-n matching output, averaged across its source documents.
+    """
+    content_index = read_content_index(s3_bucket, s3_content_index_filepath)
+    input_docs = [(input_doc_name, read_s3_pdf(s3_bucket, input_doc_name)) for input_doc_name in input_doc_names]
+
+    if source_doc_names is not None:
+        source_docs = [(source_doc_name, read_s3_pdf(s3_bucket, source_doc_name)) for source_doc_name in source_doc_names]
+    else:
+        webis_df = read_source_database(s3_bucket, s3_webis_data_filepath) # This is the database of documents to check through.
+        batch_names = set(resolve_doc_name(input_doc_name, content_index) for input_doc_name in input_doc_names) | set(input_doc_names)
+        source_docs = input_docs + [(row['file_num'], row['text']) for index, row in webis_df.iterrows() if row['file_num'] not in batch_names]
+
+    # never compare a document with itself or with an upload it was deduplicated against
+    canonical_input_names = [resolve_doc_name(input_doc_name, content_index) for input_doc_name, _ in input_docs]
+    canonical_source_names = [resolve_doc_name(source_doc_name, content_index) for source_doc_name, _ in source_docs]
+    excluded_pairs = set((i, j) for i, input_name in enumerate(canonical_input_names) for j, source_name in enumerate(canonical_source_names) if input_name == source_name)
+
+    sentence_trans_model = load_s3_model(s3_bucket, sentbert_model_name)
+    matching_texts_lst = batch_matching_texts(sentence_trans_model, ngrams_lst, input_docs, source_docs, excluded_pairs)
+
+    plagiarised_text_lst = []
+    features_lst = []
+
+    for input_matching_texts in matching_texts_lst:
+        plagiarised_text_lst.append([match for matching_texts in input_matching_texts for match in matching_texts[0]])
+        if len(input_matching_texts) == 0:
+            features_lst.append(get_feature_dict({f"c_{ngram}": 0 for ngram in ngrams_lst}, 0, 0, 0))
+            continue
+        avg_containment_scores = get_n_avg_containment_scores([matching_texts[3] for matching_texts in input_matching_texts], ngrams_lst)
+        features_lst.append(get_feature_dict(avg_containment_scores,
+                                             mean(matching_texts[4] for matching_texts in input_matching_texts),
+                                             mean(matching_texts[1] for matching_texts in input_matching_texts),
+                                             mean(matching_texts[2] for matching_texts in input_matching_texts)))
+
+    plagiarism_flags, plagiarism_scores = get_batch_flag_score_predictions(final_model_name, features_lst)
+
+    output_lst = []
+    for (input_doc_name, _), plagiarism_flag, plagiarism_score, plagiarised_text in zip(input_docs, plagiarism_flags, plagiarism_scores, plagiarised_text_lst):
+        output_lst.append({'input_doc_name': input_doc_name,
+                           'plagiarism_flag': plagiarism_flag,
+                           'plagiarism_score': plagiarism_score,
+                           'plagiarised_text': plagiarised_text})
+
+    return output_lst
@@ -2,20 +2,41 @@ import os
 
 os.environ['TRANSFORMERS_CACHE'] = '/tmp/.cache/huggingface/hub'
 
+import codecs
 import difflib
+import hashlib
 import io
+import itertools
+import json
 import re
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from io import BytesIO
 from statistics import mean
 
-import boto3
-import joblib
-import numpy as np
-import pandas as pd
-from pypdf import PdfReader
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from textmatcher import Matcher, Text
+from lazy_imports import LazyModule
+from linear_predictor import LinearPredictor
+import local_storage
+from local_storage import LocalBoto3
+from metrics import count, set_property, set_value, timed, timer
+from result_cache import get_config_hash, get_result_cache, get_result_cache_key
+
+local_storage_dir = os.environ.get('LOCAL_STORAGE_DIR') # if set, S3 objects are read from & written to <dir>/<bucket>/<key> instead (on-prem & local runs)
+
+# heavy dependencies are imported on first use, so that handlers which do not need them (e.g. file upload) start faster
+boto3 = LocalBoto3(local_storage_dir) if local_storage_dir else LazyModule('boto3')
+botocore_exceptions = local_storage if local_storage_dir else LazyModule('botocore.exceptions') # ClientError of failed S3 requests
+joblib = LazyModule('joblib')
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+pypdf = LazyModule('pypdf')
+sklearn_text = LazyModule('sklearn.feature_extraction.text')
+sklearn_pairwise = LazyModule('sklearn.metrics.pairwise')
+textmatcher = LazyModule('textmatcher')
 
 ######## CONFIGURATIONS ########
 
@@ -24,13 +45,42 @@ s3_pdf_filepath = 'plagiarism-detector/data/pdfs'
 s3_webis_data_filepath = 'plagiarism-detector/data/webis_db.csv'
 s3_training_data_filepath = 'plagiarism-detector/data/train.csv'
 s3_output_data_filepath = 'plagiarism-detector/data/output.csv'
+s3_content_index_filepath = 'plagiarism-detector/data/content_index.json'
+s3_artifacts_filepath = 'plagiarism-detector/data/artifacts'
+s3_one_many_state_filepath = 'plagiarism-detector/data/one_many_state'
+s3_online_features_filepath = 'plagiarism-detector/data/online_features' # one JSON object per feature row of a labelled 1-1 comparison, consumed by online_learning.py
 sentbert_model_name = 'plagiarism-detector/models/trained_bert_model.joblib'
 final_model_name = 'plagiarism-detector/models/final_model.joblib'
 ngrams_lst = [1,4,5]
+streaming_window_size = 256 # number of input sentences matched & scored together in streaming mode
+streaming_chunk_size = 65536 # number of bytes/characters read at a time in streaming mode
+baked_models_dir = os.environ.get('BAKED_MODELS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baked_models')) # models baked into the image by bake_models.py
+warm_up_models_on_init = os.environ.get('WARM_UP_MODELS', '0') == '1' # load the models & run a dummy prediction when a handler module is imported
+one_many_workers = int(os.environ.get('ONE_MANY_WORKERS', 1)) # number of worker processes scoring source documents in 1-n matching
+one_many_max_sources = int(os.environ.get('ONE_MANY_MAX_SOURCES', 2)) # number of rows of the documents database 1-n & batch matching check through (the first rows), 0 for all. Defaults to the top 2 rows for testing purposes.
+default_time_budget_ms = float(os.environ['TIME_BUDGET_MS']) if os.environ.get('TIME_BUDGET_MS') else None # time budget of requests without a time_budget_ms field (e.g. below the API Gateway timeout)
+deadline_margin_ms = float(os.environ.get('DEADLINE_MARGIN_MS', 3000)) # part of the time budget kept back for the final prediction & writing the outputs
+
+# Cost-ordered cascade in one_one_matching_texts: pairs must pass the cheap unigram containment / fingerprint gate to reach the Matcher,
+# and must have a direct match or enough unigram containment to reach BERT. Pruned pairs get conservative (zero) feature values.
+cascade_gates = {
+    'enabled': os.environ.get('CASCADE_GATES', '0') == '1',
+    'matcher_min_c1': 0.2, # minimum unigram containment to run the Matcher ...
+    'matcher_min_fingerprint': 0.02, # ... or minimum fingerprint overlap
+    'bert_min_c1': 0.3, # minimum unigram containment to run BERT if the Matcher found no direct match
+    'fingerprint_k': 5, # number of words per fingerprinted shingle
+    'fingerprint_mod': 4, # keep shingles whose hash is divisible by this (0 mod p fingerprinting)
+    'fingerprint_hash': 'crc32', # hash of the fingerprinted shingles, part of the result cache & 1-n state keys
+}
+
+sentence_split_pattern = re.compile(r' *[\.\?!][\'"\)\]]* *')
+ngram_token_pattern = re.compile(r'(?u)\b\w\w+\b') # CountVectorizer's default token pattern
+trailing_word_pattern = re.compile(r'(?u)\w*$')
 
 
 ######## PREPROCESSING FUNCTIONS ########
 
+@timed('csv_read')
 def read_s3_df(s3_bucket, s3_filepath):
     """
     Returns DataFrame of CSV file downloaded from S3 bucket.
@@ -48,9 +98,45 @@ def read_s3_df(s3_bucket, s3_filepath):
     
     return df
 
+def read_source_database(s3_bucket, s3_filepath):
+    """
+    Returns the database of documents that 1-n matching checks through: the first one_many_max_sources rows of the documents CSV, or all of them if it is 0.
+
+    Args:
+        s3_bucket (str): Name of S3 bucket.
+        s3_filepath (str): Filepath of the documents CSV file in S3.
+
+    Returns:
+        webis_df (pd.DataFrame): Documents database, with file_num & text columns.
+    """
+    webis_df = read_s3_df(s3_bucket, s3_filepath)
+
+    return webis_df.head(one_many_max_sources) if one_many_max_sources > 0 else webis_df
+
+@timed('pdf_parse')
+def extract_pdf_text(pdf_content):
+    """
+    Returns string of parsed text from the raw bytes of a PDF file.
+
+    Args:
+        pdf_content (bytes): Raw bytes of PDF file.
+
+    Returns:
+        text (str): String of parsed text from PDF file.
+    """
+    reader = pypdf.PdfReader(BytesIO(pdf_content))
+    text = ""
+
+    for page in reader.pages:
+        text += page.extract_text().replace('\n', ' ')
+
+    return text
+
+@timed('document_read')
 def read_s3_pdf(s3_bucket, filename):
     """
     Returns string of parsed text from a PDF file in S3 bucket.
+    Documents registered in the content index (including deduplicated aliases) are read from their cached text artifact instead of being parsed again.
 
     Args:
         s3_bucket (str): Name of S3 bucket.
@@ -59,20 +145,79 @@ def read_s3_pdf(s3_bucket, filename):
     Returns:
         text (str): String of parsed text from PDF file.
     """
+    content_index = read_content_index(s3_bucket, s3_content_index_filepath)
+    document = content_index['documents'].get(resolve_doc_name(filename, content_index))
+    if document is not None:
+        return read_s3_text(s3_bucket, get_artifact_filepath(document['text_hash'], 'text.txt'))
+
     s3_client = boto3.client('s3')
     filepath = os.path.join(s3_pdf_filepath, filename)
     s3_obj= s3_client.get_object(Bucket=s3_bucket, Key=filepath)
-    reader = PdfReader(BytesIO(s3_obj['Body'].read()))
-    text = ""
 
-    for page in reader.pages:
-        text += page.extract_text().replace('\n', ' ')
+    return extract_pdf_text(s3_obj['Body'].read())
 
-    return text
+def read_s3_text(s3_bucket, s3_filepath):
+    """
+    Returns the UTF-8 decoded content of a file in S3 bucket.
+
+    Args:
+        s3_bucket (str): Name of S3 bucket.
+        s3_filepath (str): Filepath of file in S3.
+
+    Returns:
+        text (str): Content of file.
+    """
+    s3_client = boto3.client('s3')
+    obj = s3_client.get_object(Bucket=s3_bucket, Key=s3_filepath)
+
+    return obj['Body'].read().decode('utf-8')
+
+def is_missing_s3_object(error):
+    """
+    Returns whether a ClientError of an S3 request is for an object that does not exist (NoSuchKey from get_object, 404 from head_object).
+    """
+    return error.response.get('Error', {}).get('Code') in ['NoSuchKey', '404', 'NotFound']
+
+def read_s3_json(s3_bucket, s3_filepath, default=None):
+    """
+    Returns the parsed content of a JSON file in S3 bucket, or `default` if the file does not exist.
+
+    Args:
+        s3_bucket (str): Name of S3 bucket.
+        s3_filepath (str): Filepath of JSON file in S3.
+        default (any): Value returned if the file does not exist.
+
+    Returns:
+        data (any): Parsed JSON content.
+    """
+    s3_client = boto3.client('s3')
+    try:
+        obj = s3_client.get_object(Bucket=s3_bucket, Key=s3_filepath)
+    except botocore_exceptions.ClientError as e:
+        if not is_missing_s3_object(e):
+            raise
+        return default
+
+    return json.loads(obj['Body'].read())
+
+def write_s3_json(data, s3_bucket, s3_filepath):
+    """
+    Uploads data as a JSON file to S3 bucket.
+
+    Args:
+        data (any): JSON serialisable data.
+        s3_bucket (str): Name of S3 bucket.
+        s3_filepath (str): Filepath of JSON file in S3.
+    """
+    s3_client = boto3.client('s3')
+    s3_client.put_object(Bucket=s3_bucket, Key=s3_filepath, Body=json.dumps(data, default=str).encode('utf-8'), ContentType='application/json')
+
+    return None
 
 
 ######## DIRECT MATCHING FUNCTIONS ########
 
+@timed('sentence_splitting')
 def get_preprocessed_sent(input_doc):
     """
     Returns input document, split by sentences
@@ -98,7 +243,8 @@ def get_preprocessed_sent(input_doc):
     
     return res
 
-def get_matching_texts(input_text_lst, source_doc, source_doc_name):
+@timed('matcher')
+def get_matching_texts(input_text_lst, source_doc, source_doc_name, input_sent_texts=None):
     """
     Returns list of dictionary of matching texts 
         (input_doc_text, input_doc_start, input_doc_end, source_doc_text, 
@@ -107,8 +253,9 @@ def get_matching_texts(input_text_lst, source_doc, source_doc_name):
     
     Args:
         input_text_lst (list): Input document of interest, split by sentences.
-        source_doc (string): Source input document.
+        source_doc (string or Text): Source input document. A prebuilt Text object can be passed to avoid re-tokenising the source document.
         source_doc_name (str): Name of source document.
+        input_sent_texts (list[Text]): Optional prebuilt Text objects of input_text_lst (see get_sentence_texts), reused when matching one input document against many sources.
 
     Returns:
         output_lst (list): List of dictionary of matching texts and their details.
@@ -116,15 +263,19 @@ def get_matching_texts(input_text_lst, source_doc, source_doc_name):
     """
     output_lst = []
     match_lst = []
-    source_doc = Text(source_doc)
+    if not isinstance(source_doc, textmatcher.Text):
+        with timer('text_construction'):
+            source_doc = textmatcher.Text(source_doc)
+    if input_sent_texts is None:
+        input_sent_texts = [None] * len(input_text_lst)
 
-    for input_sent_dict in input_text_lst:
+    for input_sent_dict, input_sent_text in zip(input_text_lst, input_sent_texts):
         input_sent = input_sent_dict['sentence']
         if len(input_sent.split()) <= 3:
             continue
         try:
-            input_sent = Text(input_sent)
-            match = Matcher(input_sent, source_doc).match()
+            input_sent = input_sent_text if input_sent_text is not None else textmatcher.Text(input_sent)
+            match = textmatcher.Matcher(input_sent, source_doc).match()
             if len(match) != 0:
                 match_lst.append(input_sent_dict)
                 output_dict = input_sent_dict.copy()
@@ -139,6 +290,30 @@ def get_matching_texts(input_text_lst, source_doc, source_doc_name):
     return output_lst, match_lst
         
 
+@timed('text_construction')
+def get_sentence_texts(input_text_lst):
+    """
+    Returns prebuilt Text objects for the sentences of an input document that are long enough to be matched.
+
+    Args:
+        input_text_lst (list): Input document, split by sentences.
+
+    Returns:
+        input_sent_texts (list[Text]): Text object of each sentence, or None for sentences that are skipped or cannot be tokenised.
+    """
+    input_sent_texts = []
+
+    for input_sent_dict in input_text_lst:
+        input_sent_text = None
+        if len(input_sent_dict['sentence'].split()) > 3:
+            try:
+                input_sent_text = textmatcher.Text(input_sent_dict['sentence'])
+            except:
+                pass
+        input_sent_texts.append(input_sent_text)
+
+    return input_sent_texts
+
 def get_non_direct_texts(input_text_lst, match_lst):
     """
     Returns a list of dictionaries of input document's non-direct matching indices & texts.
@@ -208,22 +383,58 @@ def get_avg_score(input_text_lst, output_lst):
 
 ######## PARAPHRASED MATCHING FUNCTIONS ########
 
-def load_s3_model(s3_bucket, s3_filepath):
+# models loaded in this process, by S3 filepath (or cache name): {'version': model version in S3, 'model': model}
+loaded_models = {}
+# functions wrapping models when they are loaded, by S3 filepath (e.g. the encode micro-batcher of the HTTP server)
+model_wrappers = {}
+model_load_lock = threading.Lock()
+
+@timed('model_load')
+def load_s3_model(s3_bucket, s3_filepath, loader=None, cache_name=None):
     """
     Load trained model from S3.
+    The model version in S3 is checked on every call: the model is reused if already loaded with that version, read from
+    the models baked into the image if they have that version, and downloaded from S3 otherwise (e.g. after retraining).
+    If S3 cannot be reached for the version, the loaded or baked model is used.
 
     Args:
         s3_bucket (str): Name of S3 bucket.
         s3_filepath (str): Filepath of trained model in S3.
+        loader (callable): Function reading the model from a binary file object, joblib.load by default.
+        cache_name (str): Name the result of loader is cached under, for loaders other than the model's own (e.g. get_file_sha256). Defaults to s3_filepath.
 
     Returns:
-        model (SentenceTransformers or LogisticRegression): Trained model.
+        model (SentenceTransformers, LogisticRegression or LinearPredictor): Trained model.
     """
-    s3_client = boto3.client('s3')
-    obj = s3_client.get_object(Bucket=s3_bucket, Key= s3_filepath)
-    model = joblib.load(io.BytesIO(obj['Body'].read()))
+    if loader is None:
+        loader = joblib.load
+    cache_name = cache_name or s3_filepath
+
+    try:
+        version = get_s3_model_version(s3_bucket, s3_filepath)
+    except Exception:
+        version = None
+
+    with model_load_lock:
+        loaded = loaded_models.get(cache_name)
+        if loaded is not None and (version is None or loaded['version'] == version):
+            return loaded['model']
+
+        baked_model_filepath = get_baked_model_filepath(s3_filepath, version)
+        if baked_model_filepath is not None:
+            with open(baked_model_filepath, 'rb') as f:
+                model = loader(f)
+        else:
+            s3_client = boto3.client('s3')
+            obj = s3_client.get_object(Bucket=s3_bucket, Key= s3_filepath)
+            model = loader(io.BytesIO(obj['Body'].read()))
+        if cache_name in model_wrappers:
+            model = model_wrappers[cache_name](model)
+        loaded_models[cache_name] = {'version': version, 'model': model}
+
     return model
 
+@timed('paraphrase')
 def get_paraphrase_predictions(model, nonmatch_lst, source_doc, source_doc_name, threshold):
     """
     Returns a list of json containing paraphrased sentences' details, predicted from trained Sentence Transformer model.
@@ -250,38 +461,73 @@ def get_paraphrase_predictions(model, nonmatch_lst, source_doc, source_doc_name,
     """
     res_list = []
     try:
-        source_sent = re.split(r' *[\.\?!][\'"\)\]]* *', source_doc)
-        source_sent = [text for text in source_sent if text]
+        source_sent = get_source_sentences(source_doc)
+        with timer('bert_encoding'):
+            source_embeddings = model.encode(source_sent)
+        count('encoded_sentences', len(source_sent))
+        res_list = get_embedding_paraphrase_predictions(model, nonmatch_lst, source_sent, source_embeddings, source_doc_name, threshold)
+    except:
+        pass
+                
+    return res_list
 
-        for input_sent_dict in nonmatch_lst:
-            input_sent = input_sent_dict['sentence']
-            if len(input_sent.split()) <= 3:
-                continue
+def get_source_sentences(source_doc):
+    """
+    Returns source document, split by sentences.
 
-            source_embeddings = model.encode(source_sent)
-            input_embeddings = model.encode(input_sent)
+    Args:
+        source_doc (str): Source document.
 
-            res = cosine_similarity(
-                    [input_embeddings],
-                    source_embeddings
-                )
+    Returns:
+        source_sent (list[str]): Non-empty sentences of source document.
+    """
+    source_sent = sentence_split_pattern.split(source_doc)
 
-            score = float(max(res[0]))
+    return [text for text in source_sent if text]
+
+@timed('paraphrase')
+def get_embedding_paraphrase_predictions(model, nonmatch_lst, source_sent, source_embeddings, source_doc_name, threshold):
+    """
+    Returns a list of json containing paraphrased sentences' details, given precomputed source sentence embeddings.
+    Candidate input sentences are encoded in a single batch.
+
+    Args:
+        model (SentenceTransformer): Sentence Transformer model.
+        nonmatch_lst (list[dict]): List of sentences not detected as direct matches.
+        source_sent (list[str]): Source document, split by sentences.
+        source_embeddings (arr): Embeddings of source_sent.
+        source_doc_name (str): Name of source document.
+        threshold (float): Threshold of similarity score to flag sentence as paraphrased.
+
+    Returns:
+        res_list (list[dict]): List of json containing paraphrased sentence details.
+    """
+    res_list = []
+    candidate_lst = [input_sent_dict for input_sent_dict in nonmatch_lst if len(input_sent_dict['sentence'].split()) > 3]
+    if len(candidate_lst) == 0 or len(source_sent) == 0:
+        return res_list
+
+    with timer('bert_encoding'):
+        input_embeddings = model.encode([input_sent_dict['sentence'] for input_sent_dict in candidate_lst])
+    count('encoded_sentences', len(candidate_lst))
+    res = sklearn_pairwise.cosine_similarity(input_embeddings, source_embeddings)
+
+    for input_sent_dict, sent_res in zip(candidate_lst, res):
+        score = float(max(sent_res))
+
+        if score > threshold:
+            temp = input_sent_dict
+            temp['source_sentence'] = source_sent[sent_res.argmax()]
+            temp['source_doc_name'] = source_doc_name
+            temp['score'] = score
+            res_list.append(temp)
 
-            if score > threshold:
-                temp = input_sent_dict
-                temp['source_sentence'] = source_sent[res[0].argmax()]
-                temp['source_doc_name'] = source_doc_name
-                temp['score'] = score
-                res_list.append(temp)
-    except:
-        pass
-                
     return res_list
 
 
 ######## FEATURE GENERATION FUNCTIONS ########
 
+@timed('count_vectors')
 def get_vocab_counts(input_doc, source_doc, n):
     """
     Using CountVectorizer, create vocab based on both texts.
@@ -297,13 +543,14 @@ def get_vocab_counts(input_doc, source_doc, n):
         counts.toarray() (arr) : Array of integers where each row represents the token counts for a document.
     """
 
-    counts_ngram = CountVectorizer(analyzer='word', ngram_range=(n, n))
+    counts_ngram = sklearn_text.CountVectorizer(analyzer='word', ngram_range=(n, n))
     vocab = counts_ngram.fit([input_doc, source_doc]).vocabulary_
     counts = counts_ngram.fit_transform([input_doc, source_doc])
     
     return vocab, counts.toarray()
 
 # calculate ngram containment for each text/original file
+@timed('containment')
 def calc_containment(input_doc, source_doc, n):
     """
     Calculates the containment between a given text and its original text.
@@ -326,7 +573,8 @@ def calc_containment(input_doc, source_doc, n):
     
     return intersection / count_ngram
 
-def get_containment_scores(input_doc, source_doc, ngrams_lst):
+@timed('containment')
+def get_containment_scores(input_doc, source_doc, ngrams_lst, known_scores=None):
     """
     Generates containment scores for all n-values in ngrams_lst for each input_doc.
 
@@ -334,13 +582,18 @@ def get_containment_scores(input_doc, source_doc, ngrams_lst):
         input_doc (str): Input document.
         source_doc (str): Source document.
         ngrams_lst (list[int]): List of n integers of n-gram containment values to generate.
+        known_scores (dict): Containment scores already computed (e.g. c_1 by the cascade), which are reused instead of recomputed.
 
     Returns:
         containment_scores (dict): Key represents current n-gram, values are containment score for that input_doc.
     """
     containment_scores = {}
+    known_scores = known_scores or {}
     
     for ngram in ngrams_lst:
+        if f"c_{ngram}" in known_scores:
+            containment_scores[f"c_{ngram}"] = known_scores[f"c_{ngram}"]
+            continue
         containment = calc_containment(input_doc, source_doc, ngram)
         key_name = f"c_{ngram}"
         containment_scores[key_name] = containment
@@ -367,6 +620,7 @@ def get_n_avg_containment_scores(containment_scores_lst, ngrams_lst):
     return avg_containment_scores
 
 
+@timed('lcs')
 def get_lcm_score(input_doc, source_doc):
     """
     Calculates the ratio of the longest common subsequence 
@@ -388,11 +642,166 @@ def get_lcm_score(input_doc, source_doc):
     return lcs_ratio
 
 
+@timed('fingerprint')
+def get_fingerprint_overlap(input_doc, source_doc, k=5, mod=4):
+    """
+    Returns the fraction of the input document's fingerprints that also occur in the source document.
+    Fingerprints are the hashes of word k-grams whose hash is divisible by mod, so only about 1/mod of the k-grams are compared.
+    k-grams are hashed with CRC-32 rather than the built-in hash, which is salted per process (PYTHONHASHSEED), so that
+    every process keeps the same fingerprints.
+
+    Args:
+        input_doc (str): Input document.
+        source_doc (str): Source document.
+        k (int): Number of words per k-gram.
+        mod (int): Keep k-grams whose hash is divisible by mod.
+
+    Returns:
+        overlap (float): Fingerprint overlap between 0 and 1 (0 if the input document has no fingerprints).
+    """
+    def fingerprints(doc):
+        tokens = ngram_token_pattern.findall(str(doc).lower())
+        hashes = (zlib.crc32(' '.join(kgram).encode('utf-8')) for kgram in zip(*[tokens[i:] for i in range(k)]))
+        return set(h for h in hashes if h % mod == 0)
+
+    input_fingerprints = fingerprints(input_doc)
+    if len(input_fingerprints) == 0:
+        return 0
+
+    return len(input_fingerprints & fingerprints(source_doc)) / len(input_fingerprints)
+
+
+######## CASCADE STATISTICS FUNCTIONS ########
+
+# per-stage pair counts, pass counts & time spent, accumulated across calls of one_one_matching_texts
+cascade_stats = {}
+
+def record_cascade_stage(stage, seconds, passed=True):
+    """
+    Records one pair going through a cascade stage.
+
+    Args:
+        stage (str): Name of stage.
+        seconds (float): Time spent in the stage.
+        passed (bool): Whether the pair passed the gate after the stage.
+    """
+    stats = cascade_stats.setdefault(stage, {'pairs': 0, 'passed': 0, 'seconds': 0.0})
+    stats['pairs'] += 1
+    stats['passed'] += int(passed)
+    stats['seconds'] += seconds
+
+    return None
+
+def get_cascade_report():
+    """
+    Returns the pass rate and time spent per cascade stage, and the estimated time saved by pruning.
+    Time saved is estimated from the average time of each skipped stage over the pairs that did run it.
+
+    Returns:
+        report (dict): Per-stage statistics and total estimated time saved in seconds.
+    """
+    def avg_seconds(stage):
+        stats = cascade_stats.get(stage, {})
+        return stats['seconds'] / stats['pairs'] if stats.get('pairs') else 0
+
+    report = {'stages': {}}
+    for stage, stats in cascade_stats.items():
+        report['stages'][stage] = dict(stats, pass_rate=stats['passed'] / stats['pairs'] if stats['pairs'] else None)
+
+    prefilter_pruned = cascade_stats.get('prefilter', {}).get('pairs', 0) - cascade_stats.get('prefilter', {}).get('passed', 0)
+    matcher_pruned = cascade_stats.get('matcher', {}).get('pairs', 0) - cascade_stats.get('matcher', {}).get('passed', 0)
+    report['estimated_seconds_saved'] = (prefilter_pruned * (avg_seconds('matcher') + avg_seconds('bert') + avg_seconds('features'))
+                                         + matcher_pruned * avg_seconds('bert'))
+
+    return report
+
+def reset_cascade_stats():
+    cascade_stats.clear()
+
+    return None
+
+
+######## DEADLINE FUNCTIONS ########
+
+class Deadline:
+    """
+    Time budget of a request. Expensive stages (BERT, then the Matcher) and remaining source documents are skipped once it
+    has run out, and what was skipped is recorded so that the results computed so far can be returned flagged as partial.
+    The clock is injectable, so that degradation can be reproduced deterministically with a simulated clock.
+    """
+
+    def __init__(self, budget_ms, clock=time.monotonic):
+        self.clock = clock
+        self.expires_at = clock() + budget_ms / 1000
+        self.skipped_stages = {} # stage -> names of the source documents it was skipped for
+        self.sources_total = None
+        self.sources_scored = None
+
+    def remaining_ms(self):
+        return (self.expires_at - self.clock()) * 1000
+
+    def expired(self):
+        return self.remaining_ms() <= 0
+
+    def skip(self, stage, source_doc_name):
+        self.skipped_stages.setdefault(stage, []).append(source_doc_name)
+
+    def is_partial(self):
+        return len(self.skipped_stages) > 0 or (self.sources_total is not None and self.sources_scored < self.sources_total)
+
+    def get_coverage(self):
+        """
+        Returns which stages & source documents the results cover, as added to partial responses.
+        """
+        coverage = {'skipped_stages': {stage: list(source_doc_names) for stage, source_doc_names in self.skipped_stages.items()}}
+        if self.sources_total is not None:
+            coverage['sources_scored'] = self.sources_scored
+            coverage['sources_total'] = self.sources_total
+
+        return coverage
+
+def get_request_deadline(context=None, time_budget_ms=None, margin_ms=deadline_margin_ms, clock=time.monotonic):
+    """
+    Returns the deadline of a request: the smaller of the Lambda invocation's remaining time and the request's time budget,
+    less a margin for the final prediction & writing the outputs.
+
+    Args:
+        context (LambdaContext): Lambda context object, None outside of Lambda.
+        time_budget_ms (float): Time budget of the request in milliseconds. Defaults to default_time_budget_ms.
+        margin_ms (float): Time kept back from the budget in milliseconds.
+        clock (callable): Clock returning seconds.
+
+    Returns:
+        deadline (Deadline): Deadline of the request, or None if it has no time limit.
+    """
+    if time_budget_ms is None:
+        time_budget_ms = default_time_budget_ms
+    budgets_ms = [float(time_budget_ms)] if time_budget_ms is not None else []
+    if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+        budgets_ms.append(context.get_remaining_time_in_millis())
+
+    if len(budgets_ms) == 0:
+        return None
+
+    return Deadline(min(budgets_ms) - margin_ms, clock)
+
+def add_coverage(output_dict, deadline):
+    """
+    Flags a response as partial, with the stages & source documents it covers, if the deadline caused any work to be skipped.
+    """
+    if deadline is not None and deadline.is_partial():
+        output_dict['partial'] = True
+        output_dict['coverage'] = deadline.get_coverage()
+        set_property('partial', True)
+
+    return output_dict
+
+
 ######## FINAL MODEL LOADING & PREDICTION FUNCTIONS ########
 
 def get_feature_dict(containment_scores, lcm_score, direct_avg_score, paraphrase_avg_score):
     """
-    Get a DataFrame of all features to be parsed to the trained model.
+    Get a dictionary of all features to be parsed to the trained model.
 
     Args:
         containment_scores (dict): A dictionary containing N n-grams containment score.
@@ -401,40 +810,111 @@ def get_feature_dict(containment_scores, lcm_score, direct_avg_score, paraphrase
         paraphrase_avg_score (float): Average similarity score of detected paraphrased texts across the input document.
 
     Returns:
-        feature_df (pd.DataFrame): Dataframe of all features to be parsed to the trained model (containment scores, LCM score, average cosine similarity scores from direct matching & paraphrased texts).
+        features (dict): All features to be parsed to the trained model (containment scores, LCM score, average cosine similarity scores from direct matching & paraphrased texts), by feature name.
     """
-    containment_scores['lcs_word'] = lcm_score
-    containment_scores['para_detect_score'] = direct_avg_score
-    containment_scores['direct_detect_score'] = paraphrase_avg_score
-    feature_df = pd.DataFrame(containment_scores, index=[0])
-    
-    return feature_df
+    features = dict(containment_scores)
+    features['lcs_word'] = lcm_score
+    features['para_detect_score'] = direct_avg_score
+    features['direct_detect_score'] = paraphrase_avg_score
+
+    return features
+
+def get_coefficients_filepath(final_model_name):
+    """
+    Returns the filepath of the coefficient file exported next to a final model, e.g. final_model_coefficients.json for final_model.joblib.
+    """
+    return os.path.splitext(final_model_name)[0] + '_coefficients.json'
+
+def get_file_sha256(f):
+    """
+    Returns the SHA-256 hex digest of a binary file object, e.g. to identify a model file without unpickling it.
+    """
+    return hashlib.sha256(f.read()).hexdigest()
+
+def get_final_model_coefficients(s3_bucket, final_model_name):
+    """
+    Returns the final model's coefficient file as a LinearPredictor if it was exported from the final model in S3, i.e.
+    its model_sha256 is the SHA-256 of the final model file, else None. A coefficient file exported from another model
+    (e.g. when only final_model.joblib was uploaded after a retrain) is logged as the stale_coefficients field of the
+    request's metrics.
+
+    Args:
+        s3_bucket (str): Name of S3 bucket.
+        final_model_name (str): Filepath of trained final model.
+
+    Returns:
+        predictor (LinearPredictor): Final model, or None if there is no up-to-date coefficient file.
+    """
+    coefficients_filepath = get_coefficients_filepath(final_model_name)
+    try:
+        predictor = load_s3_model(s3_bucket, coefficients_filepath, LinearPredictor.load)
+    except botocore_exceptions.ClientError as e:
+        if not is_missing_s3_object(e):
+            raise
+        return None
+
+    model_hash = load_s3_model(s3_bucket, final_model_name, get_file_sha256, cache_name=f'{final_model_name}#sha256')
+    if predictor.metadata.get('model_sha256') != model_hash:
+        set_property('stale_coefficients', coefficients_filepath)
+        return None
+
+    return predictor
+
+def load_final_predictor(s3_bucket, final_model_name):
+    """
+    Returns the final model as a LinearPredictor, which scores features with NumPy only: from the coefficient file next
+    to the final model if it was exported from that model (see get_final_model_coefficients), and converted from the
+    pickled final model otherwise.
+
+    Args:
+        s3_bucket (str): Name of S3 bucket.
+        final_model_name (str): Filepath of trained final model.
+
+    Returns:
+        predictor (LinearPredictor): Final model.
+    """
+    predictor = get_final_model_coefficients(s3_bucket, final_model_name)
+    if predictor is None:
+        predictor = LinearPredictor.from_model(load_s3_model(s3_bucket, final_model_name))
+
+    return predictor
+
+def get_final_model_version(s3_bucket, final_model_name):
+    """
+    Returns the version of the file the final model is scored from (see load_final_predictor): its coefficient file or
+    the pickled model, so that result cache keys change with either.
+    """
+    if get_final_model_coefficients(s3_bucket, final_model_name) is not None:
+        return 'coefficients:' + get_s3_model_version(s3_bucket, get_coefficients_filepath(final_model_name))
 
-def get_flag_score_prediction(final_model_name, feature_df):
+    return get_s3_model_version(s3_bucket, final_model_name)
+
+@timed('final_prediction')
+def get_flag_score_prediction(final_model_name, features):
     """
     Returns the flag and probability predictions from the trained final model. 
 
     Args:
         final_model_name (final): Trained final model.
-        feature_df (pd.DataFrame): Dataframe of all features to be parsed to the trained final model.
+        features (dict): All features to be parsed to the trained final model, as returned by get_feature_dict.
 
     Returns:
         plagiarism_flag (boolean): 1 means the document is plagiarised, vice-versa.
         plagiarism_scoreability (float): Probability of the document being flagged as plagiarised.
     """
-    final_model = load_s3_model(s3_bucket, final_model_name)
+    plagiarism_flags, plagiarism_scores = load_final_predictor(s3_bucket, final_model_name).predict(features)
 
-    plagiarism_flag = final_model.predict(feature_df)[0]
-    plagiarism_score = final_model.predict_proba(feature_df)[:,1][0]
-    
-    return plagiarism_flag, plagiarism_score
+    return plagiarism_flags[0], plagiarism_scores[0]
 
 
 ######## GENERIC MATCHING OUTPUT GENERATION FUNCTIONS ########
 
-def one_one_matching_texts(sentbert_model_name, ngrams_lst, source_doc, source_doc_name, input_doc):
+def one_one_matching_texts(sentbert_model_name, ngrams_lst, source_doc, source_doc_name, input_doc, sentence_trans_model=None, gates=None, deadline=None):
     """
     One-to-one matching function - given 2 documents, compare and return the plagiarised flag, score and plagiarised texts.
+    Stages run cheapest first. With cascade gates enabled, pairs with low unigram containment and fingerprint overlap skip the
+    Matcher, BERT and the remaining features (which are set to 0), and pairs with no direct match and low unigram containment skip BERT.
+    Once the deadline has run out, BERT (and the Matcher, if it has not started yet) is skipped and recorded on the deadline.
 
     Args:
         sentbert_model_name (str): Filepath of trained Sentence Transformer model.
@@ -442,6 +922,9 @@ def one_one_matching_texts(sentbert_model_name, ngrams_lst, source_doc, source_d
         source_doc (str): Source document.
         source_doc_name (str): Name of source document.
         input_doc (str): Input document.
+        sentence_trans_model (SentenceTransformer): Already loaded Sentence Transformer model. Loaded from sentbert_model_name if not given.
+        gates (dict): Cascade gate configuration, see cascade_gates (default).
+        deadline (Deadline): Time budget of the request. No stage is skipped if not given.
 
     Returns:
         plagiarised_text (list): Concatenation of direct matching and paraphrasing texts, sorted by starting character index. 
@@ -450,12 +933,44 @@ def one_one_matching_texts(sentbert_model_name, ngrams_lst, source_doc, source_d
         containment_scores (dict): Containment scores for each ngram between the source and input document.
         lcm_score (flat): Longest common subsequence score between the source and input document.
     """
+    if gates is None:
+        gates = cascade_gates
+
+    start = time.perf_counter()
+    unigram_containment = calc_containment(input_doc, source_doc, 1)
+    passed = True
+    if gates['enabled']:
+        fingerprint_overlap = get_fingerprint_overlap(input_doc, source_doc, gates['fingerprint_k'], gates['fingerprint_mod'])
+        passed = unigram_containment >= gates['matcher_min_c1'] or fingerprint_overlap >= gates['matcher_min_fingerprint']
+    record_cascade_stage('prefilter', time.perf_counter() - start, passed)
+
+    if not passed:
+        containment_scores = {f"c_{ngram}": unigram_containment if ngram == 1 else 0 for ngram in ngrams_lst}
+        return [], 0, 0, containment_scores, 0
+
+    start = time.perf_counter()
     input_text_lst = get_preprocessed_sent(input_doc)
-    direct_output, match_lst = get_matching_texts(input_text_lst, source_doc, source_doc_name)
-    
-    nonmatch_lst = get_non_direct_texts(input_text_lst, match_lst)
-    sentence_trans_model = load_s3_model(s3_bucket, sentbert_model_name)
-    paraphrase_output = get_paraphrase_predictions(sentence_trans_model, nonmatch_lst, source_doc, source_doc_name, 0.7)
+    set_value('input_sentences', len(input_text_lst))
+    count('pairs_matched')
+    if deadline is not None and deadline.expired():
+        deadline.skip('matcher', source_doc_name)
+        direct_output, nonmatch_lst = [], []
+        passed = True # BERT is skipped below, as the deadline has run out
+    else:
+        direct_output, match_lst = get_matching_texts(input_text_lst, source_doc, source_doc_name)
+        nonmatch_lst = get_non_direct_texts(input_text_lst, match_lst)
+        passed = not gates['enabled'] or len(direct_output) > 0 or unigram_containment >= gates['bert_min_c1']
+        record_cascade_stage('matcher', time.perf_counter() - start, passed)
+
+    paraphrase_output = []
+    if passed and deadline is not None and deadline.expired():
+        deadline.skip('bert', source_doc_name)
+    elif passed:
+        start = time.perf_counter()
+        if sentence_trans_model is None:
+            sentence_trans_model = load_s3_model(s3_bucket, sentbert_model_name)
+        paraphrase_output = get_paraphrase_predictions(sentence_trans_model, nonmatch_lst, source_doc, source_doc_name, 0.7)
+        record_cascade_stage('bert', time.perf_counter() - start)
 
     plagiarised_text = direct_output + paraphrase_output
     plagiarised_text = sorted(plagiarised_text, key=lambda d: d['start_char_index'])
@@ -465,8 +980,10 @@ def one_one_matching_texts(sentbert_model_name, ngrams_lst, source_doc, source_d
     direct_avg_score = get_avg_score(input_text_lst, new_direct_output)
     paraphrase_avg_score = get_avg_score(input_text_lst, new_paraphrase_output)
     
-    containment_scores = get_containment_scores(input_doc, source_doc, ngrams_lst)
+    start = time.perf_counter()
+    containment_scores = get_containment_scores(input_doc, source_doc, ngrams_lst, {'c_1': unigram_containment})
     lcm_score = get_lcm_score(input_doc, source_doc)
+    record_cascade_stage('features', time.perf_counter() - start)
 
     return plagiarised_text, direct_avg_score, paraphrase_avg_score, containment_scores, lcm_score
 
@@ -488,8 +1005,26 @@ def one_one_matching_flag_score(sentbert_model_name, final_model_name, ngrams_ls
     """
     plagiarised_text, direct_avg_score, paraphrase_avg_score, containment_scores, lcm_score = one_one_matching_texts(sentbert_model_name, ngrams_lst, source_doc, source_doc_name, input_doc)
 
-    feature_df = get_feature_dict(containment_scores, lcm_score, direct_avg_score, paraphrase_avg_score)    
-    plagiarism_flag, plagiarism_score = get_flag_score_prediction(final_model_name, feature_df)
+    return matching_texts_flag_score(final_model_name, input_doc_name, plagiarised_text, direct_avg_score, paraphrase_avg_score, containment_scores, lcm_score)
+
+def matching_texts_flag_score(final_model_name, input_doc_name, plagiarised_text, direct_avg_score, paraphrase_avg_score, containment_scores, lcm_score):
+    """
+    Generates the plagiarism flag and score for a input and source document pair, given their matching texts and features.
+
+    Args:
+        final_model_name (str): Filepath of trained final model.
+        input_doc_name (str): Name of input document.
+        plagiarised_text (list): Concatenation of direct matching and paraphrasing texts, sorted by starting character index.
+        direct_avg_score (float): Average direct matching cosine similarity score over number of sentences in input document.
+        paraphrase_avg_score (float): Average paraphrase cosine similarity score over number of sentences in input document.
+        containment_scores (dict): Containment scores for each ngram between the source and input document.
+        lcm_score (float): Longest common subsequence score between the source and input document.
+
+    Returns:
+        output_dict (dict): Dictionary containing comparison results (name of input document, plagiarised flag, score and texts).
+    """
+    features = get_feature_dict(containment_scores, lcm_score, direct_avg_score, paraphrase_avg_score)
+    plagiarism_flag, plagiarism_score = get_flag_score_prediction(final_model_name, features)
 
     #if no plagiarised text, set flag=0
     if len(plagiarised_text) == 0:
@@ -503,81 +1038,965 @@ def one_one_matching_flag_score(sentbert_model_name, final_model_name, ngrams_ls
     return output_dict
 
 
-######## 1-1 MATCHING FINAL OUTPUT GENERATION FUNCTIONS ########
+######## STREAMING MATCHING FUNCTIONS ########
 
-def get_one_one_matching_output(sentbert_model_name, final_model_name, ngrams_lst, source_doc_name, input_doc_name):
+def iter_text_chunks(text, chunk_size=streaming_chunk_size):
     """
-    One-to-one matching function - given 2 documents, compare and return the plagiarised flag, score and plagiarised texts.
+    Yields an in-memory document in fixed-size chunks.
+
     Args:
-        sentbert_model_name (str): Filepath of trained Sentence Transformer model.
-        final_model_name (str): Filepath of trained final model.
-        ngrams_lst (lst): List of selected n_grams used to generate containment scores.
-        source_doc_name (str): Name of source document in S3.
-        input_doc_name (str): Name of input document in S3.
-    
-    Returns:
-        res (dict): Dictionary containing all comparison results (name of input document, plagiarised flag, score and texts).
-    """
-    input_doc = read_s3_pdf(s3_bucket, input_doc_name)
-    source_doc = read_s3_pdf(s3_bucket, source_doc_name)
+        text (str): Document.
+        chunk_size (int): Number of characters per chunk.
 
-    res = one_one_matching_flag_score(sentbert_model_name, final_model_name, ngrams_lst, source_doc, source_doc_name, input_doc, input_doc_name)
+    Yields:
+        chunk (str): Consecutive slices of the document.
+    """
+    text = str(text)
+    for start in range(0, len(text), chunk_size):
+        yield text[start:start + chunk_size]
 
-    add_input_training_data(source_doc_name, source_doc, input_doc, s3_bucket, s3_training_data_filepath)
+def iter_pdf_text(pdf_content):
+    """
+    Yields the parsed text of a PDF file page by page. The concatenation of all pages equals extract_pdf_text(pdf_content).
 
-    return res
+    Args:
+        pdf_content (bytes): Raw bytes of PDF file.
 
+    Yields:
+        text (str): Parsed text of one page.
+    """
+    reader = pypdf.PdfReader(BytesIO(pdf_content))
 
-######## 1-MANY MATCHING FINAL OUTPUT GENERATION FUNCTIONS ########
+    for page in reader.pages:
+        yield page.extract_text().replace('\n', ' ')
 
-def get_one_many_matching_output(sentbert_model_name, final_model_name, ngrams_lst, input_doc_name):
+def iter_s3_pdf_text(s3_bucket, filename, chunk_size=streaming_chunk_size):
     """
-    One-to-many matching function - given 1 input document, compare with the database of documents in S3 and return the plagiarised flag, score and plagiarised texts.
+    Yields the parsed text of a document in S3 in chunks, without holding the whole text in memory.
+    Documents registered in the content index are streamed from their cached text artifact, other documents are parsed page by page.
+
     Args:
-        sentbert_model_name (str): Filepath of trained Sentence Transformer model.
-        final_model_name (str): Filepath of trained final model.
-        ngrams_lst (lst): List of selected n_grams used to generate containment scores.
-        source_docs (list[dict]): List of dictionaries containing source documents & source document name. E.g. [{'source_doc_name': test1, 'source_doc': teststr}]
-        input_doc_name (str): Name of input document.
-    
-    Returns:
-        output_dict (dict): Dictionary containing all comparison results, averaged across all source_documents (name of input document, plagiarised flag, score and texts).
-    """
-    plagiarised_text_lst = []
-    direct_avg_score_lst = []
-    paraphrase_avg_score_lst = []
-    containment_scores_lst = []
-    lcm_score_lst = []
+        s3_bucket (str): Name of S3 bucket.
+        filename (str): Filename of PDF file in S3.
+        chunk_size (int): Number of bytes read at a time from the cached text artifact.
 
-    input_doc = read_s3_pdf(s3_bucket, input_doc_name)
-    webis_df = read_s3_df(s3_bucket, s3_webis_data_filepath).head(2) # This is the database of documents to check through. We filtered only the top 2 rows for testing purposes.
+    Yields:
+        text (str): Consecutive chunks of the document's text.
+    """
+    s3_client = boto3.client('s3')
+    content_index = read_content_index(s3_bucket, s3_content_index_filepath)
+    document = content_index['documents'].get(resolve_doc_name(filename, content_index))
 
-    for index, row in webis_df.iterrows():
-        if row['file_num'] == input_doc_name:
-            continue
-        plagiarised_text, direct_avg_score, paraphrase_avg_score, containment_scores, lcm_score = one_one_matching_texts(sentbert_model_name, ngrams_lst, row['text'], row['file_num'], input_doc)
-                
-        plagiarised_text_lst = plagiarised_text_lst + plagiarised_text
-        direct_avg_score_lst.append(direct_avg_score)
-        paraphrase_avg_score_lst.append(paraphrase_avg_score)
-        containment_scores_lst.append(containment_scores)
-        lcm_score_lst.append(lcm_score)
+    if document is not None:
+        obj = s3_client.get_object(Bucket=s3_bucket, Key=get_artifact_filepath(document['text_hash'], 'text.txt'))
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        for chunk in obj['Body'].iter_chunks(chunk_size):
+            yield decoder.decode(chunk)
+        yield decoder.decode(b'', final=True)
+        return
+
+    s3_obj = s3_client.get_object(Bucket=s3_bucket, Key=os.path.join(s3_pdf_filepath, filename))
+    yield from iter_pdf_text(s3_obj['Body'].read())
+
+def iter_preprocessed_sent(input_doc_chunks):
+    """
+    Yields input document split by sentences, consuming the document chunk by chunk.
+    Produces the same sentences and character indices as get_preprocessed_sent on the concatenated document.
+
+    Args:
+        input_doc_chunks (str or iterable[str]): Input document, or consecutive chunks of it.
+
+    Yields:
+        sentence_dict (dict): Dictionary with keys sentence, start_char_index & end_char_index.
+    """
+    if isinstance(input_doc_chunks, str):
+        input_doc_chunks = [input_doc_chunks]
+
+    buffer = ''
+    start_char = 1
+
+    for chunk in input_doc_chunks:
+        buffer += str(chunk).replace('\n', '')
+        pos = 0
+        for match in sentence_split_pattern.finditer(buffer):
+            # a delimiter at the end of the buffer may continue into the next chunk
+            if match.end() == len(buffer):
+                break
+            sentence = buffer[pos:match.start()]
+            pos = match.end()
+            if sentence:
+                yield {'sentence': sentence, 'start_char_index': start_char, 'end_char_index': start_char + len(sentence)-1}
+                start_char = start_char + len(sentence)
+        buffer = buffer[pos:]
+
+    for sentence in sentence_split_pattern.split(buffer):
+        if sentence:
+            yield {'sentence': sentence, 'start_char_index': start_char, 'end_char_index': start_char + len(sentence)-1}
+            start_char = start_char + len(sentence)
+
+def iter_windows(iterable, window_size=streaming_window_size):
+    """
+    Yields consecutive fixed-size windows of an iterable.
+
+    Args:
+        iterable (iterable): Items to group.
+        window_size (int): Maximum number of items per window.
+
+    Yields:
+        window (list): Up to window_size consecutive items.
+    """
+    iterator = iter(iterable)
+    while True:
+        window = list(itertools.islice(iterator, window_size))
+        if not window:
+            return
+        yield window
+
+def init_streaming_feature_state(source_doc, ngrams_lst):
+    """
+    Initialises the accumulators of all model features for one source document in streaming mode.
+    The state only depends on the size of the source document, not on the size of the input document.
+
+    Args:
+        source_doc (str): Source document.
+        ngrams_lst (lst): List of selected n_grams used to generate containment scores.
+
+    Returns:
+        feature_state (dict): Accumulators for sentence count, average scores, containment and LCS.
+    """
+    source_tokens = ngram_token_pattern.findall(str(source_doc).lower())
+    containment_state = {}
+
+    for n in ngrams_lst:
+        containment_state[n] = {'source_counts': Counter(zip(*[source_tokens[i:] for i in range(n)])),
+                                'input_counts': Counter(),
+                                'input_total': 0,
+                                'tail': deque(maxlen=n-1)}
+
+    lcs_matcher = difflib.SequenceMatcher(None, '', source_doc)
+
+    return {'sentence_count': 0,
+            'direct_total_score': 0,
+            'paraphrase_total_score': 0,
+            'containment': containment_state,
+            'token_tail': '',
+            'lcs_matcher': lcs_matcher,
+            'lcs_size': 0,
+            'input_length': 0,
+            'source_length': len(source_doc)}
+
+def update_streaming_containment(feature_state, tokens):
+    """
+    Adds the n-grams of the next input tokens to the containment accumulators.
+    Only n-grams that occur in the source document are counted individually, as other n-grams never contribute to the intersection.
+
+    Args:
+        feature_state (dict): Streaming feature accumulators.
+        tokens (list[str]): Next lowercased tokens of the input document.
+    """
+    for n, state in feature_state['containment'].items():
+        tail = state['tail']
+        for token in tokens:
+            if len(tail) == n - 1:
+                ngram = tuple(tail) + (token,)
+                state['input_total'] += 1
+                if ngram in state['source_counts']:
+                    state['input_counts'][ngram] += 1
+            tail.append(token)
+
+    return None
+
+def accumulate_chunk_features(input_doc_chunks, feature_state):
+    """
+    Passes input document chunks through unchanged, accumulating the containment and LCS features on the way.
+
+    Args:
+        input_doc_chunks (iterable[str]): Consecutive chunks of the input document.
+        feature_state (dict): Streaming feature accumulators.
+
+    Yields:
+        chunk (str): The next chunk of the input document.
+    """
+    lcs_matcher = feature_state['lcs_matcher']
+
+    for chunk in input_doc_chunks:
+        chunk = str(chunk)
+        feature_state['input_length'] += len(chunk)
+        lcs_matcher.set_seq1(chunk)
+        match_size = lcs_matcher.find_longest_match(0, len(chunk), 0, feature_state['source_length']).size
+        feature_state['lcs_size'] = max(feature_state['lcs_size'], match_size)
+
+        # a word at the end of the chunk may continue into the next chunk
+        text = feature_state['token_tail'] + chunk.lower()
+        cut = trailing_word_pattern.search(text).start()
+        feature_state['token_tail'] = text[cut:]
+        update_streaming_containment(feature_state, ngram_token_pattern.findall(text[:cut]))
+
+        yield chunk
+
+    update_streaming_containment(feature_state, ngram_token_pattern.findall(feature_state['token_tail']))
+    feature_state['token_tail'] = ''
+
+def update_streaming_scores(feature_state, window, direct_output, paraphrase_output):
+    """
+    Adds the sentence count and similarity scores of one window of input sentences to the score accumulators.
+
+    Args:
+        feature_state (dict): Streaming feature accumulators.
+        window (list[dict]): Window of input document sentences.
+        direct_output (list[dict]): Direct matches found in the window.
+        paraphrase_output (list[dict]): Paraphrased matches found in the window.
+    """
+    feature_state['sentence_count'] += len(window)
+    feature_state['direct_total_score'] += sum(output['score'] for output in direct_output)
+    feature_state['paraphrase_total_score'] += sum(output['score'] for output in paraphrase_output)
+
+    return None
+
+def get_streaming_features(feature_state):
+    """
+    Returns the final model features from the streaming feature accumulators.
+
+    Args:
+        feature_state (dict): Streaming feature accumulators.
+
+    Returns:
+        direct_avg_score (float): Average direct matching cosine similarity score over number of sentences in input document.
+        paraphrase_avg_score (float): Average paraphrase cosine similarity score over number of sentences in input document.
+        containment_scores (dict): Containment scores for each ngram between the source and input document.
+        lcm_score (float): Longest common substring score between the source and input document.
+    """
+    sentence_count = feature_state['sentence_count']
+    direct_avg_score = feature_state['direct_total_score'] / sentence_count if sentence_count else 0
+    paraphrase_avg_score = feature_state['paraphrase_total_score'] / sentence_count if sentence_count else 0
+
+    containment_scores = {}
+    for n, state in feature_state['containment'].items():
+        intersection = sum(min(count, state['source_counts'][ngram]) for ngram, count in state['input_counts'].items())
+        containment_scores[f"c_{n}"] = intersection / state['input_total'] if state['input_total'] else 0
+
+    max_len = max(feature_state['input_length'], feature_state['source_length'])
+    lcm_score = feature_state['lcs_size'] / max_len if max_len else 0
+
+    return direct_avg_score, paraphrase_avg_score, containment_scores, lcm_score
+
+def stream_one_one_matching_texts(sentence_trans_model, ngrams_lst, source_doc, source_doc_name, input_doc_chunks, window_size=streaming_window_size, on_match=None):
+    """
+    Streaming version of one_one_matching_texts for very large input documents.
+    Input sentences flow through direct matching and paraphrase scoring in fixed-size windows, and all features are accumulated incrementally,
+    so peak memory depends on the window size and the source document, not on the length of the input document.
+
+    The LCS score is the longest match difflib finds between any single chunk and the source document. It equals get_lcm_score when the
+    input document fits in one chunk (streaming_chunk_size characters), and otherwise can be lower or higher: a match spanning two chunks
+    is cut at the boundary, and the autojunk heuristic of find_longest_match (characters frequent in the source document only extend
+    matches) can find a longer match within a chunk than in the whole document. E.g. on df10.csv, 100-character chunks score from 0.45x
+    to 1.8x the whole-document LCS score.
+
+    Args:
+        sentence_trans_model (SentenceTransformer): Sentence Transformer model.
+        ngrams_lst (lst): List of selected n_grams used to generate containment scores.
+        source_doc (str): Source document.
+        source_doc_name (str): Name of source document.
+        input_doc_chunks (str or iterable[str]): Input document, or consecutive chunks of it (e.g. iter_s3_pdf_text).
+        window_size (int): Number of input sentences matched & scored together.
+        on_match (callable): Optional callback receiving the plagiarised texts of each window. If given, plagiarised texts are not collected.
+
+    Returns:
+        plagiarised_text (list): Concatenation of direct matching and paraphrasing texts, sorted by starting character index (empty if on_match is given).
+        direct_avg_score (float): Average direct matching cosine similarity score over number of sentences in input document.
+        paraphrase_avg_score (float): Average paraphrase cosine similarity score over number of sentences in input document.
+        containment_scores (dict): Containment scores for each ngram between the source and input document.
+        lcm_score (float): Longest common substring score between the source and input document.
+    """
+    if isinstance(input_doc_chunks, str):
+        input_doc_chunks = iter_text_chunks(input_doc_chunks)
+
+    feature_state = init_streaming_feature_state(source_doc, ngrams_lst)
+    with timer('text_construction'):
+        source_text = textmatcher.Text(source_doc)
+    source_sent = get_source_sentences(source_doc)
+    with timer('bert_encoding'):
+        source_embeddings = sentence_trans_model.encode(source_sent)
+    count('encoded_sentences', len(source_sent))
+    plagiarised_text = []
+
+    input_text_iter = iter_preprocessed_sent(accumulate_chunk_features(input_doc_chunks, feature_state))
+
+    for window in iter_windows(input_text_iter, window_size):
+        direct_output, match_lst = get_matching_texts(window, source_text, source_doc_name)
+        nonmatch_lst = get_non_direct_texts(window, match_lst)
+        try:
+            paraphrase_output = get_embedding_paraphrase_predictions(sentence_trans_model, nonmatch_lst, source_sent, source_embeddings, source_doc_name, 0.7)
+        except:
+            paraphrase_output = []
+
+        # windows are consumed in order, so sorting within a window keeps the whole output sorted
+        window_text = sorted(direct_output + paraphrase_output, key=lambda d: d['start_char_index'])
+
+        new_direct_output, new_paraphrase_output = modified_output_lists(direct_output, paraphrase_output, 0.95)
+        update_streaming_scores(feature_state, window, new_direct_output, new_paraphrase_output)
+
+        if on_match is None:
+            plagiarised_text.extend(window_text)
+        else:
+            on_match(window_text)
+
+    direct_avg_score, paraphrase_avg_score, containment_scores, lcm_score = get_streaming_features(feature_state)
+
+    return plagiarised_text, direct_avg_score, paraphrase_avg_score, containment_scores, lcm_score
+
+
+######## RESULT CACHE FUNCTIONS ########
+
+def get_s3_model_version(s3_bucket, s3_filepath):
+    """
+    Returns the version of a trained model in S3, which changes whenever the model is retrained & uploaded again.
+
+    Args:
+        s3_bucket (str): Name of S3 bucket.
+        s3_filepath (str): Filepath of trained model in S3.
+
+    Returns:
+        version (str): S3 version ID of the model if bucket versioning is enabled, else its ETag & last modified time.
+    """
+    s3_client = boto3.client('s3')
+    head = s3_client.head_object(Bucket=s3_bucket, Key=s3_filepath)
+
+    return get_s3_object_version(head)
+
+def get_s3_object_version(s3_response):
+    """
+    Returns the version of an S3 object from the response of a head_object or get_object call (see get_s3_model_version).
+    """
+    if s3_response.get('VersionId') not in [None, 'null']:
+        return s3_response['VersionId']
+
+    return f"{s3_response['ETag']}:{s3_response['LastModified'].isoformat()}"
+
+def get_doc_text_hash(doc_name, content_index, doc=None):
+    """
+    Returns the text hash of a document from the content index, or by hashing its text if it was uploaded before the index existed.
+
+    Args:
+        doc_name (str): Name of document in S3.
+        content_index (dict): Content index of uploaded documents.
+        doc (str): Document text, if already read.
+
+    Returns:
+        text_hash (str): SHA-256 hex digest of the normalised document text, or None if unknown and doc is not given.
+    """
+    document = content_index['documents'].get(resolve_doc_name(doc_name, content_index), {})
+    if 'text_hash' in document:
+        return document['text_hash']
+    if doc is not None:
+        return get_text_hash(doc)
+
+    return None
+
+def get_one_one_cache_key(sentbert_model_name, final_model_name, ngrams_lst, input_hash, source_hash, streaming):
+    """
+    Returns the result cache key of a 1-1 comparison of two documents' contents under the current models & matching configuration.
+    """
+    config_hash = get_config_hash({'ngrams_lst': ngrams_lst, 'cascade_gates': cascade_gates, 'streaming': streaming})
+
+    return get_result_cache_key(input_hash, source_hash,
+                                get_s3_model_version(s3_bucket, sentbert_model_name),
+                                get_final_model_version(s3_bucket, final_model_name),
+                                config_hash)
+
+def rename_cached_response(response, input_doc_name, source_doc_name):
+    """
+    Returns a cached response under the requested document names, since documents with identical content share a cache entry.
+    """
+    response['input_doc_name'] = input_doc_name
+    for text in response['plagiarised_text']:
+        text['source_doc_name'] = source_doc_name
+
+    return response
+
+
+######## 1-1 MATCHING FINAL OUTPUT GENERATION FUNCTIONS ########
+
+def get_one_one_matching_output(sentbert_model_name, final_model_name, ngrams_lst, source_doc_name, input_doc_name, streaming=False, result_cache=None, deadline=None, target=None):
+    """
+    One-to-one matching function - given 2 documents, compare and return the plagiarised flag, score and plagiarised texts.
+    Results are cached by the documents' contents, the versions of both models and the matching configuration,
+    so repeated comparisons are answered without recomputation and are not added to the training data again.
+    If the deadline runs out, the response is flagged as partial (see add_coverage) and is not cached.
+    With a target label, the pair's features are appended to the online feature log (see add_online_feature_row), unless the response is partial.
+
+    Args:
+        sentbert_model_name (str): Filepath of trained Sentence Transformer model.
+        final_model_name (str): Filepath of trained final model.
+        ngrams_lst (lst): List of selected n_grams used to generate containment scores.
+        source_doc_name (str): Name of source document in S3.
+        input_doc_name (str): Name of input document in S3.
+        streaming (bool): Whether to stream the input document in bounded memory. Streamed documents are not added to the training data.
+        result_cache (LocalDiskResultCache): Result cache to use. Defaults to the process-wide cache (see get_result_cache).
+        deadline (Deadline): Time budget of the request. Not used in streaming mode.
+        target (int): Reviewed label of the pair (1 if plagiarised, else 0), added to the training data & online feature log. Optional.
+    
+    Returns:
+        res (dict): Dictionary containing all comparison results (name of input document, plagiarised flag, score and texts).
+    """
+    if result_cache is None:
+        result_cache = get_result_cache()
+
+    content_index = read_content_index(s3_bucket, s3_content_index_filepath)
+    input_doc = source_doc = None
+    if not streaming:
+        input_doc = read_s3_pdf(s3_bucket, input_doc_name)
+        source_doc = read_s3_pdf(s3_bucket, source_doc_name)
+    input_hash = get_doc_text_hash(input_doc_name, content_index, input_doc)
+    source_hash = get_doc_text_hash(source_doc_name, content_index, source_doc)
+
+    cache_key = None
+    if result_cache is not None and input_hash is not None and source_hash is not None:
+        cache_key = get_one_one_cache_key(sentbert_model_name, final_model_name, ngrams_lst, input_hash, source_hash, streaming)
+        cached = result_cache.get(cache_key)
+        count('result_cache_hits' if cached is not None else 'result_cache_misses')
+        if cached is not None:
+            if target is not None:
+                add_online_feature_row(cached['features'], target, source_doc_name, input_doc_name, s3_bucket, s3_online_features_filepath)
+            return rename_cached_response(cached['response'], input_doc_name, source_doc_name)
+
+    if streaming:
+        source_doc = read_s3_pdf(s3_bucket, source_doc_name)
+        sentence_trans_model = load_s3_model(s3_bucket, sentbert_model_name)
+        matching_texts = stream_one_one_matching_texts(sentence_trans_model, ngrams_lst, source_doc, source_doc_name, iter_s3_pdf_text(s3_bucket, input_doc_name))
+    else:
+        matching_texts = one_one_matching_texts(sentbert_model_name, ngrams_lst, source_doc, source_doc_name, input_doc, deadline=deadline)
+
+    plagiarised_text, direct_avg_score, paraphrase_avg_score, containment_scores, lcm_score = matching_texts
+    features = get_feature_dict(containment_scores, lcm_score, direct_avg_score, paraphrase_avg_score)
+    res = add_coverage(matching_texts_flag_score(final_model_name, input_doc_name, *matching_texts), deadline)
+
+    if not streaming:
+        add_input_training_data(source_doc_name, source_doc, input_doc, s3_bucket, s3_training_data_filepath, target)
+    if target is not None and not res.get('partial', False):
+        add_online_feature_row(features, target, source_doc_name, input_doc_name, s3_bucket, s3_online_features_filepath)
+
+    if cache_key is not None and not res.get('partial', False):
+        # cache the response as the handler serialises it
+        result_cache.set(cache_key, {'response': json.loads(json.dumps(res, default=str)), 'features': features})
+
+    return res
+
+
+######## 1-MANY MATCHING FINAL OUTPUT GENERATION FUNCTIONS ########
+
+def get_one_many_matching_output(sentbert_model_name, final_model_name, ngrams_lst, input_doc_name, streaming=False, workers=None, incremental=True, deadline=None):
+    """
+    One-to-many matching function - given 1 input document, compare with the database of documents in S3 and return the plagiarised flag, score and plagiarised texts.
+    In incremental mode, the per-source results of previous checks of the same input document content are reused and only
+    source documents added to the database after the last check are scored.
+    Once the deadline has run out, the remaining source documents are not scored (at least one always is) and the response is
+    flagged as partial (see add_coverage). Only fully scored source documents are persisted, so the next check picks up the rest.
+
+    Args:
+        sentbert_model_name (str): Filepath of trained Sentence Transformer model.
+        final_model_name (str): Filepath of trained final model.
+        ngrams_lst (lst): List of selected n_grams used to generate containment scores.
+        source_docs (list[dict]): List of dictionaries containing source documents & source document name. E.g. [{'source_doc_name': test1, 'source_doc': teststr}]
+        input_doc_name (str): Name of input document.
+        streaming (bool): Whether to stream the input document in bounded memory, once per source document.
+        workers (int): Number of worker processes scoring source documents in parallel. Defaults to one_many_workers. Not used in streaming mode.
+        incremental (bool): Whether to reuse & update the persisted 1-n state of the input document.
+        deadline (Deadline): Time budget of the request. Stages are only skipped within the sequential (workers=1, not streaming) mode.
+    
+    Returns:
+        output_dict (dict): Dictionary containing all comparison results, averaged across all source_documents (name of input document, plagiarised flag, score and texts).
+    """
+    plagiarised_text_lst = []
+    direct_avg_score_lst = []
+    paraphrase_avg_score_lst = []
+    containment_scores_lst = []
+    lcm_score_lst = []
+
+    if workers is None:
+        workers = one_many_workers
+    input_doc = None
+    if not streaming:
+        input_doc = read_s3_pdf(s3_bucket, input_doc_name)
+    content_index = read_content_index(s3_bucket, s3_content_index_filepath)
+    canonical_doc_name = resolve_doc_name(input_doc_name, content_index)
+    webis_df = read_source_database(s3_bucket, s3_webis_data_filepath) # This is the database of documents to check through.
+
+    input_hash = get_doc_text_hash(input_doc_name, content_index, input_doc)
+    state_key = None
+    state = {'watermark': 0, 'sources': []}
+    if incremental and input_hash is not None:
+        state_key = get_one_many_state_key(sentbert_model_name, ngrams_lst, input_hash, streaming)
+        state = read_one_many_state(s3_bucket, get_one_many_state_filepath(canonical_doc_name), state_key, len(webis_df))
+
+    source_lst = []
+    source_positions = [] # database row of each source document
+    for position, (index, row) in enumerate(webis_df.iloc[state['watermark']:].iterrows(), state['watermark']):
+        if row['file_num'] not in [input_doc_name, canonical_doc_name]:
+            source_lst.append((row['file_num'], row['text']))
+            source_positions.append(position)
+
+    set_value('sources', len(state['sources']) + len(source_lst))
+    set_value('sources_reused', len(state['sources']))
+    if len(source_lst) == 0:
+        matching_texts_lst = []
+    elif workers > 1 and not streaming:
+        matching_texts_lst = get_parallel_matching_texts(sentbert_model_name, ngrams_lst, source_lst, input_doc, workers, deadline=deadline)
+    else:
+        sentence_trans_model = load_s3_model(s3_bucket, sentbert_model_name)
+        matching_texts_lst = []
+        for source_doc_name, source_doc in source_lst:
+            if deadline is not None and deadline.expired() and len(matching_texts_lst) + len(state['sources']) > 0:
+                break
+            if streaming:
+                matching_texts_lst.append(stream_one_one_matching_texts(sentence_trans_model, ngrams_lst, source_doc, source_doc_name, iter_s3_pdf_text(s3_bucket, input_doc_name)))
+            else:
+                matching_texts_lst.append(one_one_matching_texts(sentbert_model_name, ngrams_lst, source_doc, source_doc_name, input_doc, sentence_trans_model, deadline=deadline))
+        matching_texts_lst += [None] * (len(source_lst) - len(matching_texts_lst))
+
+    source_results = [None if matching_texts is None else get_source_result(source_doc_name, matching_texts)
+                      for (source_doc_name, source_doc), matching_texts in zip(source_lst, matching_texts_lst)]
+
+    # persist the leading source documents that were scored with all stages; the watermark stops at the first one that was not
+    degraded_doc_names = {name for names in deadline.skipped_stages.values() for name in names} if deadline is not None else set()
+    n_complete = 0
+    while n_complete < len(source_results) and source_results[n_complete] is not None and source_results[n_complete]['source_doc_name'] not in degraded_doc_names:
+        n_complete += 1
+    watermark = len(webis_df) if n_complete == len(source_results) else source_positions[n_complete]
+    if state_key is not None and state['watermark'] != watermark:
+        write_s3_json(dict(state, watermark=watermark, sources=state['sources'] + source_results[:n_complete]), s3_bucket, get_one_many_state_filepath(canonical_doc_name))
+
+    scored_results = state['sources'] + [source_result for source_result in source_results if source_result is not None]
+    set_value('sources_scored', len(scored_results))
+    if deadline is not None:
+        deadline.sources_total = len(state['sources']) + len(source_results)
+        deadline.sources_scored = len(scored_results)
+
+    for source_result in scored_results:
+        plagiarised_text_lst = plagiarised_text_lst + source_result['plagiarised_text']
+        direct_avg_score_lst.append(source_result['direct_avg_score'])
+        paraphrase_avg_score_lst.append(source_result['paraphrase_avg_score'])
+        containment_scores_lst.append(source_result['containment_scores'])
+        lcm_score_lst.append(source_result['lcm_score'])
 
     avg_containment_scores = get_n_avg_containment_scores(containment_scores_lst, ngrams_lst)
 
-    feature_df = get_feature_dict(avg_containment_scores, mean(lcm_score_lst), mean(direct_avg_score_lst), mean(paraphrase_avg_score_lst))
+    features = get_feature_dict(avg_containment_scores, mean(lcm_score_lst), mean(direct_avg_score_lst), mean(paraphrase_avg_score_lst))
 
-    plagiarism_flag, plagiarism_score = get_flag_score_prediction(final_model_name, feature_df)
+    plagiarism_flag, plagiarism_score = get_flag_score_prediction(final_model_name, features)
 
     output_dict = {'input_doc_name': input_doc_name,
                     'plagiarism_flag': plagiarism_flag, 
                     'plagiarism_score': plagiarism_score,
                     'plagiarised_text': plagiarised_text_lst}
     
-    return output_dict
+    return add_coverage(output_dict, deadline)
+
+######## INCREMENTAL 1-MANY MATCHING FUNCTIONS ########
+
+def get_one_many_state_filepath(doc_name):
+    """
+    Returns the S3 filepath of the persisted 1-n state of a (canonical) input document.
+    """
+    return os.path.join(s3_one_many_state_filepath, f'{doc_name}.json')
+
+def get_one_many_state_key(sentbert_model_name, ngrams_lst, input_hash, streaming):
+    """
+    Returns the key a persisted 1-n state is valid for: the input document's content, the Sentence Transformer model version and the matching configuration.
+    The final model is not part of the key as it only runs on the re-aggregated features.
+    """
+    return get_config_hash({'input_hash': input_hash,
+                            'bert_version': get_s3_model_version(s3_bucket, sentbert_model_name),
+                            'ngrams_lst': ngrams_lst,
+                            'cascade_gates': cascade_gates,
+                            'streaming': streaming})
+
+@timed('one_many_state_read')
+def read_one_many_state(s3_bucket, s3_filepath, state_key, n_corpus_rows):
+    """
+    Returns the persisted 1-n state of an input document, or an empty state if there is none or it is no longer valid
+    (the input document was resubmitted with different content, the model or configuration changed, or the database shrank).
+
+    Args:
+        s3_bucket (str): Name of S3 bucket.
+        s3_filepath (str): Filepath of the persisted state in S3.
+        state_key (str): Key the state must have been computed with (see get_one_many_state_key).
+        n_corpus_rows (int): Number of rows of the documents database.
+
+    Returns:
+        state (dict): Dictionary with keys
+            'state_key',
+            'watermark' (number of database rows already scored) and
+            'sources' (per-source results of the scored rows, see get_source_result).
+    """
+    state = read_s3_json(s3_bucket, s3_filepath, default={})
+    if state.get('state_key') != state_key or state.get('watermark', 0) > n_corpus_rows:
+        state = {'state_key': state_key, 'watermark': 0, 'sources': []}
+
+    return state
+
+def get_source_result(source_doc_name, matching_texts):
+    """
+    Returns the JSON serialisable per-source result of one_one_matching_texts, as persisted in the 1-n state.
+    """
+    plagiarised_text, direct_avg_score, paraphrase_avg_score, containment_scores, lcm_score = matching_texts
+    source_result = {'source_doc_name': source_doc_name,
+                     'plagiarised_text': plagiarised_text,
+                     'direct_avg_score': direct_avg_score,
+                     'paraphrase_avg_score': paraphrase_avg_score,
+                     'containment_scores': containment_scores,
+                     'lcm_score': lcm_score}
+
+    return json.loads(json.dumps(source_result, default=lambda value: value.item() if hasattr(value, 'item') else str(value)))
+
+
+######## PARALLEL 1-MANY MATCHING FUNCTIONS ########
+
+# Sentence Transformer model of the current worker process, loaded once by init_matching_worker
+worker_sentence_trans_model = None
+
+def init_matching_worker(sentbert_model_name, sentence_trans_model=None):
+    """
+    Initialiser of each worker process in the 1-n process pool. Loads the Sentence Transformer model once per worker.
+
+    Args:
+        sentbert_model_name (str): Filepath of trained Sentence Transformer model.
+        sentence_trans_model (SentenceTransformer): Already loaded model to use instead of loading from S3.
+    """
+    global worker_sentence_trans_model
+    if sentence_trans_model is None:
+        sentence_trans_model = load_s3_model(s3_bucket, sentbert_model_name)
+    worker_sentence_trans_model = sentence_trans_model
+
+    return None
+
+def score_source_partition(source_partition, ngrams_lst, input_doc):
+    """
+    Scores the input document against one partition of source documents inside a worker process.
+
+    Args:
+        source_partition (list[tuple]): List of (source_doc_name, source_doc) tuples.
+        ngrams_lst (lst): List of selected n_grams used to generate containment scores.
+        input_doc (str): Input document.
+
+    Returns:
+        matching_texts_lst (list[tuple]): one_one_matching_texts output for each source document, in partition order.
+    """
+    return [one_one_matching_texts(None, ngrams_lst, source_doc, source_doc_name, input_doc, worker_sentence_trans_model)
+            for source_doc_name, source_doc in source_partition]
+
+def partition_sources(source_lst, n_partitions):
+    """
+    Splits source documents into contiguous partitions of near-equal size.
+
+    Args:
+        source_lst (list): List of (source_doc_name, source_doc) tuples.
+        n_partitions (int): Maximum number of partitions.
+
+    Returns:
+        partitions (list[list]): Non-empty partitions, in source order.
+    """
+    n_partitions = max(1, min(n_partitions, len(source_lst)))
+    size, remainder = divmod(len(source_lst), n_partitions)
+    partitions = []
+    start = 0
+
+    for i in range(n_partitions):
+        end = start + size + (1 if i < remainder else 0)
+        partitions.append(source_lst[start:end])
+        start = end
+
+    return [partition for partition in partitions if partition]
+
+def iter_parallel_matching_texts(sentbert_model_name, ngrams_lst, source_lst, input_doc, workers, sentence_trans_model=None, partitions_per_worker=4, deadline=None):
+    """
+    Scores the input document against all source documents on a process pool, yielding each partition's results as soon as it completes.
+    Every worker loads the Sentence Transformer model once. Once the deadline has run out (and at least one partition has
+    completed), the pending partitions are cancelled and running ones are left to finish in the background.
+
+    Note that AWS Lambda does not provide /dev/shm, which multiprocessing requires; use workers > 1 on container or on-prem deployments.
+
+    Args:
+        sentbert_model_name (str): Filepath of trained Sentence Transformer model.
+        ngrams_lst (lst): List of selected n_grams used to generate containment scores.
+        source_lst (list[tuple]): List of (source_doc_name, source_doc) tuples.
+        input_doc (str): Input document.
+        workers (int): Number of worker processes.
+        sentence_trans_model (SentenceTransformer): Already loaded model sent to each worker instead of loading from S3.
+        partitions_per_worker (int): Number of partitions per worker, to balance uneven source document sizes.
+        deadline (Deadline): Time budget of the request.
+
+    Yields:
+        partition_index (int): Index of the completed partition.
+        matching_texts_lst (list[tuple]): one_one_matching_texts output for each source document in the partition.
+    """
+    partitions = partition_sources(source_lst, workers * partitions_per_worker)
+
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=init_matching_worker, initargs=(sentbert_model_name, sentence_trans_model))
+    futures = {executor.submit(score_source_partition, partition, ngrams_lst, input_doc): i for i, partition in enumerate(partitions)}
+    pending = set(futures)
+    try:
+        while pending:
+            timeout = None
+            if deadline is not None and len(pending) < len(futures):
+                timeout = max(0, deadline.remaining_ms() / 1000)
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if len(done) == 0:
+                break
+            for future in done:
+                yield futures[future], future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=len(pending) == 0)
+
+@timed('parallel_scoring')
+def get_parallel_matching_texts(sentbert_model_name, ngrams_lst, source_lst, input_doc, workers, sentence_trans_model=None, partitions_per_worker=4, deadline=None):
+    """
+    Returns one_one_matching_texts output for every source document, scored on a process pool and merged back in source order.
+    Source documents whose partition did not complete before the deadline get None.
+
+    Args:
+        sentbert_model_name (str): Filepath of trained Sentence Transformer model.
+        ngrams_lst (lst): List of selected n_grams used to generate containment scores.
+        source_lst (list[tuple]): List of (source_doc_name, source_doc) tuples.
+        input_doc (str): Input document.
+        workers (int): Number of worker processes.
+        sentence_trans_model (SentenceTransformer): Already loaded model sent to each worker instead of loading from S3.
+        partitions_per_worker (int): Number of partitions per worker, to balance uneven source document sizes.
+        deadline (Deadline): Time budget of the request.
+
+    Returns:
+        matching_texts_lst (list[tuple]): one_one_matching_texts output (or None) for each source document, in source order.
+    """
+    partitions = partition_sources(source_lst, workers * partitions_per_worker)
+    partition_results = {}
+
+    for partition_index, matching_texts_lst in iter_parallel_matching_texts(sentbert_model_name, ngrams_lst, source_lst, input_doc, workers, sentence_trans_model, partitions_per_worker, deadline):
+        partition_results[partition_index] = matching_texts_lst
+
+    return [matching_texts for partition_index, partition in enumerate(partitions)
+            for matching_texts in partition_results.get(partition_index, [None] * len(partition))]
+
+
+######## API RESPONSE FUNCTIONS ########
+
+def get_response_object():
+    """
+    Returns a new API Gateway proxy response for a handler, so that concurrent requests (e.g. in the HTTP server) do not share one.
+    """
+    response_object = {}
+    response_object['headers'] = {}
+    response_object['headers']['Content-Type'] = 'application/json'
+    response_object['isBase64Encoded'] = False
+
+    return response_object
+
+
+######## CONTENT-ADDRESSED DEDUPLICATION FUNCTIONS ########
+
+def get_bytes_hash(content):
+    """
+    Returns the SHA-256 hex digest of raw file bytes.
+
+    Args:
+        content (bytes): Raw file content.
+
+    Returns:
+        bytes_hash (str): SHA-256 hex digest.
+    """
+    return hashlib.sha256(content).hexdigest()
+
+def normalise_text(text):
+    """
+    Normalises extracted text so that the same document parsed from differently encoded PDFs hashes identically.
+    Text is lowercased and all whitespace runs are collapsed into a single space.
+
+    Args:
+        text (str): Extracted document text.
+
+    Returns:
+        normalised_text (str): Normalised document text.
+    """
+    return ' '.join(str(text).lower().split())
+
+def get_text_hash(text):
+    """
+    Returns the SHA-256 hex digest of the normalised document text.
+
+    Args:
+        text (str): Extracted document text.
+
+    Returns:
+        text_hash (str): SHA-256 hex digest.
+    """
+    return hashlib.sha256(normalise_text(text).encode('utf-8')).hexdigest()
+
+def get_artifact_filepath(text_hash, artifact_name):
+    """
+    Returns the S3 filepath of a derived artifact (e.g. extracted text) of a document, keyed by its text hash.
+
+    Args:
+        text_hash (str): SHA-256 hex digest of the normalised document text.
+        artifact_name (str): Filename of the artifact.
+
+    Returns:
+        filepath (str): Filepath of the artifact in S3.
+    """
+    return os.path.join(s3_artifacts_filepath, text_hash, artifact_name)
+
+def read_content_index(s3_bucket, s3_content_index_filepath):
+    """
+    Returns the content index of uploaded documents.
+
+    Args:
+        s3_bucket (str): Name of S3 bucket.
+        s3_content_index_filepath (str): Filepath of content index in S3.
+
+    Returns:
+        content_index (dict): Dictionary with keys
+            'documents' (canonical document name -> {'bytes_hash', 'text_hash'}),
+            'hashes' (bytes or text hash -> canonical document name) and
+            'aliases' (deduplicated document name -> canonical document name).
+    """
+    content_index = read_s3_json(s3_bucket, s3_content_index_filepath, default={})
+    for key in ['documents', 'hashes', 'aliases']:
+        content_index.setdefault(key, {})
+
+    return content_index
+
+def resolve_doc_name(doc_name, content_index):
+    """
+    Returns the canonical document name of a (possibly deduplicated) document.
+
+    Args:
+        doc_name (str): Name of document.
+        content_index (dict): Content index of uploaded documents.
+
+    Returns:
+        canonical_doc_name (str): Name of the document the given name is an alias of, or the given name itself.
+    """
+    return content_index['aliases'].get(doc_name, doc_name)
+
+def find_duplicate_document(content_index, content_hash):
+    """
+    Returns the canonical document name already stored under the given content hash, if any.
+
+    Args:
+        content_index (dict): Content index of uploaded documents.
+        content_hash (str): Bytes or text hash of the uploaded document.
+
+    Returns:
+        canonical_doc_name (str): Name of the existing document, or None if the content is new.
+    """
+    return content_index['hashes'].get(content_hash)
+
+@timed('artifacts_write')
+def add_document_artifacts(input_doc, text_hash, s3_bucket):
+    """
+    Caches the derived artifacts of a new document (its extracted text, read back by read_s3_pdf instead of parsing the PDF) in S3, keyed by its text hash.
+
+    Args:
+        input_doc (str): Extracted document text.
+        text_hash (str): SHA-256 hex digest of the normalised document text.
+        s3_bucket (str): Name of S3 bucket.
+    """
+    s3_client = boto3.client('s3')
+    s3_client.put_object(Bucket=s3_bucket, Key=get_artifact_filepath(text_hash, 'text.txt'), Body=input_doc.encode('utf-8'))
+
+    return None
+
+def register_document(content_index, doc_name, bytes_hash, text_hash):
+    """
+    Registers a new canonical document in the content index.
+
+    Args:
+        content_index (dict): Content index of uploaded documents.
+        doc_name (str): Name of document.
+        bytes_hash (str): SHA-256 hex digest of the raw PDF bytes.
+        text_hash (str): SHA-256 hex digest of the normalised document text.
+
+    Returns:
+        content_index (dict): Updated content index.
+    """
+    content_index['aliases'].pop(doc_name, None)
+    # drop hashes of previous content uploaded under the same name
+    previous_document = content_index['documents'].get(doc_name, {})
+    for content_hash in previous_document.values():
+        if content_index['hashes'].get(content_hash) == doc_name:
+            del content_index['hashes'][content_hash]
+    content_index['documents'][doc_name] = {'bytes_hash': bytes_hash, 'text_hash': text_hash}
+    content_index['hashes'][bytes_hash] = doc_name
+    content_index['hashes'][text_hash] = doc_name
+
+    return content_index
+
+def register_alias(content_index, doc_name, canonical_doc_name):
+    """
+    Registers a deduplicated upload as an alias of an existing canonical document in the content index.
+
+    Args:
+        content_index (dict): Content index of uploaded documents.
+        doc_name (str): Name of the deduplicated document.
+        canonical_doc_name (str): Name of the existing document with identical content.
+
+    Returns:
+        content_index (dict): Updated content index.
+    """
+    if doc_name != canonical_doc_name:
+        content_index['aliases'][doc_name] = canonical_doc_name
+
+    return content_index
+
+
+######## BAKED MODEL FUNCTIONS ########
+
+def read_baked_models_manifest(baked_models_dir=baked_models_dir):
+    """
+    Returns the manifest of the models baked into the image, or an empty manifest if none were baked.
+
+    Returns:
+        manifest (dict): S3 filepath of model -> {'version': model version in S3 when baked, 'file': filename in baked_models_dir}.
+    """
+    try:
+        with open(os.path.join(baked_models_dir, 'manifest.json')) as f:
+            return json.load(f)
+    except OSError:
+        return {}
+
+def get_baked_model_filepath(s3_filepath, version, baked_models_dir=baked_models_dir):
+    """
+    Returns the local filepath of the baked model of s3_filepath if it has the given version (any version if None), else None.
+    """
+    baked_model = read_baked_models_manifest(baked_models_dir).get(s3_filepath)
+    if baked_model is None or (version is not None and baked_model['version'] != version):
+        return None
+
+    return os.path.join(baked_models_dir, baked_model['file'])
+
+def warm_up_models(sentbert_model_name, final_model_name, ngrams_lst):
+    """
+    Loads both models and runs a dummy 1-1 matching & prediction, so that the first request does not pay for loading the
+    models, importing torch, scikit-learn & nltk or initialising the encoder. Called when a handler module is imported
+    (the Lambda initialisation phase) if WARM_UP_MODELS=1.
+    """
+    sentence_trans_model = load_s3_model(s3_bucket, sentbert_model_name)
+    sentence_trans_model.encode(['This sentence warms up the encoder.'])
+    warm_up_doc = 'This sentence warms up the text matcher and the encoder. Another sentence is compared with it here.'
+    one_one_matching_texts(sentbert_model_name, ngrams_lst, warm_up_doc, 'warm-up', warm_up_doc, sentence_trans_model)
+    reset_cascade_stats()
+
+    final_predictor = load_final_predictor(s3_bucket, final_model_name)
+    final_predictor.predict(get_feature_dict({f"c_{ngram}": 0 for ngram in ngrams_lst}, 0, 0, 0))
+
+    return None
+
 
 ######## ADD INPUT TO S3 ########
 
+# serialises the read-modify-write of the CSV files below across the threads of a long-lived server
+storage_append_lock = threading.Lock()
+
 def upload_to_s3(local_file, s3_bucket, s3_filepath):
     """
     Uploads file back to S3 bucket.
@@ -595,7 +2014,8 @@ def upload_to_s3(local_file, s3_bucket, s3_filepath):
 
     return s3_url
 
-def add_input_training_data(source_doc_name, source_doc, input_doc, s3_bucket, s3_training_data_filepath):
+@timed('training_csv_write')
+def add_input_training_data(source_doc_name, source_doc, input_doc, s3_bucket, s3_training_data_filepath, target=None):
     """
     Adds the new input and source documents back to training data file in S3 bucket.
 
@@ -606,21 +2026,60 @@ def add_input_training_data(source_doc_name, source_doc, input_doc, s3_bucket, s
         input_doc_name (str): Name of input document.
         s3_bucket (str): Name of S3 bucket.
         s3_training_data_filepath (str): Filepath of file in S3.
+        target (int): Reviewed label of the pair (1 if plagiarised, else 0), if known.
     """
-    training_df = read_s3_df(s3_bucket, s3_training_data_filepath)
+    with storage_append_lock:
+        training_df = read_s3_df(s3_bucket, s3_training_data_filepath)
 
-    data = pd.DataFrame({
-        "file_num": [source_doc_name],
-        "text_og": [source_doc],
-        "text_para": [input_doc]
-    })
-    training_df = training_df.append(data, ignore_index=True) 
-    
-    training_df.to_csv('/tmp/train.csv', index=False)
-    upload_to_s3('/tmp/train.csv', s3_bucket, s3_training_data_filepath)
+        data = pd.DataFrame({
+            "file_num": [source_doc_name],
+            "text_og": [source_doc],
+            "text_para": [input_doc]
+        })
+        if target is not None:
+            data["target"] = [target]
+        training_df = pd.concat([training_df, data], ignore_index=True)
+
+        training_df.to_csv('/tmp/train.csv', index=False)
+        upload_to_s3('/tmp/train.csv', s3_bucket, s3_training_data_filepath)
+
+    return None
+
+def get_online_feature_key(s3_online_features_filepath, created_at_ms=None):
+    """
+    Returns a new, unique S3 key for a feature row: <prefix>/<creation time in ms, 13 digits>-<random hex>.json, so that
+    rows are listed in creation order.
+    """
+    if created_at_ms is None:
+        created_at_ms = int(time.time() * 1000)
+
+    return f'{s3_online_features_filepath}/{created_at_ms:013d}-{uuid.uuid4().hex}.json'
+
+@timed('online_features_write')
+def add_online_feature_row(features, target, source_doc_name, input_doc_name, s3_bucket, s3_online_features_filepath):
+    """
+    Writes the features & label of a compared pair as a new JSON object under the online feature prefix in S3 bucket,
+    from which online_learning.py updates the final model. Every row is its own object, so a request writes a constant
+    amount of data and concurrent requests never overwrite each other's rows.
+
+    Args:
+        features (dict): Features of the pair, as returned by get_feature_dict.
+        target (int): Reviewed label of the pair (1 if plagiarised, else 0).
+        source_doc_name (str): Name of source document.
+        input_doc_name (str): Name of input document.
+        s3_bucket (str): Name of S3 bucket.
+        s3_online_features_filepath (str): Prefix of the feature rows in S3.
+    """
+    row = {"created_at": pd.to_datetime('now').strftime("%Y-%m-%d %H:%M:%S"),
+           "source_doc_name": source_doc_name,
+           "input_doc_name": input_doc_name,
+           "target": int(target),
+           **{name: float(value) for name, value in features.items()}}
+    write_s3_json(row, s3_bucket, get_online_feature_key(s3_online_features_filepath))
 
     return None
 
+@timed('documents_csv_write')
 def add_input_data(user_id, input_doc_name, input_doc, s3_bucket, s3_webis_data_filepath):
     """
     Adds the new input and source documents back to existing database for documents to be checked against in S3 bucket.
@@ -631,20 +2090,22 @@ def add_input_data(user_id, input_doc_name, input_doc, s3_bucket, s3_webis_data_
         s3_bucket (str): Name of S3 bucket.
         s3_webis_data_filepath (str): Filepath of file in S3.
     """
-    webis_df = read_s3_df(s3_bucket, s3_webis_data_filepath)
+    with storage_append_lock:
+        webis_df = read_s3_df(s3_bucket, s3_webis_data_filepath)
 
-    data = pd.DataFrame({
-        "user_id": [user_id],
-        "file_num": [input_doc_name],
-        "text": [input_doc]
-    })
-    webis_df = pd.concat([webis_df, data], ignore_index=True) 
-    
-    webis_df.to_csv('/tmp/webis_db.csv', index=False)
-    upload_to_s3('/tmp/webis_db.csv', s3_bucket, s3_webis_data_filepath)
+        data = pd.DataFrame({
+            "user_id": [user_id],
+            "file_num": [input_doc_name],
+            "text": [input_doc]
+        })
+        webis_df = pd.concat([webis_df, data], ignore_index=True) 
+
+        webis_df.to_csv('/tmp/webis_db.csv', index=False)
+        upload_to_s3('/tmp/webis_db.csv', s3_bucket, s3_webis_data_filepath)
 
     return None
 
+@timed('output_csv_write')
 def add_output_data(user_id, input_doc_name, response, matching_type, s3_bucket, s3_output_data_filepath, source_doc_name):
     """
     Adds the new input, source documents and API response to output data file in S3 bucket.
@@ -659,21 +2120,56 @@ def add_output_data(user_id, input_doc_name, response, matching_type, s3_bucket,
         s3_output_data_filepath (str): Filepath of file in S3.
         source_docs (list[dict]): List of dictionaries containing source documents & source document name. E.g. [{'source_doc_name': test1, 'source_doc': teststr}]
     """
-    output_df = read_s3_df(s3_bucket, s3_output_data_filepath)
-
-    data = {
-            "created_at": pd.to_datetime('now').strftime("%Y-%m-%d %H:%M:%S"),
-            "matching_type": matching_type,
-            "user_id": user_id,
-            "source_doc_name": source_doc_name,
-            "input_doc_name": input_doc_name,
-            "plagiarism_flag": response["plagiarism_flag"],
-            "plagiarism_score": response["plagiarism_score"],
-            "plagiarised_text": response["plagiarised_text"]
-        }
-    output_df = output_df.append(data, ignore_index=True) 
-    
-    output_df.to_csv('/tmp/output.csv', index=False)
-    upload_to_s3('/tmp/output.csv', s3_bucket, s3_output_data_filepath)
+    with storage_append_lock:
+        output_df = read_s3_df(s3_bucket, s3_output_data_filepath)
+
+        data = {
+                "created_at": pd.to_datetime('now').strftime("%Y-%m-%d %H:%M:%S"),
+                "matching_type": matching_type,
+                "user_id": user_id,
+                "source_doc_name": source_doc_name,
+                "input_doc_name": input_doc_name,
+                "plagiarism_flag": response["plagiarism_flag"],
+                "plagiarism_score": response["plagiarism_score"],
+                "plagiarised_text": response["plagiarised_text"]
+            }
+        output_df = pd.concat([output_df, pd.DataFrame([data])], ignore_index=True)
+
+        output_df.to_csv('/tmp/output.csv', index=False)
+        upload_to_s3('/tmp/output.csv', s3_bucket, s3_output_data_filepath)
 
-    return None
\ No newline at end of file
+    return None
+
+@timed('output_csv_write')
+def add_batch_output_data(user_id, responses, matching_type, s3_bucket, s3_output_data_filepath, source_doc_name):
+    """
+    Adds the API responses of a batch of input documents to output data file in S3 bucket, with a single read & write of the file.
+
+    Args:
+        user_id (str): user ID.
+        responses (list[dict]): API response body of each input document.
+        matching_type (str): Type of matching, e.g. "n-m".
+        s3_bucket (str): Name of S3 bucket.
+        s3_output_data_filepath (str): Filepath of file in S3.
+        source_doc_name (str): Name of source document(s) compared against.
+    """
+    with storage_append_lock:
+        output_df = read_s3_df(s3_bucket, s3_output_data_filepath)
+        created_at = pd.to_datetime('now').strftime("%Y-%m-%d %H:%M:%S")
+
+        data = pd.DataFrame([{
+                "created_at": created_at,
+                "matching_type": matching_type,
+                "user_id": user_id,
+                "source_doc_name": source_doc_name,
+                "input_doc_name": response["input_doc_name"],
+                "plagiarism_flag": response["plagiarism_flag"],
+                "plagiarism_score": response["plagiarism_score"],
+                "plagiarised_text": response["plagiarised_text"]
+            } for response in responses])
+        output_df = pd.concat([output_df, data], ignore_index=True)
+
+        output_df.to_csv('/tmp/output.csv', index=False)
+        upload_to_s3('/tmp/output.csv', s3_bucket, s3_output_data_filepath)
+
+    return None
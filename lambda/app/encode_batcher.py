@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+######## CONFIGURATIONS ########
+
+encode_batch_wait_ms = float(os.environ.get('ENCODE_BATCH_WAIT_MS', 5)) # how long the first encode call of a batch waits for others to join it
+encode_max_batch_size = int(os.environ.get('ENCODE_MAX_BATCH_SIZE', 256)) # number of sentences after which a batch is encoded without waiting
+
+
+######## ENCODE MICRO-BATCHER ########
+
+class EncodeBatcher:
+    """
+    Wraps a Sentence Transformer model so that encode calls from concurrent requests are coalesced into one model.encode call.
+    The first call of a batch waits up to wait_ms for other calls to join (or until max_batch_size sentences are queued),
+    then a background thread encodes all queued sentences together and hands each caller its own rows.
+    Exposes the same encode(sentences) interface as the wrapped model, so it can be used wherever the model is.
+    A process forked with the batcher (e.g. a 1-n worker process) does not inherit its thread, so the batcher starts
+    over with its own thread & queue in that process.
+    """
+
+    def __init__(self, model, wait_ms=encode_batch_wait_ms, max_batch_size=encode_max_batch_size):
+        self.model = model
+        self.wait_ms = wait_ms
+        self.max_batch_size = max_batch_size
+        self.stats = {'calls': 0, 'batches': 0, 'sentences': 0}
+        self.reset()
+
+    def reset(self):
+        """
+        Starts with an empty queue and no thread in the current process.
+        """
+        self.pid = os.getpid()
+        self.condition = threading.Condition()
+        self.pending = [] # (sentences, future) of calls waiting to be encoded
+        self.pending_sentences = 0
+        self.thread = None
+
+    def encode(self, sentences, **kwargs):
+        single = isinstance(sentences, str)
+        sentences = [sentences] if single else list(sentences)
+        if kwargs or len(sentences) == 0:
+            # calls with non-default options are not batched
+            return self.model.encode(sentences[0] if single else sentences, **kwargs)
+
+        if self.pid != os.getpid():
+            # forked: the thread (and any lock it held) only exists in the parent process
+            self.reset()
+        future = Future()
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            self.pending.append((sentences, future))
+            self.pending_sentences += len(sentences)
+            self.stats['calls'] += 1
+            self.condition.notify()
+
+        embeddings = future.result()
+        return embeddings[0] if single else embeddings
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                deadline = time.monotonic() + self.wait_ms / 1000
+                while self.pending_sentences < self.max_batch_size and time.monotonic() < deadline:
+                    self.condition.wait(deadline - time.monotonic())
+                batch, self.pending, self.pending_sentences = self.pending, [], 0
+                self.stats['batches'] += 1
+
+            self.encode_batch(batch)
+
+    def encode_batch(self, batch):
+        try:
+            embeddings = np.asarray(self.model.encode([sentence for sentences, future in batch for sentence in sentences]))
+        except Exception as e:
+            for sentences, future in batch:
+                future.set_exception(e)
+            return
+
+        start = 0
+        for sentences, future in batch:
+            future.set_result(embeddings[start:start + len(sentences)])
+            start += len(sentences)
+        self.stats['sentences'] += start
@@ -0,0 +1,426 @@
+import collections
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from statistics import mean
+
+from compiled_functions import (add_output_data, get_feature_dict,
+                                get_flag_score_prediction,
+                                get_n_avg_containment_scores, load_s3_model,
+                                one_one_matching_texts, read_content_index,
+                                read_s3_df, read_s3_pdf, resolve_doc_name,
+                                s3_bucket, s3_content_index_filepath,
+                                s3_output_data_filepath,
+                                s3_webis_data_filepath)
+
+######## CONFIGURATIONS ########
+
+job_queue_path = os.environ.get('JOB_QUEUE_PATH') # required for asynchronous jobs: a SQLite file on the local disk of the one host running the submit & worker processes, or ':memory:' for a local in-process queue
+job_chunk_size = int(os.environ.get('JOB_CHUNK_SIZE', 10)) # number of source documents per task
+job_local_workers = int(os.environ.get('JOB_LOCAL_WORKERS', 0)) # number of in-process worker threads started on submit
+job_time_margin_ms = 30000 # stop claiming tasks when less time than this is left in the worker invocation
+job_task_timeout = 900 # seconds after which a running task whose worker died is queued again (Lambda's maximum timeout)
+
+
+######## JOB QUEUE ########
+
+class SQLiteJobQueue:
+    """
+    Job store & task queue for asynchronous 1-n matching, backed by SQLite.
+    A path of ':memory:' gives a local in-process queue; a file path lets several worker processes on the same host share
+    the queue. This is a single-host or local stand-in: SQLite's file locking is not reliable on network file systems
+    (NFS/EFS), where two workers could claim the same task or the database could be corrupted, so a deployment with
+    workers in several Lambda containers needs a queue service (e.g. SQS for the tasks and DynamoDB for the jobs)
+    implementing the same methods.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                user_id TEXT,
+                input_doc_name TEXT,
+                status TEXT,
+                created_at REAL,
+                completed_at REAL,
+                tasks_total INTEGER,
+                result TEXT
+            );
+            CREATE TABLE IF NOT EXISTS tasks (
+                job_id TEXT,
+                task_index INTEGER,
+                start_row INTEGER,
+                end_row INTEGER,
+                status TEXT,
+                claimed_at REAL,
+                result TEXT,
+                error TEXT,
+                PRIMARY KEY (job_id, task_index)
+            );
+            CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status);
+        """)
+
+    def create_job(self, job_id, user_id, input_doc_name, row_ranges):
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            self.conn.execute('INSERT INTO jobs VALUES (?, ?, ?, ?, ?, NULL, ?, NULL)',
+                              (job_id, user_id, input_doc_name, 'queued', time.time(), len(row_ranges)))
+            self.conn.executemany('INSERT INTO tasks VALUES (?, ?, ?, ?, ?, NULL, NULL, NULL)',
+                                  [(job_id, i, start, end, 'queued') for i, (start, end) in enumerate(row_ranges)])
+            self.conn.execute('COMMIT')
+
+    def claim_task(self):
+        """
+        Atomically marks the oldest queued task as running and returns it, or returns None if the queue is empty.
+        Tasks left running by a worker that died are queued again first.
+        """
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            self.conn.execute("UPDATE tasks SET status = 'queued' WHERE status = 'running' AND claimed_at < ?",
+                              (time.time() - job_task_timeout,))
+            row = self.conn.execute("""
+                SELECT tasks.* FROM tasks JOIN jobs ON tasks.job_id = jobs.job_id
+                WHERE tasks.status = 'queued' ORDER BY jobs.created_at, tasks.task_index LIMIT 1
+            """).fetchone()
+            if row is None:
+                self.conn.execute('COMMIT')
+                return None
+            self.conn.execute("UPDATE tasks SET status = 'running', claimed_at = ? WHERE job_id = ? AND task_index = ?",
+                              (time.time(), row['job_id'], row['task_index']))
+            self.conn.execute("UPDATE jobs SET status = 'running' WHERE job_id = ? AND status = 'queued'", (row['job_id'],))
+            self.conn.execute('COMMIT')
+            return dict(row)
+
+    def finish_task(self, job_id, task_index, result=None, error=None):
+        """
+        Stores the result (or error) of a task and returns the number of tasks of the job that are not finished yet.
+        """
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            self.conn.execute('UPDATE tasks SET status = ?, result = ?, error = ? WHERE job_id = ? AND task_index = ?',
+                              ('failed' if error is not None else 'done', result, error, job_id, task_index))
+            remaining = self.conn.execute("SELECT COUNT(*) FROM tasks WHERE job_id = ? AND status IN ('queued', 'running')",
+                                          (job_id,)).fetchone()[0]
+            self.conn.execute('COMMIT')
+            return remaining
+
+    def complete_job(self, job_id, result, status='complete'):
+        """
+        Stores the result of a job whose tasks have all finished, with its final status ('complete', 'partial' or 'failed').
+        """
+        with self.lock:
+            self.conn.execute('UPDATE jobs SET status = ?, completed_at = ?, result = ? WHERE job_id = ?',
+                              (status, time.time(), result, job_id))
+
+    def get_job(self, job_id):
+        """
+        Returns the job and its tasks (in task order), or None if the job does not exist.
+        """
+        with self.lock:
+            job = self.conn.execute('SELECT * FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+            if job is None:
+                return None
+            tasks = self.conn.execute('SELECT * FROM tasks WHERE job_id = ? ORDER BY task_index', (job_id,)).fetchall()
+        job = dict(job)
+        job['tasks'] = [dict(task) for task in tasks]
+        return job
+
+
+job_queues = {}
+
+def get_job_queue(path=None):
+    """
+    Returns the job queue at the given path (default job_queue_path), opened once per process.
+    Raises a ValueError if no path is configured, rather than defaulting to a file on the container's own disk (e.g. /tmp)
+    that workers running in other containers would never see.
+    """
+    path = path or job_queue_path
+    if not path:
+        raise ValueError("Asynchronous 1-n jobs are not configured: set JOB_QUEUE_PATH to a SQLite file on the local disk of "
+                         "the host running the submit & worker processes, or to ':memory:' with JOB_LOCAL_WORKERS for a local in-process queue.")
+    if path not in job_queues:
+        job_queues[path] = SQLiteJobQueue(path)
+    return job_queues[path]
+
+
+######## WORKER CACHES ########
+
+# documents database, input documents & models are loaded once per worker process, and shared by its worker threads
+worker_cache = {}
+worker_cache_lock = threading.Lock()
+
+def get_cached_corpus(min_rows=0):
+    """
+    Returns the documents database, reloading it if it has fewer rows than a task needs (i.e. documents were uploaded since it was loaded).
+    """
+    corpus = worker_cache.get('corpus')
+    if corpus is None or len(corpus) < min_rows:
+        corpus = read_s3_df(s3_bucket, s3_webis_data_filepath)
+        worker_cache['corpus'] = corpus
+    return corpus
+
+def get_cached_input_doc(input_doc_name):
+    """
+    Returns the input document & its canonical name, keyed by name so that worker threads of different jobs never get each
+    other's document. The most recent input documents are kept, one per local worker thread.
+    """
+    with worker_cache_lock:
+        input_docs = worker_cache.setdefault('input_docs', collections.OrderedDict())
+        if input_doc_name in input_docs:
+            input_docs.move_to_end(input_doc_name)
+        else:
+            canonical_doc_name = resolve_doc_name(input_doc_name, read_content_index(s3_bucket, s3_content_index_filepath))
+            input_docs[input_doc_name] = (read_s3_pdf(s3_bucket, input_doc_name), canonical_doc_name)
+            while len(input_docs) > max(job_local_workers, 1):
+                input_docs.popitem(last=False)
+        return input_docs[input_doc_name]
+
+def get_cached_model(model_name):
+    key = ('model', model_name)
+    with worker_cache_lock:
+        if key not in worker_cache:
+            worker_cache[key] = load_s3_model(s3_bucket, model_name)
+        return worker_cache[key]
+
+
+######## ASYNCHRONOUS 1-MANY MATCHING FUNCTIONS ########
+
+def to_json(data):
+    """
+    Serialises task results, converting NumPy scalars to Python numbers.
+    """
+    return json.dumps(data, default=lambda value: value.item() if hasattr(value, 'item') else str(value))
+
+def submit_one_many_job(user_id, input_doc_name, chunk_size=job_chunk_size, queue=None):
+    """
+    Submits an asynchronous 1-n matching job over the whole documents database, split into tasks of chunk_size source documents.
+
+    Args:
+        user_id (str): User ID.
+        input_doc_name (str): Name of input document.
+        chunk_size (int): Number of source documents per task.
+        queue (SQLiteJobQueue): Job queue. Defaults to the queue at job_queue_path.
+
+    Returns:
+        job_id (str): ID to poll the job with.
+    """
+    queue = queue or get_job_queue()
+    worker_cache['corpus'] = read_s3_df(s3_bucket, s3_webis_data_filepath)
+    corpus_rows = len(worker_cache['corpus'])
+    row_ranges = [(start, min(start + chunk_size, corpus_rows)) for start in range(0, corpus_rows, chunk_size)]
+    job_id = uuid.uuid4().hex
+    queue.create_job(job_id, user_id, input_doc_name, row_ranges)
+
+    if len(row_ranges) == 0:
+        queue.complete_job(job_id, to_json({'input_doc_name': input_doc_name, 'plagiarism_flag': 0, 'plagiarism_score': 0.0, 'plagiarised_text': []}))
+
+    return job_id
+
+def process_task(task, sentbert_model_name, ngrams_lst):
+    """
+    Scores the input document of a task's job against the task's slice of the documents database.
+
+    Args:
+        task (dict): Claimed task.
+        sentbert_model_name (str): Filepath of trained Sentence Transformer model.
+        ngrams_lst (lst): List of selected n_grams used to generate containment scores.
+
+    Returns:
+        source_results (list[dict]): Matching texts & features for each source document in the slice.
+    """
+    input_doc_name = task['input_doc_name']
+    input_doc, canonical_doc_name = get_cached_input_doc(input_doc_name)
+    sentence_trans_model = get_cached_model(sentbert_model_name)
+    corpus = get_cached_corpus(min_rows=task['end_row'])
+    source_results = []
+
+    for index, row in corpus.iloc[task['start_row']:task['end_row']].iterrows():
+        if row['file_num'] in [input_doc_name, canonical_doc_name]:
+            continue
+        plagiarised_text, direct_avg_score, paraphrase_avg_score, containment_scores, lcm_score = one_one_matching_texts(sentbert_model_name, ngrams_lst, row['text'], row['file_num'], input_doc, sentence_trans_model)
+        source_results.append({'source_doc_name': row['file_num'],
+                               'plagiarised_text': plagiarised_text,
+                               'direct_avg_score': direct_avg_score,
+                               'paraphrase_avg_score': paraphrase_avg_score,
+                               'containment_scores': containment_scores,
+                               'lcm_score': lcm_score})
+
+    return source_results
+
+def get_job_source_results(job):
+    """
+    Returns the per-source results of all finished tasks of a job, in corpus order.
+    """
+    return [source_result for task in job['tasks'] if task['status'] == 'done' for source_result in json.loads(task['result'])]
+
+def get_running_features(source_results, ngrams_lst):
+    """
+    Returns the 1-n features averaged over the source documents processed so far, or None if none have been processed.
+
+    Args:
+        source_results (list[dict]): Per-source results of finished tasks.
+        ngrams_lst (lst): List of selected n_grams used to generate containment scores.
+
+    Returns:
+        features (dict): Average containment scores, LCS, direct & paraphrase scores.
+    """
+    if len(source_results) == 0:
+        return None
+
+    features = get_n_avg_containment_scores([source_result['containment_scores'] for source_result in source_results], ngrams_lst)
+    features['lcs_word'] = mean(source_result['lcm_score'] for source_result in source_results)
+    features['direct_avg_score'] = mean(source_result['direct_avg_score'] for source_result in source_results)
+    features['paraphrase_avg_score'] = mean(source_result['paraphrase_avg_score'] for source_result in source_results)
+
+    return features
+
+def get_failed_tasks(job):
+    """
+    Returns the index, source document rows & error of each failed task of a job.
+    """
+    return [{'task_index': task['task_index'], 'start_row': task['start_row'], 'end_row': task['end_row'], 'error': task['error']}
+            for task in job['tasks'] if task['status'] == 'failed']
+
+def get_final_job_status(job):
+    """
+    Returns the status of a job whose tasks have all finished: 'complete' if none failed, 'failed' if all failed, else 'partial'.
+    """
+    failed_tasks = get_failed_tasks(job)
+    if len(failed_tasks) == 0:
+        return 'complete'
+    return 'failed' if len(failed_tasks) == len(job['tasks']) else 'partial'
+
+def finalise_job(queue, job_id, final_model_name, ngrams_lst):
+    """
+    Runs the final model on the averaged features of a job whose tasks have all finished, and stores & records the response.
+    If some tasks failed, the job is 'partial' and its response is flagged as partial and lists the failed tasks, with the
+    flag & score computed over the source documents that were processed. If all tasks failed, the job is 'failed' and
+    nothing is recorded.
+    """
+    job = queue.get_job(job_id)
+    status = get_final_job_status(job)
+    if status == 'failed':
+        response = {'input_doc_name': job['input_doc_name'], 'failed_tasks': get_failed_tasks(job)}
+        queue.complete_job(job_id, to_json(response), status)
+        return response
+
+    source_results = get_job_source_results(job)
+    features = get_running_features(source_results, ngrams_lst)
+    plagiarism_flag, plagiarism_score = 0, 0.0
+
+    if features is not None:
+        final_features = get_feature_dict({f"c_{ngram}": features[f"c_{ngram}"] for ngram in ngrams_lst},
+                                          features['lcs_word'], features['direct_avg_score'], features['paraphrase_avg_score'])
+        plagiarism_flag, plagiarism_score = get_flag_score_prediction(final_model_name, final_features)
+
+    response = {'input_doc_name': job['input_doc_name'],
+                'plagiarism_flag': plagiarism_flag,
+                'plagiarism_score': plagiarism_score,
+                'plagiarised_text': [match for source_result in source_results for match in source_result['plagiarised_text']]}
+    if status == 'partial':
+        response['partial'] = True
+        response['failed_tasks'] = get_failed_tasks(job)
+
+    queue.complete_job(job_id, to_json(response), status)
+    add_output_data(job['user_id'], job['input_doc_name'], response, "1-n", s3_bucket, s3_output_data_filepath, 'all')
+
+    return response
+
+def process_next_task(sentbert_model_name, final_model_name, ngrams_lst, queue=None):
+    """
+    Claims and processes the next queued task, finalising its job if it was the last one.
+
+    Returns:
+        processed (bool): False if there was no queued task.
+    """
+    queue = queue or get_job_queue()
+    task = queue.claim_task()
+    if task is None:
+        return False
+
+    job = queue.get_job(task['job_id'])
+    task['input_doc_name'] = job['input_doc_name']
+    try:
+        remaining = queue.finish_task(task['job_id'], task['task_index'], result=to_json(process_task(task, sentbert_model_name, ngrams_lst)))
+    except Exception as e:
+        remaining = queue.finish_task(task['job_id'], task['task_index'], error=str(e))
+
+    if remaining == 0:
+        finalise_job(queue, task['job_id'], final_model_name, ngrams_lst)
+
+    return True
+
+def run_worker(sentbert_model_name, final_model_name, ngrams_lst, queue=None, context=None):
+    """
+    Processes queued tasks until the queue is empty or, inside Lambda, until the invocation is about to time out.
+
+    Returns:
+        processed_tasks (int): Number of tasks processed.
+    """
+    processed_tasks = 0
+
+    while context is None or context.get_remaining_time_in_millis() > job_time_margin_ms:
+        if not process_next_task(sentbert_model_name, final_model_name, ngrams_lst, queue):
+            break
+        processed_tasks += 1
+
+    return processed_tasks
+
+def start_local_workers(sentbert_model_name, final_model_name, ngrams_lst, n_workers=job_local_workers, queue=None):
+    """
+    Starts in-process worker threads that drain the queue in the background.
+    """
+    threads = [threading.Thread(target=run_worker, args=(sentbert_model_name, final_model_name, ngrams_lst, queue), daemon=True)
+               for _ in range(n_workers)]
+    for thread in threads:
+        thread.start()
+
+    return threads
+
+def get_job_progress(job_id, ngrams_lst, queue=None):
+    """
+    Returns the progress of an asynchronous 1-n matching job: matches found so far, sources processed and running feature averages,
+    plus the final plagiarism flag & score once the job is complete (or partial, i.e. some of its tasks failed).
+
+    Args:
+        job_id (str): ID returned on submit.
+        ngrams_lst (lst): List of selected n_grams used to generate containment scores.
+        queue (SQLiteJobQueue): Job queue. Defaults to the queue at job_queue_path.
+
+    Returns:
+        progress (dict): Job progress, or None if the job does not exist.
+    """
+    queue = queue or get_job_queue()
+    job = queue.get_job(job_id)
+    if job is None:
+        return None
+
+    finished_tasks = [task for task in job['tasks'] if task['status'] in ['done', 'failed']]
+    source_results = get_job_source_results(job)
+
+    progress = {'job_id': job_id,
+                'status': job['status'],
+                'input_doc_name': job['input_doc_name'],
+                'tasks_total': job['tasks_total'],
+                'tasks_processed': len(finished_tasks),
+                'sources_total': job['tasks'][-1]['end_row'] if job['tasks'] else 0,
+                'sources_processed': sum(task['end_row'] - task['start_row'] for task in finished_tasks),
+                'failed_tasks': get_failed_tasks(job),
+                'running_features': get_running_features(source_results, ngrams_lst),
+                'plagiarised_text': [match for source_result in source_results for match in source_result['plagiarised_text']]}
+
+    if job['status'] in ['complete', 'partial']:
+        result = json.loads(job['result'])
+        progress['plagiarism_flag'] = result['plagiarism_flag']
+        progress['plagiarism_score'] = result['plagiarism_score']
+        if job['status'] == 'partial':
+            progress['partial'] = True
+
+    return progress
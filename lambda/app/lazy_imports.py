@@ -0,0 +1,25 @@
+import importlib
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is only imported on first attribute access, so that Lambda handlers which never use a
+    heavy dependency (e.g. pandas or scikit-learn for file uploads) do not pay for importing it at cold start.
+
+    Usage:
+        np = LazyModule('numpy')
+        np.zeros(3) # numpy is imported here
+    """
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self._name)
+
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}'{'' if self._module is None else ' (imported)'}>"
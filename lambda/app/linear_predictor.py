@@ -0,0 +1,108 @@
+"""
+NumPy-only inference for the final model, from its exported coefficient file.
+
+The final model is a linear classifier over six features, so predicting is a dot product and a sigmoid. The coefficient
+file is a small JSON document written next to the pickled model by the custom-ml training job and the online update:
+    {"format_version": 1, "model_type": "LogisticRegression", "feature_names": ["c_1", ...], "coef": [...],
+     "intercept": -1.2, "classes": [0, 1], "model_sha256": "...", ...}
+model_sha256 is the hash of the pickled model file it was exported from: the Lambda only scores with the coefficient
+file while it matches the final model in S3 (see compiled_functions.get_final_model_coefficients).
+Predictions match the scikit-learn model's predict & predict_proba, without loading scikit-learn or pandas.
+"""
+import json
+
+from lazy_imports import LazyModule
+
+np = LazyModule('numpy')
+
+coefficients_format_version = 1 # bump when the coefficient file changes incompatibly
+
+
+class LinearPredictor:
+    """
+    Binary linear classifier with a logistic link, scoring one or many feature vectors in a single vectorised call.
+    """
+
+    def __init__(self, feature_names, coef, intercept, classes=(0, 1), metadata=None):
+        self.feature_names = list(feature_names)
+        self.coef = np.asarray(coef, dtype=np.float64).ravel()
+        self.intercept = float(intercept)
+        self.classes = np.asarray(classes)
+        self.metadata = metadata or {}
+        if len(self.coef) != len(self.feature_names) or len(self.classes) != 2:
+            raise ValueError(f'Expected {len(self.feature_names)} coefficients and 2 classes, got {len(self.coef)} and {len(self.classes)}')
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Returns the predictor of a parsed coefficient file.
+        """
+        if data.get('format_version') != coefficients_format_version:
+            raise ValueError(f"Unsupported coefficient file format version {data.get('format_version')!r}")
+        metadata = {key: value for key, value in data.items() if key not in ['feature_names', 'coef', 'intercept', 'classes']}
+
+        return cls(data['feature_names'], data['coef'], data['intercept'], data['classes'], metadata)
+
+    @classmethod
+    def load(cls, f):
+        """
+        Returns the predictor of a coefficient file, given as a binary file object.
+        """
+        return cls.from_dict(json.load(f))
+
+    @classmethod
+    def from_model(cls, model, feature_names=None):
+        """
+        Returns the predictor of a fitted binary scikit-learn linear classifier (or a GridSearchCV of one).
+        Feature names default to those the model was fitted with.
+        """
+        model = getattr(model, 'best_estimator_', model)
+        if feature_names is None:
+            feature_names = list(model.feature_names_in_)
+
+        return cls(feature_names, model.coef_[0], model.intercept_[0], model.classes_, {'model_type': type(model).__name__})
+
+    def to_dict(self):
+        """
+        Returns the content of the predictor's coefficient file.
+        """
+        return dict(self.metadata,
+                    format_version=coefficients_format_version,
+                    feature_names=self.feature_names,
+                    coef=self.coef.tolist(),
+                    intercept=self.intercept,
+                    classes=self.classes.tolist())
+
+    def get_feature_matrix(self, X):
+        """
+        Returns the feature matrix of X in the predictor's feature order. X is a dict of features (one row), a list of
+        dicts, a DataFrame with the feature columns, or an array of shape (n_features,) or (n_rows, n_features).
+        """
+        if isinstance(X, dict):
+            X = [X]
+        if isinstance(X, list) and len(X) > 0 and isinstance(X[0], dict):
+            return np.array([[row[name] for name in self.feature_names] for row in X], dtype=np.float64)
+        if hasattr(X, 'columns'):
+            return X[self.feature_names].to_numpy(dtype=np.float64)
+
+        return np.atleast_2d(np.asarray(X, dtype=np.float64))
+
+    def decision_function(self, X):
+        return self.get_feature_matrix(X) @ self.coef + self.intercept
+
+    def predict(self, X):
+        """
+        Returns the predicted class and the probability of the positive class of every row of X, as scikit-learn's
+        predict & predict_proba(X)[:, 1] would.
+
+        Returns:
+            flags (arr): Predicted class of each row.
+            scores (arr): Probability of each row being in classes[1].
+        """
+        decision = self.decision_function(X)
+        # numerically stable logistic function
+        exp = np.exp(-np.abs(decision))
+        scores = np.where(decision >= 0, 1 / (1 + exp), exp / (1 + exp))
+        flags = self.classes[(decision > 0).astype(int)]
+
+        return flags, scores
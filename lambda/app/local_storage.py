@@ -0,0 +1,129 @@
+import datetime
+import hashlib
+import os
+import shutil
+import threading
+
+
+class LocalStreamingBody:
+    """
+    File-backed stand-in for the streaming body of an S3 get_object response.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+
+    def read(self, amt=None):
+        data = self.file.read(-1 if amt is None else amt)
+        if amt is None or len(data) == 0:
+            self.file.close()
+        return data
+
+    def iter_chunks(self, chunk_size=1024):
+        with self.file:
+            for chunk in iter(lambda: self.file.read(chunk_size), b''):
+                yield chunk
+
+    def close(self):
+        self.file.close()
+
+
+class ClientError(Exception):
+    """
+    Stand-in for botocore.exceptions.ClientError, with the error code S3 returns in response['Error']['Code'].
+    """
+
+    def __init__(self, error_response, operation_name):
+        self.response = error_response
+        self.operation_name = operation_name
+        super().__init__(f"An error occurred ({error_response['Error']['Code']}) when calling the {operation_name} operation: {error_response['Error'].get('Message', '')}")
+
+
+class LocalS3Client:
+    """
+    Stand-in for the subset of the boto3 S3 client used by the app, storing objects as files under root_dir/<bucket>/<key>.
+    Used for on-prem & local runs with LOCAL_STORAGE_DIR set.
+    """
+
+    class exceptions:
+        class NoSuchKey(ClientError):
+            pass
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+
+    def get_path(self, Bucket, Key):
+        return os.path.join(self.root_dir, Bucket, Key)
+
+    def head_object(self, Bucket, Key, **kwargs):
+        path = self.get_path(Bucket, Key)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            raise ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, 'HeadObject')
+        etag = hashlib.md5(f'{stat.st_mtime_ns}:{stat.st_size}'.encode('utf-8')).hexdigest()
+        return {'ETag': f'"{etag}"',
+                'ContentLength': stat.st_size,
+                'LastModified': datetime.datetime.fromtimestamp(stat.st_mtime, datetime.timezone.utc)}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        try:
+            head = self.head_object(Bucket, Key)
+        except ClientError:
+            raise self.exceptions.NoSuchKey({'Error': {'Code': 'NoSuchKey', 'Message': f'{Bucket}/{Key} does not exist.'}}, 'GetObject')
+        return dict(head, Body=LocalStreamingBody(self.get_path(Bucket, Key)))
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        if isinstance(Body, str):
+            Body = Body.encode('utf-8')
+        path = self.get_path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            if isinstance(Body, bytes):
+                f.write(Body)
+            else:
+                shutil.copyfileobj(Body, f)
+        os.replace(tmp_path, path)
+        return self.head_object(Bucket, Key)
+
+    def list_objects_v2(self, Bucket, Prefix='', StartAfter='', ContinuationToken=None, MaxKeys=1000, **kwargs):
+        """
+        Lists the keys starting with Prefix after StartAfter (or the ContinuationToken of the previous page) in
+        lexicographic order, MaxKeys at a time. Files of writes in progress (see put_object) are left out.
+        """
+        bucket_dir = os.path.join(self.root_dir, Bucket)
+        after = ContinuationToken or StartAfter
+        keys = []
+        for dirpath, _, filenames in os.walk(os.path.join(bucket_dir, os.path.dirname(Prefix))):
+            for filename in filenames:
+                key = os.path.relpath(os.path.join(dirpath, filename), bucket_dir).replace(os.sep, '/')
+                if key.startswith(Prefix) and key > after and not filename.endswith('.tmp'):
+                    keys.append(key)
+        keys.sort()
+
+        response = {'KeyCount': min(len(keys), MaxKeys), 'IsTruncated': len(keys) > MaxKeys}
+        if keys:
+            response['Contents'] = [{'Key': key, 'Size': os.path.getsize(self.get_path(Bucket, key))} for key in keys[:MaxKeys]]
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = keys[MaxKeys - 1]
+        return response
+
+    def upload_file(self, Filename, Bucket, Key, **kwargs):
+        with open(Filename, 'rb') as f:
+            self.put_object(Bucket, Key, f)
+        return None
+
+
+class LocalBoto3:
+    """
+    Stand-in for the boto3 module whose S3 clients read & write local files (see LocalS3Client).
+    """
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+
+    def client(self, service_name, *args, **kwargs):
+        if service_name != 's3':
+            raise ValueError(f'Local storage only supports s3, not {service_name}')
+        return LocalS3Client(self.root_dir)
@@ -0,0 +1,337 @@
+"""
+Per-request stage timings & counters, emitted as one CloudWatch Embedded Metric Format (EMF) log line per request.
+
+Handlers decorated with instrument_handler collect the metrics of a request: the stages of compiled_functions are
+timed with the timed decorator or the timer context manager, and counts (sentences, source documents, cache hits) are
+recorded with count & set_value. When the handler returns, one JSON line is printed, which CloudWatch Logs turns into
+metrics in metrics_namespace with the function name as dimension, e.g.
+    {"_aws": {"Timestamp": 1700000000000, "CloudWatchMetrics": [{"Namespace": "PlagiarismDetector",
+     "Dimensions": [["function"]], "Metrics": [{"Name": "matcher_ms", "Unit": "Milliseconds"}, ...]}]},
+     "function": "plagiarism_detector_1ton", "request_id": "...", "status_code": 200, "total_ms": 812.4,
+     "matcher_ms": 301.2, "input_sentences": 48, "sources": 2, ...}
+Outside an instrumented request (or with METRICS=0) timers and counters do nothing. parse_metrics_line reads the
+lines back, e.g. in metrics_collector.py.
+
+With MEMORY_PROFILE=1, or for a request with an X-Profile-Memory: 1 header or a "profile_memory": true body field, the
+peak memory traced by tracemalloc is recorded as well: <stage>_peak_mb for every timed stage (e.g. pdf_parse,
+text_construction, count_vectors, bert_encoding), peak_mb for the whole request and max_rss_mb for the process, along
+with the largest allocation sites (the top_allocations log field).
+"""
+import contextvars
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+######## CONFIGURATIONS ########
+
+metrics_enabled = os.environ.get('METRICS', '1') == '1' # emit one EMF log line per request
+metrics_namespace = os.environ.get('METRICS_NAMESPACE', 'PlagiarismDetector') # CloudWatch namespace of the metrics
+duration_suffix = '_ms' # stage durations are emitted as <stage>_ms
+memory_profile_enabled = os.environ.get('MEMORY_PROFILE', '0') == '1' # profile the memory of every request, not only of those asking for it
+memory_profile_frames = int(os.environ.get('MEMORY_PROFILE_FRAMES', '1')) # frames of the traceback stored per allocation
+memory_profile_top_sites = int(os.environ.get('MEMORY_PROFILE_TOP_SITES', '10')) # allocation sites logged per profiled request
+memory_suffix = '_peak_mb' # stage memory peaks are emitted as <stage>_peak_mb
+
+# metrics of the request being handled in the current thread, None outside instrumented requests
+current_metrics = contextvars.ContextVar('current_metrics', default=None)
+
+
+######## MEMORY PROFILE ########
+
+class MemoryProfile:
+    """
+    Peak memory traced by tracemalloc during each stage of a request (above the traced memory when the stage started),
+    and the largest allocation sites at the end of the stage with the most traced memory.
+    tracemalloc is started for the request (unless already tracing) and slows allocations down while it runs. It traces
+    the whole process, so concurrent requests inflate each other's peaks, and memory allocated outside of Python's
+    allocators (e.g. PyTorch tensors) or in worker processes is not traced: max_rss_mb covers the process as a whole.
+    Without tracemalloc.reset_peak (Python < 3.9), the peak of a stage that stays below an earlier peak of the request
+    is only known from the traced memory at its end.
+    """
+    snapshot_growth = 1.1 # traced memory growth over the last snapshot of allocation sites before another is taken
+
+    def __init__(self):
+        self.started = not tracemalloc.is_tracing()
+        if self.started:
+            tracemalloc.start(memory_profile_frames)
+        self.stack = [] # [stage, traced bytes at start, highest traced bytes, tracemalloc peak at start] of the open stages
+        self.enter(None)
+        self.peaks = {} # stage -> peak bytes
+        self.request_peak = 0
+        self.snapshot_bytes = self.stack[0][1] # traced bytes at the last snapshot of allocation sites
+        self.top_sites = []
+
+    def observe(self):
+        """
+        Adds the traced memory since the innermost open stage started (or tracemalloc's peak was last reset) to its highest.
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        if self.stack:
+            frame = self.stack[-1]
+            frame[2] = max(frame[2], peak if peak > frame[3] else current)
+        return current
+
+    def enter(self, stage):
+        current = self.observe()
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        self.stack.append([stage, current, current, tracemalloc.get_traced_memory()[1]])
+
+    def exit(self):
+        current = self.observe()
+        stage, start, highest, _ = self.stack.pop()
+        self.peaks[stage] = max(self.peaks.get(stage, 0), highest - start)
+        self.stack[-1][2] = max(self.stack[-1][2], highest)
+        if current > self.snapshot_bytes * self.snapshot_growth:
+            self.snapshot_bytes = current
+            self.top_sites = get_top_allocation_sites(tracemalloc.take_snapshot(), memory_profile_top_sites)
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak() # the snapshot's own allocations are not counted in the enclosing stage
+                self.stack[-1][3] = tracemalloc.get_traced_memory()[1]
+
+    def stop(self):
+        """
+        Closes the profile at the end of the request, and stops tracemalloc if it was started for it.
+        """
+        self.observe()
+        self.request_peak = self.stack[0][2] - self.stack[0][1]
+        if self.started:
+            tracemalloc.stop()
+
+    def get_values(self):
+        """
+        Returns the memory metrics of the request in MB: <stage>_peak_mb, peak_mb & max_rss_mb.
+        """
+        values = {f'{stage}{memory_suffix}': round(peak / 2 ** 20, 3) for stage, peak in self.peaks.items()}
+        values['peak_mb'] = round(self.request_peak / 2 ** 20, 3)
+        if resource is not None:
+            max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss # bytes on macOS
+            values['max_rss_mb'] = round(max_rss_kb / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10), 3)
+
+        return values
+
+
+def get_top_allocation_sites(snapshot, n):
+    """
+    Returns the n source lines with the most traced memory in a tracemalloc snapshot, as {site, mb, blocks} dictionaries.
+    """
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                       tracemalloc.Filter(False, '<frozen importlib._bootstrap*>')])
+    sites = []
+    for statistic in snapshot.statistics('lineno')[:n]:
+        frame = statistic.traceback[0]
+        filename = os.path.join(*frame.filename.split(os.sep)[-2:]) if os.sep in frame.filename else frame.filename
+        sites.append({'site': f'{filename}:{frame.lineno}', 'mb': round(statistic.size / 2 ** 20, 3), 'blocks': statistic.count})
+
+    return sites
+
+
+######## REQUEST METRICS ########
+
+class RequestMetrics:
+    """
+    Stage durations, counters & properties of one request.
+    """
+
+    def __init__(self, function_name, request_id=None):
+        self.function_name = function_name
+        self.request_id = request_id
+        self.start = time.perf_counter()
+        self.durations = {} # stage -> total ms
+        self.counters = {} # name -> count
+        self.properties = {} # name -> value, logged but not emitted as metrics
+        self.active_stages = set() # stages being timed, so that nested calls of a stage are only counted once
+        self.memory = None # MemoryProfile of a profiled request
+
+    def add_duration(self, stage, ms):
+        self.durations[stage] = self.durations.get(stage, 0.0) + ms
+
+    def get_emf(self, timestamp_ms=None):
+        """
+        Returns the EMF log record of the request: durations & counters as metrics, properties as log fields.
+        """
+        metric_values = {f'{stage}{duration_suffix}': round(ms, 3) for stage, ms in self.durations.items()}
+        metric_values[f'total{duration_suffix}'] = round((time.perf_counter() - self.start) * 1000, 3)
+        metric_definitions = [{'Name': name, 'Unit': 'Milliseconds'} for name in metric_values]
+        metric_definitions += [{'Name': name, 'Unit': 'Count'} for name in self.counters]
+        memory_values, properties = {}, dict(self.properties)
+        if self.memory is not None:
+            memory_values = self.memory.get_values()
+            metric_definitions += [{'Name': name, 'Unit': 'Megabytes'} for name in memory_values]
+            properties['top_allocations'] = self.memory.top_sites
+
+        return {'_aws': {'Timestamp': int(timestamp_ms if timestamp_ms is not None else time.time() * 1000),
+                         'CloudWatchMetrics': [{'Namespace': metrics_namespace,
+                                                'Dimensions': [['function']],
+                                                'Metrics': metric_definitions}]},
+                'function': self.function_name,
+                'request_id': self.request_id,
+                **properties,
+                **metric_values,
+                **self.counters,
+                **memory_values}
+
+
+class timer:
+    """
+    Context manager adding the time spent in its block to a stage of the current request's metrics.
+    """
+    __slots__ = ('stage', 'metrics', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.metrics = None
+
+    def __enter__(self):
+        metrics = current_metrics.get()
+        if metrics is not None and self.stage not in metrics.active_stages:
+            metrics.active_stages.add(self.stage)
+            self.metrics = metrics
+            if metrics.memory is not None:
+                metrics.memory.enter(self.stage)
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.metrics is not None:
+            self.metrics.add_duration(self.stage, (time.perf_counter() - self.start) * 1000)
+            if self.metrics.memory is not None:
+                self.metrics.memory.exit()
+            self.metrics.active_stages.discard(self.stage)
+            self.metrics = None
+        return False
+
+
+def timed(stage):
+    """
+    Decorator adding the time spent in every call of the function to a stage of the current request's metrics.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return function(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def count(name, value=1):
+    """
+    Adds value to a counter of the current request's metrics (e.g. result cache hits).
+    """
+    metrics = current_metrics.get()
+    if metrics is not None:
+        metrics.counters[name] = metrics.counters.get(name, 0) + value
+
+
+def set_value(name, value):
+    """
+    Sets a count of the current request's metrics (e.g. the number of source documents).
+    """
+    metrics = current_metrics.get()
+    if metrics is not None:
+        metrics.counters[name] = value
+
+
+def set_property(name, value):
+    """
+    Sets a log field of the current request's metrics record, which is not emitted as a metric (e.g. the status code).
+    """
+    metrics = current_metrics.get()
+    if metrics is not None:
+        metrics.properties[name] = value
+
+
+def emit_metrics(metrics, stream=None):
+    """
+    Writes the EMF log record of the request metrics as one JSON line to stdout (the Lambda function's log).
+    """
+    stream = stream or sys.stdout
+    stream.write(json.dumps(metrics.get_emf(), default=str) + '\n')
+    stream.flush()
+
+
+def get_request_option(event, name):
+    """
+    Returns whether a request asks for an option, e.g. profile_memory: with an X-Profile-Memory header of 1 or true, or a
+    true profile_memory field of its JSON body.
+
+    Args:
+        event (dict): Lambda event of the request. Headers are read from event['headers'] (API Gateway proxy events) and
+            event['params']['header'] (the upload API's mapping template, with underscores in header names).
+        name (str): Option name.
+    """
+    if not isinstance(event, dict):
+        return False
+
+    header_names = {f"x-{name.replace('_', '-')}", f'x_{name}'}
+    headers = dict(event.get('headers') or {}, **(event.get('params') or {}).get('header', {}))
+    for header, value in headers.items():
+        if header.lower() in header_names:
+            return str(value).lower() in ['1', 'true']
+
+    body = event.get('body')
+    if isinstance(body, str):
+        if f'"{name}"' not in body: # most requests do not ask, and are not parsed again
+            return False
+        try:
+            body = json.loads(body)
+        except ValueError:
+            return False
+
+    return isinstance(body, dict) and body.get(name) is True
+
+
+def instrument_handler(handler):
+    """
+    Decorator of a Lambda handler (event, context) collecting the metrics of each request and emitting them when it returns.
+    """
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        if not metrics_enabled:
+            return handler(event, context)
+
+        metrics = RequestMetrics(handler.__name__, getattr(context, 'aws_request_id', None))
+        if memory_profile_enabled or get_request_option(event, 'profile_memory'):
+            metrics.memory = MemoryProfile()
+        token = current_metrics.set(metrics)
+        try:
+            response = handler(event, context)
+            if isinstance(response, dict) and 'statusCode' in response:
+                metrics.properties['status_code'] = response['statusCode']
+            return response
+        except Exception:
+            metrics.properties['status_code'] = 500
+            raise
+        finally:
+            current_metrics.reset(token)
+            if metrics.memory is not None:
+                metrics.memory.stop()
+            emit_metrics(metrics)
+
+    return wrapper
+
+
+def parse_metrics_line(line):
+    """
+    Returns the EMF record of a log line, or None if the line is not one. The JSON record may follow a log prefix
+    (e.g. the timestamp & request ID CloudWatch Logs adds).
+    """
+    start = line.find('{"_aws"')
+    if start == -1:
+        return None
+    try:
+        record = json.loads(line[start:])
+    except ValueError:
+        return None
+
+    return record if isinstance(record, dict) and 'CloudWatchMetrics' in record.get('_aws', {}) else None
@@ -0,0 +1,88 @@
+"""
+Lambda entry module of the POST /get_1ton_matches API (plagiarism_detector_1ton) and its asynchronous job workers (plagiarism_detector_1ton_worker).
+"""
+import json
+
+from compiled_functions import (add_output_data, final_model_name,
+                                get_one_many_matching_output,
+                                get_request_deadline, get_response_object,
+                                ngrams_lst, s3_bucket, s3_output_data_filepath,
+                                sentbert_model_name, warm_up_models,
+                                warm_up_models_on_init)
+from job_queue import (get_job_progress, job_local_workers, run_worker,
+                       start_local_workers, submit_one_many_job)
+from metrics import instrument_handler
+from sampling_profiler import profile_handler
+
+if warm_up_models_on_init:
+    warm_up_models(sentbert_model_name, final_model_name, ngrams_lst)
+
+@instrument_handler
+@profile_handler
+def plagiarism_detector_1ton(event, context):
+    """
+    Lambda function handler for the POST /get_1ton_matches API request.
+    With "mode": "async", the request is submitted as a job over the whole documents database and a job ID is returned;
+    requests with a "job_id" poll the job's progress and partial results.
+    Synchronous requests run within their time budget (see get_request_deadline) and may return partial results.
+    """
+    response_object = get_response_object()
+    try:
+        event_dict = json.dumps(event)
+        request_body = json.loads(event_dict)['body']
+
+        if 'job_id' in json.loads(request_body):
+            job_id = json.loads(request_body)['job_id']
+            response = get_job_progress(job_id, ngrams_lst)
+            if response is None:
+                response_object['statusCode'] = 404
+                response_object['body'] = f"Job {job_id} not found."
+                return response_object
+
+            response_object['statusCode'] = 200
+            response_object['body'] = json.dumps(response, default=str)
+            return response_object
+        
+        user_id = json.loads(request_body)['user_id']
+        input_doc_name = json.loads(request_body)['input_doc_name']
+        streaming = json.loads(request_body).get('streaming', False)
+        incremental = json.loads(request_body).get('incremental', True)
+
+        if json.loads(request_body).get('mode') == 'async':
+            job_id = submit_one_many_job(user_id, input_doc_name)
+            if job_local_workers > 0:
+                start_local_workers(sentbert_model_name, final_model_name, ngrams_lst)
+
+            response_object['statusCode'] = 202
+            response_object['body'] = json.dumps({'job_id': job_id, 'status': 'queued'})
+            return response_object
+
+        deadline = get_request_deadline(context, json.loads(request_body).get('time_budget_ms'))
+        response = get_one_many_matching_output(sentbert_model_name, final_model_name, ngrams_lst, input_doc_name, streaming, incremental=incremental, deadline=deadline)
+        add_output_data(user_id, input_doc_name, response, "1-n", s3_bucket, s3_output_data_filepath, 'all')
+
+        response_object['statusCode'] = 200
+        response_object['body'] = json.dumps(response, default=str)
+        
+    except KeyError as e:
+        response_object['statusCode'] = 400
+        response_object['body'] = f"Missing input keys, please check your API input. {str(e)}"
+
+    except Exception as e:
+        response_object['statusCode'] = 500
+        response_object['body'] = str(e)
+
+    return response_object
+
+@instrument_handler
+def plagiarism_detector_1ton_worker(event, context):
+    """
+    Lambda function handler for the asynchronous 1-n job workers, e.g. triggered on a schedule.
+    Processes queued source document chunks until the queue is empty or the invocation is about to time out.
+    """
+    processed_tasks = run_worker(sentbert_model_name, final_model_name, ngrams_lst, context=context)
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'processed_tasks': processed_tasks})
+    }
@@ -0,0 +1,57 @@
+"""
+Lambda entry module of the POST /get_1to1_matches API (plagiarism_detector_1to1).
+"""
+import json
+
+from compiled_functions import (add_output_data, final_model_name,
+                                get_one_one_matching_output,
+                                get_request_deadline, get_response_object,
+                                ngrams_lst, s3_bucket, s3_output_data_filepath,
+                                sentbert_model_name, warm_up_models,
+                                warm_up_models_on_init)
+from metrics import instrument_handler
+from sampling_profiler import profile_handler
+
+if warm_up_models_on_init:
+    warm_up_models(sentbert_model_name, final_model_name, ngrams_lst)
+
+@instrument_handler
+@profile_handler
+def plagiarism_detector_1to1(event, context):
+    """
+    Lambda function handler for the POST /get_1to1_matches API request.
+    The matching runs within the time budget of the request (see get_request_deadline) and may return partial results.
+    """
+    response_object = get_response_object()
+    try:
+        event_dict = json.dumps(event)
+        request_body = json.loads(event_dict)['body']
+        
+        user_id = json.loads(request_body)['user_id']
+        input_doc_name = json.loads(request_body)['input_doc_name']
+        source_doc_name = json.loads(request_body)['source_doc_name']
+        streaming = json.loads(request_body).get('streaming', False)
+        target = json.loads(request_body).get('target')
+        if target not in [None, 0, 1]:
+            response_object['statusCode'] = 400
+            response_object['body'] = f"target must be 0 or 1, not {target!r}."
+            return response_object
+
+        deadline = get_request_deadline(context, json.loads(request_body).get('time_budget_ms'))
+
+        response = get_one_one_matching_output(sentbert_model_name, final_model_name, ngrams_lst, source_doc_name, input_doc_name, streaming, deadline=deadline, target=target)
+
+        add_output_data(user_id, input_doc_name, response, "1-1", s3_bucket, s3_output_data_filepath, source_doc_name)
+
+        response_object['statusCode'] = 200
+        response_object['body'] = json.dumps(response, default=str)
+        
+    except KeyError as e:
+        response_object['statusCode'] = 400
+        response_object['body'] = f"Missing input keys, please check your API input. {str(e)}"
+
+    except Exception as e:
+        response_object['statusCode'] = 500
+        response_object['body'] = str(e)
+
+    return response_object
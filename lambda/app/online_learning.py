@@ -0,0 +1,203 @@
+"""
+Online updates of the final model between full retrains.
+
+Labelled 1-1 comparisons write their features as one object per row under the online feature prefix (see
+add_online_feature_row). Each update lists the rows written since the previous update and trains an SGDClassifier with
+log loss (an online logistic regression over the same six features) on them, in mini-batches with partial_fit, and publishes it as a new version of the final model:
+under online_models_filepath, and as final_model_name, with the coefficient file the matching handlers score with
+(see linear_predictor.py). If the final model was
+replaced since the last update (e.g. by a full SageMaker retrain), the online model restarts from its coefficients, so
+periodic full retrains recalibrate it.
+"""
+import copy
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from compiled_functions import (boto3, get_coefficients_filepath,
+                                get_file_sha256, get_s3_model_version,
+                                joblib, load_s3_model, np, pd, read_s3_json,
+                                s3_online_features_filepath, upload_to_s3,
+                                write_s3_json)
+from lazy_imports import LazyModule
+from linear_predictor import LinearPredictor
+
+sklearn_linear_model = LazyModule('sklearn.linear_model')
+
+######## CONFIGURATIONS ########
+
+online_model_state_filepath = 'plagiarism-detector/models/online_model_state.json'
+online_models_filepath = 'plagiarism-detector/models/online' # every published model is kept as <dir>/final_model_v<version>.joblib, with its coefficient file
+online_batch_size = int(os.environ.get('ONLINE_BATCH_SIZE', 32)) # number of feature rows per partial_fit call
+online_learning_rate = float(os.environ.get('ONLINE_LEARNING_RATE', 0.01)) # constant SGD learning rate, small so that new rows nudge rather than replace the retrained coefficients
+online_alpha = float(os.environ.get('ONLINE_ALPHA', 0.0001)) # L2 regularisation strength
+online_late_row_ms = 60000 # rows created up to this long before the newest consumed row are still picked up (writes in flight & clock skew between Lambda containers)
+online_read_workers = 16 # number of feature rows read from S3 in parallel
+feature_columns = ['c_1', 'c_4', 'c_5', 'lcs_word', 'para_detect_score', 'direct_detect_score'] # in the order of get_feature_dict
+
+
+######## ONLINE MODEL FUNCTIONS ########
+
+def list_online_feature_keys(s3_bucket, s3_online_features_filepath, start_after=None):
+    """
+    Returns the keys of the feature rows under the online feature prefix in S3 bucket, in creation order, optionally only
+    those after start_after.
+    """
+    s3_client = boto3.client('s3')
+    kwargs = {'Bucket': s3_bucket, 'Prefix': f'{s3_online_features_filepath}/'}
+    if start_after:
+        kwargs['StartAfter'] = start_after
+    keys = []
+    while True:
+        response = s3_client.list_objects_v2(**kwargs)
+        keys += [obj['Key'] for obj in response.get('Contents', [])]
+        if not response.get('IsTruncated'):
+            return keys
+        kwargs['ContinuationToken'] = response['NextContinuationToken']
+
+def read_online_feature_rows(s3_bucket, keys):
+    """
+    Returns the feature rows stored under the given keys, in the same order.
+    """
+    with ThreadPoolExecutor(max_workers=online_read_workers) as executor:
+        return list(executor.map(lambda key: read_s3_json(s3_bucket, key), keys))
+
+def get_online_feature_time(key):
+    """
+    Returns the creation time in ms of a feature row from its key (see get_online_feature_key).
+    """
+    return int(os.path.basename(key).split('-', 1)[0])
+
+def get_new_online_feature_keys(s3_bucket, state):
+    """
+    Returns the keys of the feature rows not consumed by the previous updates. Rows are listed from online_late_row_ms
+    before the newest consumed row, skipping the keys consumed within that window (kept in the state's recent_keys), so
+    that a row whose write finished after a later row was consumed is still picked up once.
+    """
+    start_after = None
+    if state.get('watermark_ms') is not None:
+        start_after = f"{s3_online_features_filepath}/{state['watermark_ms'] - online_late_row_ms:013d}"
+    recent_keys = set(state.get('recent_keys', []))
+
+    return [key for key in list_online_feature_keys(s3_bucket, s3_online_features_filepath, start_after) if key not in recent_keys]
+
+def get_consumed_state(state, keys):
+    """
+    Returns the watermark_ms & recent_keys of the update state once the given new keys are consumed.
+    """
+    if len(keys) == 0:
+        return {'watermark_ms': state.get('watermark_ms'), 'recent_keys': state.get('recent_keys', [])}
+    watermark_ms = max(state.get('watermark_ms') or 0, max(get_online_feature_time(key) for key in keys))
+    recent_keys = sorted(key for key in set(state.get('recent_keys', [])) | set(keys)
+                         if get_online_feature_time(key) >= watermark_ms - online_late_row_ms)
+
+    return {'watermark_ms': watermark_ms, 'recent_keys': recent_keys}
+
+def get_online_model(base_model=None):
+    """
+    Returns a new SGDClassifier with log loss, starting from the coefficients of base_model if given.
+
+    Args:
+        base_model (LogisticRegression, SGDClassifier or GridSearchCV): Fitted linear classifier, e.g. of a full retrain.
+
+    Returns:
+        model (SGDClassifier): Online model.
+    """
+    model = sklearn_linear_model.SGDClassifier(loss='log_loss', penalty='l2', alpha=online_alpha,
+                                               learning_rate='constant', eta0=online_learning_rate)
+    if base_model is not None:
+        base_model = getattr(base_model, 'best_estimator_', base_model)
+        model.coef_ = np.array(base_model.coef_, dtype=np.float64)
+        model.intercept_ = np.array(base_model.intercept_, dtype=np.float64)
+        model.classes_ = np.array(base_model.classes_)
+        model.n_features_in_ = model.coef_.shape[1]
+        if hasattr(base_model, 'feature_names_in_'):
+            model.feature_names_in_ = base_model.feature_names_in_
+
+    return model
+
+def get_labelled_rows(rows):
+    """
+    Returns the rows with a 0/1 target and all features, as a feature DataFrame and a label array.
+    """
+    rows = [row for row in rows if row.get('target') in [0, 1] and all(row.get(column) is not None for column in feature_columns)]
+    X = pd.DataFrame([[row[column] for column in feature_columns] for row in rows], columns=feature_columns, dtype=float)
+    y = np.array([row['target'] for row in rows], dtype=int)
+
+    return X, y
+
+def partial_fit_batches(model, X, y, batch_size=online_batch_size):
+    """
+    Updates the model with partial_fit on consecutive mini-batches of batch_size rows.
+    """
+    for start in range(0, len(y), batch_size):
+        classes = None if hasattr(model, 'classes_') else np.array([0, 1])
+        model.partial_fit(X.iloc[start:start + batch_size], y[start:start + batch_size], classes=classes)
+
+    return model
+
+def update_online_model(s3_bucket, final_model_name, batch_size=online_batch_size):
+    """
+    Trains the final model on the feature rows written since the last update, and publishes it as a new model version if
+    there were any labelled rows. The update state (newest consumed row, published model version) is kept in
+    online_model_state_filepath; rows written while an update runs are left for the next one (see get_new_online_feature_keys).
+
+    Args:
+        s3_bucket (str): Name of S3 bucket.
+        final_model_name (str): Filepath of trained final model.
+        batch_size (int): Number of feature rows per partial_fit call.
+
+    Returns:
+        report (dict): Whether a model was published, its version & S3 filepath, the number of new & labelled rows,
+            whether the update restarted from a replaced final model, and the update time in seconds.
+    """
+    start = time.perf_counter()
+    state = read_s3_json(s3_bucket, online_model_state_filepath,
+                         default={'version': 0, 'watermark_ms': None, 'recent_keys': [], 'rows_since_retrain': 0, 'published_model_version': None})
+    keys = get_new_online_feature_keys(s3_bucket, state)
+    consumed_state = get_consumed_state(state, keys)
+    X, y = get_labelled_rows(read_online_feature_rows(s3_bucket, keys))
+    report = {'published': False, 'version': state['version'], 'new_rows': len(keys), 'labelled_rows': len(y), 'rebased': False}
+
+    if len(y) > 0:
+        try:
+            final_model_version = get_s3_model_version(s3_bucket, final_model_name)
+        except Exception:
+            final_model_version = None # no final model yet
+
+        if final_model_version is None:
+            model = get_online_model()
+        elif final_model_version != state['published_model_version']:
+            model = get_online_model(load_s3_model(s3_bucket, final_model_name))
+        else:
+            model = copy.deepcopy(load_s3_model(s3_bucket, final_model_name)) # the loaded model may be serving requests in this process
+            model.set_params(alpha=online_alpha, eta0=online_learning_rate)
+        report['rebased'] = final_model_version != state['published_model_version']
+        partial_fit_batches(model, X, y, batch_size)
+
+        version = state['version'] + 1
+        model_filepath = f'{online_models_filepath}/final_model_v{version:06d}.joblib'
+        local_file = os.path.join(tempfile.gettempdir(), os.path.basename(model_filepath))
+        joblib.dump(model, local_file)
+        with open(local_file, 'rb') as f:
+            model_sha256 = get_file_sha256(f)
+        coefficients = dict(LinearPredictor.from_model(model, feature_columns).to_dict(), online_version=version, model_sha256=model_sha256)
+        upload_to_s3(local_file, s3_bucket, model_filepath)
+        write_s3_json(coefficients, s3_bucket, get_coefficients_filepath(model_filepath))
+        upload_to_s3(local_file, s3_bucket, final_model_name)
+        write_s3_json(coefficients, s3_bucket, get_coefficients_filepath(final_model_name))
+        os.remove(local_file)
+
+        state = {'version': version,
+                 'model_filepath': model_filepath,
+                 'rows_since_retrain': (0 if report['rebased'] else state['rows_since_retrain']) + len(y),
+                 'published_model_version': get_s3_model_version(s3_bucket, final_model_name),
+                 'updated_at': pd.to_datetime('now').strftime("%Y-%m-%d %H:%M:%S")}
+        report.update(published=True, version=version, model_filepath=model_filepath)
+
+    state.update(consumed_state)
+    write_s3_json(state, s3_bucket, online_model_state_filepath)
+    report['seconds'] = time.perf_counter() - start
+
+    return report
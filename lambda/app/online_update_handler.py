@@ -0,0 +1,31 @@
+"""
+Lambda entry module of the online update of the final model (plagiarism_detector_online_update), triggered by S3 events
+on the online feature rows or on a schedule.
+"""
+import json
+
+from compiled_functions import final_model_name, get_response_object, s3_bucket
+from metrics import instrument_handler, set_property, set_value
+from online_learning import update_online_model
+
+@instrument_handler
+def plagiarism_detector_online_update(event, context):
+    """
+    Lambda function handler updating the final model with the labelled feature rows written since the last update.
+    """
+    response_object = get_response_object()
+    try:
+        report = update_online_model(s3_bucket, final_model_name)
+        set_value('online_new_rows', report['new_rows'])
+        set_value('online_labelled_rows', report['labelled_rows'])
+        set_property('online_version', report['version'])
+        set_property('online_published', report['published'])
+
+        response_object['statusCode'] = 200
+        response_object['body'] = json.dumps(report, default=str)
+
+    except Exception as e:
+        response_object['statusCode'] = 500
+        response_object['body'] = str(e)
+
+    return response_object
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import time
+
+######## CONFIGURATIONS ########
+
+result_cache_enabled = os.environ.get('RESULT_CACHE', '1') == '1'
+result_cache_dir = os.environ.get('RESULT_CACHE_DIR', '/tmp/plagiarism_result_cache') # use a path on a shared (e.g. EFS) volume to share the cache across containers
+result_cache_ttl = int(os.environ.get('RESULT_CACHE_TTL', 7 * 24 * 3600)) # seconds after which a cached result expires
+result_cache_max_entries = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 1000)) # least recently used results are evicted beyond this
+
+
+######## RESULT CACHE ########
+
+class LocalDiskResultCache:
+    """
+    Result cache stored as one JSON file per key in a local directory, with TTL & least-recently-used size eviction.
+    A file's modification time records its last use.
+    """
+
+    def __init__(self, directory=result_cache_dir, ttl=result_cache_ttl, max_entries=result_cache_max_entries):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+    def get_path(self, key):
+        return os.path.join(self.directory, f'{key}.json')
+
+    def get(self, key):
+        """
+        Returns the cached value of key, or None if it is missing or expired.
+        """
+        path = self.get_path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if time.time() - entry['created_at'] > self.ttl:
+            self.delete(key)
+            return None
+        os.utime(path)
+
+        return entry['value']
+
+    def set(self, key, value):
+        """
+        Caches a JSON-serialisable value under key, then evicts expired and least recently used entries.
+        """
+        path = self.get_path(key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'created_at': time.time(), 'value': value}, f)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def delete(self, key):
+        try:
+            os.remove(self.get_path(key))
+        except OSError:
+            pass
+
+    def evict(self):
+        entries = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+
+        now = time.time()
+        entries.sort()
+        # expiry is checked on read against the creation time; last use is a lower bound of it
+        stale = [path for last_used, path in entries if now - last_used > self.ttl]
+        fresh = [path for last_used, path in entries if now - last_used <= self.ttl]
+        for path in stale + fresh[:max(len(fresh) - self.max_entries, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        for filename in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except OSError:
+                pass
+
+
+result_cache = None
+
+def get_result_cache():
+    """
+    Returns the process-wide result cache, or None if caching is disabled with RESULT_CACHE=0.
+    """
+    global result_cache
+    if result_cache_enabled and result_cache is None:
+        result_cache = LocalDiskResultCache()
+
+    return result_cache
+
+
+######## CACHE KEY FUNCTIONS ########
+
+def get_config_hash(config):
+    """
+    Returns the SHA-256 hex digest of a JSON-serialisable matching configuration.
+    """
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+def get_result_cache_key(input_hash, source_hash, bert_version, final_model_version, config_hash):
+    """
+    Returns the cache key of a 1-1 comparison.
+
+    Args:
+        input_hash (str): Text hash of the input document.
+        source_hash (str): Text hash of the source document.
+        bert_version (str): Version of the trained Sentence Transformer model.
+        final_model_version (str): Version of the trained final model.
+        config_hash (str): Hash of the matching configuration (see get_config_hash).
+
+    Returns:
+        key (str): SHA-256 hex digest of all key parts.
+    """
+    key_parts = [input_hash, source_hash, bert_version, final_model_version, config_hash]
+
+    return hashlib.sha256('|'.join(key_parts).encode('utf-8')).hexdigest()
@@ -0,0 +1,141 @@
+"""
+On-demand statistical profiling of requests, written to storage as collapsed stacks for flame graphs.
+
+Handlers decorated with profile_handler are profiled for a request with an X-Profile: 1 header or a "profile": true
+body field, and for a random PROFILE_SAMPLE_RATE fraction of the others. While the handler runs, a sampler thread
+records the Python stack of the handler's thread every PROFILE_INTERVAL_MS; when it returns (or raises), the stacks are
+written to <s3_profiles_filepath>/<handler>/<request id>.collapsed, one line per distinct stack with the root first and
+its sample count, e.g.
+    plagiarism_detector_1to1 (one_one_handler.py:17);get_one_one_matching_output (compiled_functions.py:1352);... 42
+which flamegraph.pl, speedscope or inferno render. The key is logged as the profile_key field of the request's metrics.
+A sample of a 70-frame stack takes about 20 us, i.e. 0.1% of the request's time at the default 20 ms interval; the
+slowdown of a profiled CPU-bound request is within run-to-run noise (see benchmarks/sampling_profiler_check.py). The
+sampler needs the GIL, so pure-Python code holding it stretches the interval by up to the interpreter's switch interval
+(5 ms). Without profiling, a request only pays for the header & body check. Only the handler's thread is sampled: the
+worker processes of parallel 1-n matching and the threads the request starts are not, and time spent in native code
+(e.g. PyTorch) is attributed to the Python frame calling it. A failed profile write is logged as the profile_error field
+of the request's metrics.
+"""
+import collections
+import functools
+import os
+import random
+import sys
+import threading
+import uuid
+
+from metrics import get_request_option, set_property
+
+######## CONFIGURATIONS ########
+
+profile_sample_rate = float(os.environ.get('PROFILE_SAMPLE_RATE', 0)) # fraction of the requests profiled without asking for it
+profile_interval_ms = float(os.environ.get('PROFILE_INTERVAL_MS', 20)) # time between two samples of the handler's stack
+s3_profiles_filepath = 'plagiarism-detector/profiles' # collapsed stacks of profiled requests, under <handler>/<request id>.collapsed
+
+
+######## SAMPLER ########
+
+class StackSampler:
+    """
+    Thread sampling the stack of another thread at a fixed interval, from its innermost frame up to (excluding) a root
+    frame, and counting the distinct stacks. Only stacks passing through a frame of root_code right below the root frame
+    are recorded, so that the samples taken before the handler is called or after it returns (e.g. while the sampler is
+    stopped) are left out.
+    """
+
+    def __init__(self, thread_id, root_frame, root_code, interval_ms=None):
+        self.thread_id = thread_id
+        self.root_frame = root_frame
+        self.root_code = root_code
+        self.interval = (interval_ms or profile_interval_ms) / 1000
+        self.counts = collections.Counter() # tuple of code objects (root first) -> samples
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None and frame is not self.root_frame:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        if frame is not None and stack and stack[-1] is self.root_code:
+            self.counts[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def get_collapsed(self):
+        """
+        Returns the sampled stacks in the collapsed format: one '<frame>;<frame>;... <count>' line per stack.
+        """
+        labels = {}
+        lines = []
+        for stack, samples in self.counts.most_common():
+            for code in stack:
+                if code not in labels:
+                    labels[code] = f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'.replace(';', ':')
+            lines.append(f"{';'.join(labels[code] for code in stack)} {samples}")
+
+        return '\n'.join(lines) + '\n' if lines else ''
+
+
+######## STORAGE ########
+
+def get_profile_key(handler_name, request_id):
+    return f'{s3_profiles_filepath}/{handler_name}/{request_id}.collapsed'
+
+
+def write_profile(sampler, key):
+    """
+    Writes the collapsed stacks of a sampler to the storage backend (S3, or local storage with LOCAL_STORAGE_DIR).
+    """
+    from compiled_functions import boto3, s3_bucket
+
+    s3_client = boto3.client('s3')
+    s3_client.put_object(Bucket=s3_bucket, Key=key, Body=sampler.get_collapsed().encode('utf-8'))
+
+
+def should_profile(event):
+    """
+    Returns whether a request is profiled: it asks for it (X-Profile header or profile body field), or is sampled at
+    profile_sample_rate.
+    """
+    return get_request_option(event, 'profile') or (profile_sample_rate > 0 and random.random() < profile_sample_rate)
+
+
+def profile_handler(handler):
+    """
+    Decorator of a Lambda handler (event, context) profiling the requests that ask for it (see should_profile). Apply it
+    below instrument_handler, so that the profile key is logged with the request's metrics.
+    """
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        if not should_profile(event):
+            return handler(event, context)
+
+        request_id = getattr(context, 'aws_request_id', None) or uuid.uuid4().hex
+        key = get_profile_key(handler.__name__, request_id)
+        sampler = StackSampler(threading.get_ident(), sys._getframe(), handler.__code__).start()
+        try:
+            return handler(event, context)
+        finally:
+            sampler.stop()
+            set_property('profile_key', key)
+            set_property('profile_samples', sampler.samples)
+            try:
+                write_profile(sampler, key)
+            except Exception as e: # a failed write must not fail the request
+                set_property('profile_error', str(e))
+
+    return wrapper
@@ -0,0 +1,200 @@
+"""
+Long-lived HTTP server exposing the upload, 1-1, 1-n and batch APIs for on-prem deployments.
+
+The same Lambda handlers serve each request, with the models kept in memory across requests and encode calls of
+concurrent requests coalesced into batches (see EncodeBatcher). Run it as an ASGI app:
+    $ uvicorn server:app --port 8080
+or on the standard library HTTP server:
+    $ python server.py --port 8080
+
+Set LOCAL_STORAGE_DIR to keep documents, data files & models on local disk instead of S3, and JOB_LOCAL_WORKERS with
+JOB_QUEUE_PATH (e.g. ':memory:') to process asynchronous 1-n jobs in the server process.
+"""
+import argparse
+import asyncio
+import base64
+import importlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from compiled_functions import (final_model_name, loaded_models,
+                                model_wrappers, ngrams_lst,
+                                sentbert_model_name, warm_up_models)
+from encode_batcher import EncodeBatcher
+
+######## CONFIGURATIONS ########
+
+server_threads = int(os.environ.get('SERVER_THREADS', 16)) # number of requests processed concurrently
+
+# (method, path) -> (entry module, handler)
+routes = {
+    ('PUT', '/upload'): ('upload_handler', 'file_upload_1ton'),
+    ('POST', '/get_1to1_matches'): ('one_one_handler', 'plagiarism_detector_1to1'),
+    ('POST', '/get_1ton_matches'): ('one_many_handler', 'plagiarism_detector_1ton'),
+    ('POST', '/get_batch_matches'): ('batch_handler', 'plagiarism_detector_batch'),
+    ('POST', '/online_update'): ('online_update_handler', 'plagiarism_detector_online_update'),
+}
+
+
+######## REQUEST HANDLING ########
+
+server_lock = threading.Lock()
+server_initialised = False
+
+def init_server():
+    """
+    Wraps the Sentence Transformer model in an EncodeBatcher when it is loaded, and loads & warms up both models.
+    """
+    global server_initialised
+    with server_lock:
+        if server_initialised:
+            return None
+        model_wrappers[sentbert_model_name] = EncodeBatcher
+        loaded = loaded_models.get(sentbert_model_name)
+        if loaded is not None and not isinstance(loaded['model'], EncodeBatcher):
+            loaded['model'] = EncodeBatcher(loaded['model'])
+        warm_up_models(sentbert_model_name, final_model_name, ngrams_lst)
+        server_initialised = True
+
+    return None
+
+def get_handler(method, path):
+    route = routes.get((method, path.split('?')[0].rstrip('/') or '/'))
+    if route is None:
+        return None
+    module_name, handler_name = route
+
+    return getattr(importlib.import_module(module_name), handler_name)
+
+def get_event(method, headers, body):
+    """
+    Returns the Lambda event the API Gateway integration would pass to the handler for an HTTP request.
+    Uploads send the raw PDF as the body with file_name & user_id headers. Other requests pass their headers as a proxy
+    integration would, e.g. X-Profile-Memory (see metrics.get_request_option).
+    """
+    if method == 'PUT':
+        header = {name.replace('-', '_'): value for name, value in headers.items()}
+        return {'body-json': base64.b64encode(body).decode('ascii'), 'params': {'header': header}}
+
+    return {'body': body.decode('utf-8'), 'headers': headers}
+
+def handle_request(method, path, headers, body):
+    """
+    Serves one HTTP request with its Lambda handler.
+
+    Args:
+        method (str): HTTP method.
+        path (str): Request path.
+        headers (dict): Request headers, with lowercase names.
+        body (bytes): Request body.
+
+    Returns:
+        status (int): HTTP status code.
+        response_headers (dict): Response headers.
+        response_body (bytes): Response body.
+    """
+    handler = get_handler(method, path)
+    if handler is None:
+        return 404, {'Content-Type': 'application/json'}, json.dumps({'message': f'No route for {method} {path}'}).encode('utf-8')
+
+    init_server()
+    response = handler(get_event(method, headers, body), None)
+    response_body = response.get('body', '')
+
+    return response['statusCode'], response.get('headers', {'Content-Type': 'application/json'}), str(response_body).encode('utf-8')
+
+
+######## ASGI APP ########
+
+executor = ThreadPoolExecutor(max_workers=server_threads)
+
+async def app(scope, receive, send):
+    """
+    ASGI application. Requests run on a thread pool, since matching is blocking.
+    """
+    loop = asyncio.get_running_loop()
+
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await loop.run_in_executor(executor, init_server)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    if scope['type'] != 'http':
+        return
+
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+
+    status, response_headers, response_body = await loop.run_in_executor(executor, handle_request, scope['method'], scope['path'], headers, body)
+
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response_headers.items()]})
+    await send({'type': 'http.response.body', 'body': response_body})
+
+
+######## STANDARD LIBRARY SERVER ########
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def handle_method(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        headers = {name.lower(): value for name, value in self.headers.items()}
+        status, response_headers, response_body = handle_request(self.command, self.path, headers, body)
+
+        self.send_response(status)
+        for name, value in response_headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(response_body)))
+        self.end_headers()
+        self.wfile.write(response_body)
+
+    do_POST = handle_method
+    do_PUT = handle_method
+
+    def log_message(self, format, *args):
+        pass
+
+def make_server(host='0.0.0.0', port=8080):
+    """
+    Returns a standard library threading HTTP server serving the APIs (port 0 picks a free port), with the models loaded.
+    """
+    init_server()
+    server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.daemon_threads = True
+
+    return server
+
+def run_server(host='0.0.0.0', port=8080):
+    """
+    Serves the APIs on the standard library threading HTTP server until interrupted.
+    """
+    server = make_server(host, port)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+    return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+
+    run_server(args.host, args.port)
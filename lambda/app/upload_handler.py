@@ -0,0 +1,61 @@
+"""
+Lambda entry module of the PUT /upload API (file_upload_1ton). Only imports what file uploads need.
+"""
+import base64
+import json
+import os
+
+from compiled_functions import (add_document_artifacts, add_input_data, boto3,
+                                extract_pdf_text, find_duplicate_document,
+                                get_bytes_hash, get_text_hash,
+                                read_content_index, register_alias,
+                                register_document, s3_bucket,
+                                s3_content_index_filepath, s3_pdf_filepath,
+                                s3_webis_data_filepath, write_s3_json)
+from metrics import instrument_handler
+from sampling_profiler import profile_handler
+
+@instrument_handler
+@profile_handler
+def file_upload_1ton(event, context):
+    """
+    Lambda function handler for the PUT /upload API request.
+    Uploads are deduplicated by content: if the same PDF bytes or the same normalised text already exist,
+    the upload is registered as an alias of the existing document instead of being stored and processed again.
+    """
+    s3_client = boto3.client('s3')
+    file_content = event['body-json']
+    filename = event["params"]["header"]["file_name"]
+    userid = event["params"]["header"]["user_id"]
+    content_decoded = base64.b64decode(file_content)
+
+    content_index = read_content_index(s3_bucket, s3_content_index_filepath)
+    bytes_hash = get_bytes_hash(content_decoded)
+    canonical_doc_name = find_duplicate_document(content_index, bytes_hash)
+
+    if canonical_doc_name is None:
+        text = extract_pdf_text(content_decoded)
+        text_hash = get_text_hash(text)
+        canonical_doc_name = find_duplicate_document(content_index, text_hash)
+
+    deduplicated = canonical_doc_name is not None
+
+    if deduplicated:
+        content_index = register_alias(content_index, filename, canonical_doc_name)
+    else:
+        canonical_doc_name = filename
+        filepath = os.path.join(s3_pdf_filepath, filename)
+        s3_upload = s3_client.put_object(Bucket=s3_bucket, Key=filepath, Body=content_decoded)
+        add_document_artifacts(text, text_hash, s3_bucket)
+        add_input_data(userid, filename, text, s3_bucket, s3_webis_data_filepath)
+        content_index = register_document(content_index, filename, bytes_hash, text_hash)
+
+    write_s3_json(content_index, s3_bucket, s3_content_index_filepath)
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'message': f'{filename} uploaded',
+                            'file_name': filename,
+                            'deduplicated': deduplicated,
+                            'canonical_file_name': canonical_doc_name})
+    }
@@ -0,0 +1,73 @@
+"""
+Build step that bakes the trained models into the Lambda image.
+
+Downloads trained_bert_model.joblib and final_model.joblib from S3 (the latest versions, or the S3 version IDs given),
+and the final model's coefficient file if there is one, into app/baked_models/ with a manifest of their versions,
+which `COPY ./app` in the Dockerfile then includes in the image. At runtime load_s3_model only uses a baked model while its version is still the one in S3, so a retrained model
+overrides the baked one without rebuilding the image.
+
+Usage:
+    $ python bake_models.py
+    $ python bake_models.py --sentbert-version-id 3sL4kqtJlcpXroDTDmJ.rmSpXd3dIbrHY --final-version-id null
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app'))
+
+from compiled_functions import (baked_models_dir, boto3, botocore_exceptions,
+                                final_model_name, get_coefficients_filepath,
+                                get_s3_object_version, is_missing_s3_object,
+                                s3_bucket, sentbert_model_name)
+
+
+def bake_model(s3_client, s3_bucket, s3_filepath, output_dir, version_id=None):
+    """
+    Downloads a model from S3 into output_dir and returns its manifest entry.
+    """
+    kwargs = {'Bucket': s3_bucket, 'Key': s3_filepath}
+    if version_id is not None:
+        kwargs['VersionId'] = version_id
+    obj = s3_client.get_object(**kwargs)
+
+    filename = os.path.basename(s3_filepath)
+    with open(os.path.join(output_dir, filename), 'wb') as f:
+        for chunk in obj['Body'].iter_chunks():
+            f.write(chunk)
+
+    return {'version': get_s3_object_version(obj), 'file': filename}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bucket', default=s3_bucket)
+    parser.add_argument('--sentbert-version-id', default=None, help='S3 version ID of the Sentence Transformer model to bake (default latest)')
+    parser.add_argument('--final-version-id', default=None, help='S3 version ID of the final model to bake (default latest)')
+    parser.add_argument('--coefficients-version-id', default=None, help="S3 version ID of the final model's coefficient file to bake (default latest)")
+    parser.add_argument('--output-dir', default=baked_models_dir)
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    s3_client = boto3.client('s3')
+    manifest = {}
+    for s3_filepath, version_id in [(sentbert_model_name, args.sentbert_version_id), (final_model_name, args.final_version_id)]:
+        manifest[s3_filepath] = bake_model(s3_client, args.bucket, s3_filepath, args.output_dir, version_id)
+        print(f"baked {s3_filepath} version {manifest[s3_filepath]['version']}")
+
+    coefficients_filepath = get_coefficients_filepath(final_model_name)
+    try:
+        manifest[coefficients_filepath] = bake_model(s3_client, args.bucket, coefficients_filepath, args.output_dir, args.coefficients_version_id)
+        print(f"baked {coefficients_filepath} version {manifest[coefficients_filepath]['version']}")
+    except botocore_exceptions.ClientError as e:
+        if not is_missing_s3_object(e):
+            raise
+        print(f"no {coefficients_filepath} in S3, the final model will be converted when loaded")
+
+    with open(os.path.join(args.output_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
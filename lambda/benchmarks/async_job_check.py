@@ -0,0 +1,190 @@
+"""
+Check of asynchronous 1-n matching jobs (app/job_queue.py) through the plagiarism_detector_1ton handlers, on local storage.
+
+Local storage in a temporary directory holds the df10.csv documents (see server_load_test.py) with a HashingEncoder
+stand-in for the Sentence Transformer. Checks:
+    - without JOB_QUEUE_PATH, submit & poll requests fail with an error naming it and the worker handler raises
+    - a job submitted with "mode": "async" is queued, processed by the worker handler in another process sharing the
+      queue file, and polled as complete with the flag & score of a synchronous 1-n check over the whole documents
+      database (ONE_MANY_MAX_SOURCES=0), then recorded in output.csv
+    - the input documents cached by the worker threads are never mixed up between jobs, and jobs processed by concurrent
+      local workers match synchronous 1-n checks
+    - a job with failed tasks is 'partial' and lists them, with the flag & score of the other tasks; a job whose tasks
+      all failed is 'failed', has no flag & score and is not recorded
+
+Usage:
+    $ python async_job_check.py
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+CHUNK_SIZE = 3
+TOLERANCE = 1e-9
+
+
+def check(condition, message):
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    return condition
+
+
+class Context:
+    def get_remaining_time_in_millis(self):
+        return 900000
+
+
+def call(handler, body):
+    response = handler({'body': json.dumps(body)}, Context())
+    try:
+        return response['statusCode'], json.loads(response['body'])
+    except ValueError:
+        return response['statusCode'], response['body']
+
+
+def run_worker_process(app_dir, queue_path):
+    """
+    Runs the worker handler in a fresh interpreter sharing the queue file, and returns its number of processed tasks.
+    """
+    code = (f"import sys; sys.path[:0] = [{app_dir!r}, {BENCHMARKS_DIR!r}]; import one_many_handler; "
+            "print(one_many_handler.plagiarism_detector_1ton_worker({}, None)['body'])")
+    process = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=app_dir,
+                             env=dict(os.environ, JOB_QUEUE_PATH=queue_path))
+    if process.returncode != 0:
+        print(process.stderr)
+        return None
+
+    return json.loads(process.stdout.strip().splitlines()[-1])['processed_tasks']
+
+
+def count_output_rows(cf, input_doc_name):
+    output_df = cf.read_s3_df(cf.s3_bucket, cf.s3_output_data_filepath)
+    return int((output_df['input_doc_name'] == input_doc_name).sum())
+
+
+def same_result(progress, expected):
+    return (progress.get('plagiarism_flag') == expected['plagiarism_flag']
+            and abs(progress.get('plagiarism_score', -1) - expected['plagiarism_score']) <= TOLERANCE
+            and len(progress['plagiarised_text']) == len(expected['plagiarised_text']))
+
+
+def main():
+    storage_dir = tempfile.mkdtemp()
+    passed = True
+    try:
+        os.environ.pop('JOB_QUEUE_PATH', None)
+        os.environ.update({'LOCAL_STORAGE_DIR': storage_dir, 'RESULT_CACHE': '0', 'WARM_UP_MODELS': '0', 'METRICS': '0', 'ONE_MANY_MAX_SOURCES': '0',
+                           'JOB_CHUNK_SIZE': str(CHUNK_SIZE), 'JOB_LOCAL_WORKERS': '0'})
+        from synthetic import APP_DIR, use_app_dir
+        use_app_dir()
+        from server_load_test import populate_local_storage
+        input_doc_names, source_doc_names = populate_local_storage(None)
+
+        import compiled_functions as cf
+        import job_queue
+        from one_many_handler import plagiarism_detector_1ton, plagiarism_detector_1ton_worker
+
+        tasks_total = -(-len(source_doc_names) // CHUNK_SIZE)
+        expected = {input_doc_name: cf.get_one_many_matching_output(cf.sentbert_model_name, cf.final_model_name, cf.ngrams_lst,
+                                                                    input_doc_name, incremental=False)
+                    for input_doc_name in input_doc_names[:3]}
+
+        status, body = call(plagiarism_detector_1ton, {'user_id': 'check', 'input_doc_name': input_doc_names[0], 'mode': 'async'})
+        polled, _ = call(plagiarism_detector_1ton, {'job_id': 'unknown'})
+        raised = False
+        try:
+            plagiarism_detector_1ton_worker({}, Context())
+        except ValueError:
+            raised = True
+        passed &= check(status == 500 and 'JOB_QUEUE_PATH' in body and polled == 500 and raised,
+                        'without JOB_QUEUE_PATH, submit & poll requests fail naming it and the worker handler raises')
+
+        # submit -> worker in another process on the same host -> poll, on a local queue file
+        queue_path = os.path.join(storage_dir, 'plagiarism_jobs.db')
+        job_queue.job_queue_path = queue_path
+        output_rows = count_output_rows(cf, input_doc_names[0])
+        status, body = call(plagiarism_detector_1ton, {'user_id': 'check', 'input_doc_name': input_doc_names[0], 'mode': 'async'})
+        job_id = body['job_id'] if status == 202 else None
+        _, queued = call(plagiarism_detector_1ton, {'job_id': job_id})
+        passed &= check(status == 202 and queued['status'] == 'queued' and queued['tasks_total'] == tasks_total and queued['tasks_processed'] == 0,
+                        f'a submitted job is queued with {tasks_total} tasks of {CHUNK_SIZE} source documents')
+        processed_tasks = run_worker_process(APP_DIR, queue_path)
+        status, progress = call(plagiarism_detector_1ton, {'job_id': job_id})
+        passed &= check(processed_tasks == tasks_total and status == 200 and progress['status'] == 'complete'
+                        and progress['sources_processed'] == len(source_doc_names) and progress['failed_tasks'] == [],
+                        f'the worker handler in another process processes the {processed_tasks} tasks and the job is polled as complete')
+        passed &= check(same_result(progress, expected[input_doc_names[0]]) and 'partial' not in progress,
+                        f"the job's flag & score match a synchronous 1-n check ({progress.get('plagiarism_score', -1):.4f})")
+        passed &= check(count_output_rows(cf, input_doc_names[0]) == output_rows + 1, 'the complete job is recorded in output.csv')
+
+        # concurrent local workers on an in-process queue
+        job_queue.job_queue_path = ':memory:'
+        job_queue.job_local_workers = 2
+        mixed_up = []
+
+        def read_input_docs(i):
+            for j in range(50):
+                input_doc_name = input_doc_names[(i + j) % 3]
+                input_doc, _ = job_queue.get_cached_input_doc(input_doc_name)
+                if input_doc != cf.read_s3_pdf(cf.s3_bucket, input_doc_name):
+                    mixed_up.append(input_doc_name)
+
+        threads = [threading.Thread(target=read_input_docs, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        passed &= check(mixed_up == [], f'8 threads reading 3 input documents through the worker cache get {len(mixed_up)} wrong documents')
+
+        queue = job_queue.get_job_queue()
+        job_ids = {input_doc_name: job_queue.submit_one_many_job('check', input_doc_name, chunk_size=1, queue=queue)
+                   for input_doc_name in input_doc_names[:3]}
+        for thread in job_queue.start_local_workers(cf.sentbert_model_name, cf.final_model_name, cf.ngrams_lst, n_workers=2, queue=queue):
+            thread.join()
+        progresses = {input_doc_name: job_queue.get_job_progress(job_id, cf.ngrams_lst, queue) for input_doc_name, job_id in job_ids.items()}
+        passed &= check(all(progress['status'] == 'complete' and same_result(progress, expected[input_doc_name])
+                            for input_doc_name, progress in progresses.items()),
+                        '3 jobs processed by 2 local workers match synchronous 1-n checks')
+
+        # failed tasks
+        one_one_matching_texts = job_queue.one_one_matching_texts
+
+        def failing_matching_texts(sentbert_model_name, ngrams_lst, source_doc, source_doc_name, *args):
+            if failing(source_doc_name):
+                raise RuntimeError(f'failed to match {source_doc_name}')
+            return one_one_matching_texts(sentbert_model_name, ngrams_lst, source_doc, source_doc_name, *args)
+
+        job_queue.one_one_matching_texts = failing_matching_texts
+        failing = lambda source_doc_name: source_doc_name == source_doc_names[-1]
+        output_rows = count_output_rows(cf, input_doc_names[1])
+        job_id = job_queue.submit_one_many_job('check', input_doc_names[1], chunk_size=CHUNK_SIZE, queue=queue)
+        job_queue.run_worker(cf.sentbert_model_name, cf.final_model_name, cf.ngrams_lst, queue=queue)
+        progress = job_queue.get_job_progress(job_id, cf.ngrams_lst, queue)
+        failed_tasks = progress['failed_tasks']
+        passed &= check(progress['status'] == 'partial' and progress.get('partial') is True and len(failed_tasks) == 1
+                        and failed_tasks[0]['task_index'] == tasks_total - 1 and source_doc_names[-1] in failed_tasks[0]['error']
+                        and 'plagiarism_score' in progress and count_output_rows(cf, input_doc_names[1]) == output_rows + 1,
+                        'a job with a failed task is partial, lists the task & its error and is scored & recorded')
+
+        failing = lambda source_doc_name: True
+        output_rows = count_output_rows(cf, input_doc_names[2])
+        job_id = job_queue.submit_one_many_job('check', input_doc_names[2], chunk_size=CHUNK_SIZE, queue=queue)
+        job_queue.run_worker(cf.sentbert_model_name, cf.final_model_name, cf.ngrams_lst, queue=queue)
+        progress = job_queue.get_job_progress(job_id, cf.ngrams_lst, queue)
+        passed &= check(progress['status'] == 'failed' and len(progress['failed_tasks']) == tasks_total and 'plagiarism_score' not in progress
+                        and count_output_rows(cf, input_doc_names[2]) == output_rows,
+                        'a job whose tasks all failed is failed, lists them, has no flag & score and is not recorded')
+        job_queue.one_one_matching_texts = one_one_matching_texts
+    finally:
+        shutil.rmtree(storage_dir, ignore_errors=True)
+
+    print('all checks passed' if passed else 'some checks failed')
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Parity of batch N×M matching (app/batch_matching.py) with per-pair 1-1 matching, on local storage.
+
+Local storage in a temporary directory holds the df10.csv documents (see server_load_test.py) with a HashingEncoder
+stand-in for the Sentence Transformer. N input documents are compared with M source documents in one batch and pair by
+pair. Checks:
+    - every pair's matching texts, direct & paraphrase scores, containment scores and LCS score match
+      one_one_matching_texts
+    - every pair's flag & score, predicted from its batch features, match the 1-1 API output (get_one_one_matching_output)
+    - every input document's batch flag & score match the final model on its 1-1 features averaged over the M sources
+Sentence embeddings are computed in one encode call per batch instead of one per pair, so scores are compared within
+TOLERANCE (float32 rounding). Reports the time of the batch and of the N×M 1-1 calls.
+
+Usage:
+    $ python batch_parity_check.py
+    $ python batch_parity_check.py --inputs 5 --sources 10
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from statistics import mean
+
+TOLERANCE = 1e-5
+
+
+def check(condition, message):
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    return condition
+
+
+def same_matches(matches, other_matches):
+    """
+    Returns whether two lists of plagiarised texts have the same sentences, spans & sources, with scores within TOLERANCE.
+    """
+    keys = ['sentence', 'start_char_index', 'end_char_index', 'source_sentence', 'source_doc_name']
+    return (len(matches) == len(other_matches)
+            and all([match[key] for key in keys] == [other_match[key] for key in keys] and abs(match['score'] - other_match['score']) <= TOLERANCE
+                    for match, other_match in zip(matches, other_matches)))
+
+
+def same_matching_texts(matching_texts, other_matching_texts):
+    plagiarised_text, direct_avg_score, paraphrase_avg_score, containment_scores, lcm_score = matching_texts
+    other_plagiarised_text, other_direct_avg_score, other_paraphrase_avg_score, other_containment_scores, other_lcm_score = other_matching_texts
+
+    return (same_matches(plagiarised_text, other_plagiarised_text)
+            and abs(direct_avg_score - other_direct_avg_score) <= TOLERANCE
+            and abs(paraphrase_avg_score - other_paraphrase_avg_score) <= TOLERANCE
+            and containment_scores.keys() == other_containment_scores.keys()
+            and all(abs(containment_scores[key] - other_containment_scores[key]) <= TOLERANCE for key in containment_scores)
+            and abs(lcm_score - other_lcm_score) <= TOLERANCE)
+
+
+def same_flag_score(flag, score, other_flag, other_score):
+    return int(flag) == int(other_flag) and abs(float(score) - float(other_score)) <= TOLERANCE
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--inputs', type=int, default=4, help='number of input documents (at most 10)')
+    parser.add_argument('--sources', type=int, default=5, help='number of source documents (at most 10)')
+    args = parser.parse_args()
+
+    storage_dir = tempfile.mkdtemp()
+    passed = True
+    try:
+        os.environ.update({'LOCAL_STORAGE_DIR': storage_dir, 'RESULT_CACHE': '0', 'WARM_UP_MODELS': '0', 'METRICS': '0'})
+        from synthetic import use_app_dir
+        use_app_dir()
+        from server_load_test import populate_local_storage
+        input_doc_names, source_doc_names = populate_local_storage(None)
+        input_doc_names, source_doc_names = input_doc_names[:args.inputs], source_doc_names[:args.sources]
+
+        import batch_matching
+        import compiled_functions as cf
+
+        sentence_trans_model = cf.load_s3_model(cf.s3_bucket, cf.sentbert_model_name)
+        input_docs = [(input_doc_name, cf.read_s3_pdf(cf.s3_bucket, input_doc_name)) for input_doc_name in input_doc_names]
+        source_docs = [(source_doc_name, cf.read_s3_pdf(cf.s3_bucket, source_doc_name)) for source_doc_name in source_doc_names]
+        pairs = [(i, j) for i in range(len(input_docs)) for j in range(len(source_docs))]
+
+        start = time.perf_counter()
+        batch_output = batch_matching.get_batch_matching_output(cf.sentbert_model_name, cf.final_model_name, cf.ngrams_lst,
+                                                                input_doc_names, source_doc_names)
+        batch_seconds = time.perf_counter() - start
+        batch_texts = batch_matching.batch_matching_texts(sentence_trans_model, cf.ngrams_lst, input_docs, source_docs)
+
+        start = time.perf_counter()
+        one_one_outputs = {(i, j): cf.get_one_one_matching_output(cf.sentbert_model_name, cf.final_model_name, cf.ngrams_lst,
+                                                                  source_doc_names[j], input_doc_names[i])
+                           for i, j in pairs}
+        one_one_seconds = time.perf_counter() - start
+        pair_texts = {(i, j): cf.one_one_matching_texts(cf.sentbert_model_name, cf.ngrams_lst, source_docs[j][1], source_docs[j][0],
+                                                        input_docs[i][1], sentence_trans_model)
+                      for i, j in pairs}
+
+        mismatched = [(i, j) for i, j in pairs if not same_matching_texts(batch_texts[i][j], pair_texts[(i, j)])]
+        passed &= check(mismatched == [], f'{len(pairs) - len(mismatched)}/{len(pairs)} pairs have the matching texts & features of one_one_matching_texts')
+
+        def get_features(matching_texts):
+            plagiarised_text, direct_avg_score, paraphrase_avg_score, containment_scores, lcm_score = matching_texts
+            return cf.get_feature_dict(containment_scores, lcm_score, direct_avg_score, paraphrase_avg_score)
+
+        mismatched = [(i, j) for i, j in pairs
+                      if not same_flag_score(*cf.get_flag_score_prediction(cf.final_model_name, get_features(batch_texts[i][j])),
+                                             one_one_outputs[(i, j)]['plagiarism_flag'], one_one_outputs[(i, j)]['plagiarism_score'])]
+        passed &= check(mismatched == [], f'{len(pairs) - len(mismatched)}/{len(pairs)} pairs scored from their batch features match the 1-1 API output')
+
+        mismatched = []
+        for i, output in enumerate(batch_output):
+            features = [get_features(pair_texts[(i, j)]) for j in range(len(source_docs))]
+            averaged = {name: mean(feature[name] for feature in features) for name in features[0]}
+            flag, score = cf.get_flag_score_prediction(cf.final_model_name, averaged)
+            if not (output['input_doc_name'] == input_doc_names[i] and same_flag_score(output['plagiarism_flag'], output['plagiarism_score'], flag, score)
+                    and same_matches(output['plagiarised_text'], [match for j in range(len(source_docs)) for match in pair_texts[(i, j)][0]])):
+                mismatched.append(i)
+        passed &= check(mismatched == [], f'{len(batch_output) - len(mismatched)}/{len(input_docs)} input documents have the batch flag & score '
+                                          f'of their averaged 1-1 features')
+        print(f'     {len(input_docs)}×{len(source_docs)} documents: batch {batch_seconds * 1000:.0f} ms, '
+              f'{len(pairs)} 1-1 calls {one_one_seconds * 1000:.0f} ms')
+    finally:
+        shutil.rmtree(storage_dir, ignore_errors=True)
+
+    print('all checks passed' if passed else 'some checks failed')
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
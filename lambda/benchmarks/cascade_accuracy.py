@@ -0,0 +1,89 @@
+"""
+Accuracy and cost comparison of the one_one_matching_texts cascade with gates on and off.
+
+Pairs every text_para of retrain-codes/assets/df10.csv with every text_og: the row's own text_og is labelled with the
+row's target and every other text_og is labelled 0 (an unrelated source document, as in 1-n matching). Features are
+computed with the cascade gates off and on, and the final model predicts on both. Without --final-model, a
+LogisticRegression fitted on the feature columns of df10.csv stands in for the trained final model.
+
+Usage:
+    $ python cascade_accuracy.py --output cascade_accuracy.json
+"""
+import argparse
+import json
+import os
+import time
+
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, f1_score
+
+from synthetic import APP_DIR, load_encoder, use_app_dir
+
+INVOCATION_DIR = use_app_dir()
+
+import compiled_functions
+from compiled_functions import (get_cascade_report, get_feature_dict, ngrams_lst,
+                                one_one_matching_texts, reset_cascade_stats)
+
+DF10_PATH = os.path.join(APP_DIR, '..', '..', 'retrain-codes', 'assets', 'df10.csv')
+FEATURE_COLUMNS = ['c_1', 'c_4', 'c_5', 'lcs_word', 'para_detect_score', 'direct_detect_score']
+
+
+def get_pair_features(model, pairs, gates):
+    reset_cascade_stats()
+    features = []
+    start = time.perf_counter()
+    for input_doc, source_doc in pairs:
+        _, direct_avg_score, paraphrase_avg_score, containment_scores, lcm_score = one_one_matching_texts(
+            None, ngrams_lst, source_doc, 'source', input_doc, model, gates)
+        features.append(get_feature_dict(containment_scores, lcm_score, direct_avg_score, paraphrase_avg_score))
+    seconds = time.perf_counter() - start
+    return pd.DataFrame(features)[FEATURE_COLUMNS], seconds, get_cascade_report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default=os.path.normpath(DF10_PATH), help='CSV with text_og, text_para and target columns')
+    parser.add_argument('--model', default=None, help='local path of a trained_bert_model.joblib to use instead of the hashing encoder')
+    parser.add_argument('--final-model', default=None, help='local path of a trained_final_model.joblib')
+    parser.add_argument('--output', default=None, help='optional path of a JSON file to write the results to')
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.data)
+    pairs, labels = [], []
+    for i, input_doc in enumerate(df['text_para']):
+        for j, source_doc in enumerate(df['text_og']):
+            pairs.append((input_doc, source_doc))
+            labels.append(int(df['target'][i]) if i == j else 0)
+
+    model = load_encoder(args.model)
+    if args.final_model:
+        import joblib
+        final_model = joblib.load(args.final_model)
+    else:
+        final_model = LogisticRegression().fit(df[FEATURE_COLUMNS], df['target'])
+
+    results = {'pairs': len(pairs)}
+    predictions = {}
+    for name, enabled in [('gates_off', False), ('gates_on', True)]:
+        gates = dict(compiled_functions.cascade_gates, enabled=enabled)
+        feature_df, seconds, report = get_pair_features(model, pairs, gates)
+        predictions[name] = final_model.predict(feature_df)
+        results[name] = {'seconds': seconds, 'accuracy': accuracy_score(labels, predictions[name]),
+                         'f1': f1_score(labels, predictions[name]), 'cascade': report}
+        print(f"{name}: {seconds:.2f}s, accuracy: {results[name]['accuracy']:.3f}, f1: {results[name]['f1']:.3f}, "
+              f"estimated time saved: {report['estimated_seconds_saved']:.2f}s")
+        for stage, stats in report['stages'].items():
+            print(f"    {stage}: {stats['pairs']} pairs, pass rate: {stats['pass_rate']:.2f}, {stats['seconds']:.2f}s")
+
+    results['prediction_agreement'] = float((predictions['gates_off'] == predictions['gates_on']).mean())
+    print(f"prediction agreement: {results['prediction_agreement']:.3f}")
+
+    if args.output:
+        with open(os.path.join(INVOCATION_DIR, args.output), 'w') as f:
+            json.dump(results, f, indent=2, default=float)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Deterministic check of deadline-aware degradation, driven by a simulated clock.
+
+The simulated clock advances by one step every time it is read, so a time budget of N.5 steps runs out right after
+the Nth deadline check. Local storage in a temporary directory holds the df10.csv documents (see server_load_test.py)
+with a HashingEncoder stand-in for the Sentence Transformer. Checks:
+    1-1: budgets running out before the Matcher and before BERT skip the expected stages and flag the response as
+         partial; partial responses are not cached; an ample budget gives the same response as no deadline
+    1-n: a budget running out after the first source document scores only that one and persists it; the next check
+         scores only the remaining source document and matches a full, non-incremental check
+
+Usage:
+    $ python deadline_degradation_check.py
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+
+class SimulatedClock:
+    """
+    Clock that advances by step seconds every time it is read.
+    """
+
+    def __init__(self, step=1.0):
+        self.now = 0.0
+        self.step = step
+
+    def __call__(self):
+        now = self.now
+        self.now += self.step
+        return now
+
+
+def serialise(response):
+    """
+    Returns the response as the handlers serialise it.
+    """
+    return json.dumps(response, default=str)
+
+
+def check(condition, message):
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    return condition
+
+
+def check_one_one(cf, input_doc_name, source_doc_name, result_cache):
+    def run(budget_steps):
+        deadline = None if budget_steps is None else cf.Deadline(budget_steps * 1000, SimulatedClock())
+        return cf.get_one_one_matching_output(cf.sentbert_model_name, cf.final_model_name, cf.ngrams_lst, source_doc_name,
+                                              input_doc_name, result_cache=result_cache, deadline=deadline)
+
+    passed = True
+    response = run(1.5) # expires between the Matcher & BERT checks
+    passed &= check(response.get('partial') and response['coverage']['skipped_stages'] == {'bert': [source_doc_name]},
+                    '1-1: BERT is skipped when the budget runs out after the Matcher')
+    response = run(0.5) # expires before the Matcher check
+    passed &= check(response.get('partial') and response['coverage']['skipped_stages'] == {'matcher': [source_doc_name], 'bert': [source_doc_name]},
+                    '1-1: the Matcher & BERT are skipped when the budget runs out before the Matcher')
+    passed &= check(len(os.listdir(result_cache.directory)) == 0, '1-1: partial responses are not cached')
+
+    full_response = run(1000)
+    passed &= check('partial' not in full_response and serialise(full_response) == serialise(run(None)), '1-1: an ample budget gives the full response')
+
+    return passed
+
+
+def check_one_many(cf, input_doc_name):
+    def run(budget_steps, incremental=True):
+        deadline = None if budget_steps is None else cf.Deadline(budget_steps * 1000, SimulatedClock())
+        return cf.get_one_many_matching_output(cf.sentbert_model_name, cf.final_model_name, cf.ngrams_lst, input_doc_name,
+                                               workers=1, incremental=incremental, deadline=deadline)
+
+    passed = True
+    # clock reads: the deadline (0), first source (1), its Matcher (2) & BERT (3) checks, second source (4)
+    response = run(3.5)
+    passed &= check(response.get('partial') and response['coverage'] == {'skipped_stages': {}, 'sources_scored': 1, 'sources_total': 2},
+                    '1-n: remaining source documents are skipped when the budget runs out')
+    state = cf.read_s3_json(cf.s3_bucket, cf.get_one_many_state_filepath(input_doc_name))
+    passed &= check(state['watermark'] == 1 and len(state['sources']) == 1, '1-n: the fully scored source document is persisted')
+
+    response = run(1000)
+    state = cf.read_s3_json(cf.s3_bucket, cf.get_one_many_state_filepath(input_doc_name))
+    passed &= check('partial' not in response and state['watermark'] == 2 and len(state['sources']) == 2,
+                    '1-n: the next check scores the remaining source document')
+    passed &= check(serialise(response) == serialise(run(None, incremental=False)), '1-n: the resumed result matches a full check')
+
+    return passed
+
+
+def main():
+    storage_dir = tempfile.mkdtemp()
+    try:
+        os.environ.update({'LOCAL_STORAGE_DIR': storage_dir, 'WARM_UP_MODELS': '0'})
+        from synthetic import use_app_dir
+        use_app_dir()
+        from server_load_test import populate_local_storage
+        input_doc_names, source_doc_names = populate_local_storage(None)
+
+        import compiled_functions as cf
+        from result_cache import LocalDiskResultCache
+        result_cache = LocalDiskResultCache(os.path.join(storage_dir, 'result_cache'), 3600, 100)
+
+        passed = check_one_one(cf, input_doc_names[0], source_doc_names[0], result_cache)
+        passed &= check_one_many(cf, input_doc_names[0])
+    finally:
+        shutil.rmtree(storage_dir, ignore_errors=True)
+
+    print('all checks passed' if passed else 'some checks failed')
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
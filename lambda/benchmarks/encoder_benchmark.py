@@ -0,0 +1,174 @@
+"""
+Latency versus detection quality of candidate Sentence Transformer encoders for paraphrase detection.
+
+Pairs every text_para of retrain-codes/assets/df10.csv (or --data) with every text_og: the row's own text_og is labelled
+with the row's target and every other text_og is labelled 0, as in cascade_accuracy.py. Each candidate runs in a fresh
+interpreter, which reports:
+    load_seconds: time to import the encoder's libraries & load it (a cold start)
+    sentences_per_sec: encode throughput over all input & source sentences, after a warm-up call
+    peak_rss_mb: peak resident memory of the interpreter
+    f1@0.7: F1 of flagging a pair when any input sentence not directly matched has a source sentence with cosine similarity
+            above 0.7, the paraphrase threshold of one_one_matching_texts
+    f1@0.95: the same at 0.95, the threshold above which modified_output_lists counts paraphrases as direct matches
+
+Candidates are a HuggingFace model ID (e.g. sentence-transformers/paraphrase-MiniLM-L3-v2) or local model directory, a
+local path of a pickled model (e.g. trained_bert_model.joblib), 'quantized:<candidate>' for a copy of the candidate with
+dynamically int8-quantized Linear layers, or 'hashing' for the HashingEncoder stand-in (no download needed).
+
+Usage:
+    $ python encoder_benchmark.py --output encoder_benchmark.json --markdown encoder_benchmark.md
+    $ python encoder_benchmark.py --candidates hashing ~/models/trained_bert_model.joblib quantized:~/models/trained_bert_model.joblib
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DF10_PATH = os.path.normpath(os.path.join(BENCHMARKS_DIR, '..', '..', 'retrain-codes', 'assets', 'df10.csv'))
+DEFAULT_CANDIDATES = ['sentence-transformers/all-MiniLM-L6-v2',
+                      'sentence-transformers/paraphrase-MiniLM-L3-v2',
+                      'quantized:sentence-transformers/all-MiniLM-L6-v2']
+THRESHOLDS = [0.7, 0.95]
+
+
+def load_candidate(candidate):
+    """
+    Returns the encoder of a candidate (see the module docstring).
+    """
+    if candidate.startswith('quantized:'):
+        import torch
+        model = load_candidate(candidate[len('quantized:'):])
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if candidate == 'hashing':
+        from synthetic import HashingEncoder
+        return HashingEncoder()
+    path = os.path.expanduser(candidate)
+    if os.path.isfile(path):
+        import joblib
+        return joblib.load(path)
+
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(path if os.path.isdir(path) else candidate)
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def get_pairs(data_path):
+    import pandas as pd
+    df = pd.read_csv(data_path)
+    pairs, labels = [], []
+    for i, input_doc in enumerate(df['text_para']):
+        for j in range(len(df)):
+            pairs.append((input_doc, j))
+            labels.append(int(df['target'][i]) if i == j else 0)
+
+    return list(df['text_og']), pairs, labels
+
+
+def run_child(candidate, data_path):
+    """
+    Benchmarks one candidate in this interpreter and prints the results as JSON.
+    """
+    from synthetic import use_app_dir
+    use_app_dir()
+    from sklearn.metrics import f1_score
+
+    from compiled_functions import (get_embedding_paraphrase_predictions,
+                                    get_matching_texts, get_non_direct_texts,
+                                    get_preprocessed_sent, get_source_sentences,
+                                    modified_output_lists)
+
+    source_docs, pairs, labels = get_pairs(data_path)
+    source_sents = [get_source_sentences(source_doc) for source_doc in source_docs]
+    # direct matching does not depend on the encoder: the candidate sentences are those of each pair not directly matched
+    nonmatch_lsts = []
+    for input_doc, source_index in pairs:
+        input_text_lst = get_preprocessed_sent(input_doc)
+        _, match_lst = get_matching_texts(input_text_lst, source_docs[source_index], 'source')
+        nonmatch_lsts.append(get_non_direct_texts(input_text_lst, match_lst))
+
+    start = time.perf_counter()
+    model = load_candidate(candidate)
+    load_seconds = time.perf_counter() - start
+
+    sentences = list(dict.fromkeys([sentence for source_sent in source_sents for sentence in source_sent] +
+                                   [sent['sentence'] for nonmatch_lst in nonmatch_lsts for sent in nonmatch_lst]))
+    model.encode(sentences[:8]) # warm-up
+    start = time.perf_counter()
+    model.encode(sentences)
+    encode_seconds = time.perf_counter() - start
+
+    source_embeddings = [model.encode(source_sent) for source_sent in source_sents]
+    flags = {threshold: [] for threshold in THRESHOLDS}
+    for (input_doc, source_index), nonmatch_lst in zip(pairs, nonmatch_lsts):
+        paraphrase_output = get_embedding_paraphrase_predictions(model, [dict(sent) for sent in nonmatch_lst], source_sents[source_index],
+                                                                 source_embeddings[source_index], 'source', THRESHOLDS[0])
+        near_direct_output, _ = modified_output_lists([], paraphrase_output, THRESHOLDS[1])
+        flags[THRESHOLDS[0]].append(int(len(paraphrase_output) > 0))
+        flags[THRESHOLDS[1]].append(int(len(near_direct_output) > 0))
+
+    result = {'load_seconds': load_seconds,
+              'sentences': len(sentences),
+              'sentences_per_sec': len(sentences) / encode_seconds,
+              'peak_rss_mb': peak_rss_mb(),
+              'pairs': len(pairs)}
+    for threshold in THRESHOLDS:
+        result[f'f1@{threshold}'] = f1_score(labels, flags[threshold], zero_division=0)
+    print(json.dumps(result))
+
+
+def get_markdown_table(results):
+    lines = ['encoder | load (s) | sentences/sec | peak RSS (MB) | ' + ' | '.join(f'F1@{threshold}' for threshold in THRESHOLDS),
+             ' | '.join(['---'] * (4 + len(THRESHOLDS)))]
+    for candidate, result in results.items():
+        if 'error' in result:
+            lines.append(f"{candidate} | error: {result['error']}" + ' |' * (3 + len(THRESHOLDS)))
+            continue
+        lines.append(f"{candidate} | {result['load_seconds']:.2f} | {result['sentences_per_sec']:.0f} | {result['peak_rss_mb']:.0f} | "
+                     + ' | '.join(f"{result[f'f1@{threshold}']:.3f}" for threshold in THRESHOLDS))
+
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--candidates', nargs='+', default=DEFAULT_CANDIDATES, help='encoders to compare (see above)')
+    parser.add_argument('--data', default=DF10_PATH, help='CSV with text_og, text_para and target columns')
+    parser.add_argument('--output', default=None, help='optional path of a JSON file to write the results to')
+    parser.add_argument('--markdown', default=None, help='optional path of a markdown file to write the results table to')
+    parser.add_argument('--child', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_child(args.child, os.path.abspath(args.data))
+
+    results = {}
+    for candidate in args.candidates:
+        process = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', candidate, '--data', os.path.abspath(args.data)],
+                                 capture_output=True, text=True)
+        if process.returncode != 0:
+            results[candidate] = {'error': process.stderr.strip().splitlines()[-1] if process.stderr.strip() else f'exit code {process.returncode}'}
+        else:
+            results[candidate] = json.loads(process.stdout.strip().splitlines()[-1])
+        print(f'{candidate}: {json.dumps(results[candidate])}')
+
+    table = get_markdown_table(results)
+    print()
+    print(table)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.markdown:
+        with open(args.markdown, 'w') as f:
+            f.write(table + '\n')
+
+
+if __name__ == '__main__':
+    main()
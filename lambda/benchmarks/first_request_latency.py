@@ -0,0 +1,178 @@
+"""
+First-request latency of the 1-1 handler on a cold start, with and without baked models & warm-up.
+
+Each run is a fresh interpreter (a cold start) that imports one_one_handler (the Lambda initialisation phase) and then
+serves two 1-1 requests on df10.csv texts. S3 is replaced by a local directory behind a stub client that adds a
+simulated request latency and download bandwidth. Modes:
+    download: models are downloaded from "S3" & unpickled on the first request (no baked models, no warm-up)
+    baked: models are read from the baked models directory on the first request
+    baked+warm-up: models are loaded & warmed up during initialisation (WARM_UP_MODELS=1)
+
+Without --model, a pickled HashingEncoder stands in for the Sentence Transformer, so the numbers mostly show the
+download and warm-up overheads; pass a trained_bert_model.joblib for realistic load & first-encode times.
+
+Usage:
+    $ python first_request_latency.py --runs 3 --model ~/models/trained_bert_model.joblib
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DF10_PATH = os.path.join(BENCHMARKS_DIR, '..', '..', 'retrain-codes', 'assets', 'df10.csv')
+FEATURE_COLUMNS = ['c_1', 'c_4', 'c_5', 'lcs_word', 'para_detect_score', 'direct_detect_score']
+
+
+class StubS3Client:
+    """
+    S3 client serving objects from a local directory, with a fixed latency per request and a download bandwidth. Missing
+    objects raise the ClientError of local storage, with the error codes of S3.
+    """
+
+    def __init__(self, root_dir, latency_ms, mb_per_sec):
+        self.root_dir = root_dir
+        self.latency_ms = latency_ms
+        self.mb_per_sec = mb_per_sec
+
+    def head_object(self, Bucket, Key):
+        from local_storage import ClientError
+
+        time.sleep(self.latency_ms / 1000)
+        try:
+            stat = os.stat(os.path.join(self.root_dir, Key))
+        except FileNotFoundError:
+            raise ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, 'HeadObject')
+        return {'ETag': f'"{int(stat.st_mtime_ns)}-{stat.st_size}"',
+                'LastModified': datetime.datetime.fromtimestamp(stat.st_mtime, datetime.timezone.utc)}
+
+    def get_object(self, Bucket, Key):
+        from local_storage import ClientError
+
+        try:
+            head = self.head_object(Bucket, Key)
+        except ClientError:
+            raise ClientError({'Error': {'Code': 'NoSuchKey', 'Message': f'{Key} does not exist.'}}, 'GetObject')
+        with open(os.path.join(self.root_dir, Key), 'rb') as f:
+            content = f.read()
+        time.sleep(len(content) / (self.mb_per_sec * 1e6))
+        return dict(head, Body=io.BytesIO(content))
+
+
+class StubBoto3:
+    def __init__(self, s3_client):
+        self.s3_client = s3_client
+
+    def client(self, service_name):
+        return self.s3_client
+
+
+def run_child(args):
+    """
+    One cold start: initialisation, then two requests. Prints the timings as JSON.
+    """
+    from synthetic import use_app_dir
+    use_app_dir()
+
+    start = time.perf_counter()
+    import compiled_functions
+    import local_storage
+    compiled_functions.boto3 = StubBoto3(StubS3Client(args.s3_dir, args.s3_latency_ms, args.s3_mb_per_sec))
+    compiled_functions.botocore_exceptions = local_storage
+    import one_one_handler
+    init_seconds = time.perf_counter() - start
+
+    import pandas as pd
+    df = pd.read_csv(os.path.normpath(DF10_PATH))
+    request_seconds = []
+    for i in range(2):
+        start = time.perf_counter()
+        compiled_functions.one_one_matching_flag_score(one_one_handler.sentbert_model_name, one_one_handler.final_model_name,
+                                                       one_one_handler.ngrams_lst, df['text_og'][i], 'source', df['text_para'][i], 'input')
+        request_seconds.append(time.perf_counter() - start)
+
+    print(json.dumps({'init_seconds': init_seconds, 'first_request_seconds': request_seconds[0], 'second_request_seconds': request_seconds[1]}))
+
+
+def prepare_models(s3_dir, baked_dir, model_path):
+    """
+    Puts the models into the stub S3 directory and bakes the same versions into baked_dir.
+    """
+    import joblib
+    import pandas as pd
+    from sklearn.linear_model import LogisticRegression
+
+    sys.path.insert(0, os.path.join(BENCHMARKS_DIR, '..', 'app'))
+    from compiled_functions import final_model_name, get_s3_object_version, sentbert_model_name
+    from synthetic import HashingEncoder
+
+    for s3_filepath in [sentbert_model_name, final_model_name]:
+        os.makedirs(os.path.dirname(os.path.join(s3_dir, s3_filepath)), exist_ok=True)
+    if model_path:
+        shutil.copy(model_path, os.path.join(s3_dir, sentbert_model_name))
+    else:
+        joblib.dump(HashingEncoder(), os.path.join(s3_dir, sentbert_model_name))
+    df = pd.read_csv(os.path.normpath(DF10_PATH))
+    joblib.dump(LogisticRegression().fit(df[FEATURE_COLUMNS], df['target']), os.path.join(s3_dir, final_model_name))
+
+    s3_client = StubS3Client(s3_dir, 0, 1e6)
+    os.makedirs(baked_dir)
+    manifest = {}
+    for s3_filepath in [sentbert_model_name, final_model_name]:
+        filename = os.path.basename(s3_filepath)
+        shutil.copy(os.path.join(s3_dir, s3_filepath), os.path.join(baked_dir, filename))
+        manifest[s3_filepath] = {'version': get_s3_object_version(s3_client.head_object('', s3_filepath)), 'file': filename}
+    with open(os.path.join(baked_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=None, help='local path of a trained_bert_model.joblib to use instead of the hashing encoder')
+    parser.add_argument('--runs', type=int, default=3, help='cold starts per mode, the median is reported')
+    parser.add_argument('--s3-latency-ms', type=float, default=30, help='simulated latency of each S3 request')
+    parser.add_argument('--s3-mb-per-sec', type=float, default=80, help='simulated S3 download bandwidth')
+    parser.add_argument('--output', default=None, help='optional path of a JSON file to write the results to')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--s3-dir', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_child(args)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        s3_dir, baked_dir = os.path.join(tmp_dir, 's3'), os.path.join(tmp_dir, 'baked_models')
+        prepare_models(s3_dir, baked_dir, args.model)
+        modes = {'download': {'BAKED_MODELS_DIR': os.path.join(tmp_dir, 'none'), 'WARM_UP_MODELS': '0'},
+                 'baked': {'BAKED_MODELS_DIR': baked_dir, 'WARM_UP_MODELS': '0'},
+                 'baked+warm-up': {'BAKED_MODELS_DIR': baked_dir, 'WARM_UP_MODELS': '1'}}
+
+        results = {}
+        for mode, env in modes.items():
+            runs = []
+            for _ in range(args.runs):
+                output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', '--s3-dir', s3_dir,
+                                         '--s3-latency-ms', str(args.s3_latency_ms), '--s3-mb-per-sec', str(args.s3_mb_per_sec)],
+                                        env=dict(os.environ, **env), capture_output=True, text=True, check=True).stdout
+                runs.append(json.loads(output.strip().splitlines()[-1]))
+            results[mode] = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+            print(f"{mode}: init {results[mode]['init_seconds']:.3f}s, first request {results[mode]['first_request_seconds']:.3f}s, "
+                  f"second request {results[mode]['second_request_seconds']:.3f}s")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Cold-start import budget of each Lambda entry point, summarised from `python -X importtime`.
+
+Each entry point is imported in a fresh interpreter (as on a Lambda cold start) from the app directory, and its handler is
+looked up the way the Lambda runtime does. The report lists the total import time and the heaviest top-level packages per
+handler. With --before, the same handlers are also measured in the lambda/app directory of an earlier git revision
+(where they are all imported from plagiarism_detector) and both are shown side by side.
+
+Usage:
+    $ python import_time_report.py --before HEAD~1 --output import_times.md
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+from synthetic import APP_DIR
+
+# handler -> entry modules in order of preference; older trees only have plagiarism_detector
+ENTRY_POINTS = {
+    'file_upload_1ton': ['upload_handler', 'plagiarism_detector'],
+    'plagiarism_detector_1to1': ['one_one_handler', 'plagiarism_detector'],
+    'plagiarism_detector_1ton': ['one_many_handler', 'plagiarism_detector'],
+    'plagiarism_detector_1ton_worker': ['one_many_handler', 'plagiarism_detector'],
+    'plagiarism_detector_batch': ['batch_handler', 'plagiarism_detector'],
+}
+
+
+def parse_importtime(stderr):
+    """
+    Returns (module, depth, cumulative microseconds) for every line of -X importtime output.
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|', 2)
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        entries.append((name.strip(), depth, int(cumulative)))
+    return entries
+
+
+def measure_entry_point(app_dir, module, handler, repeat):
+    """
+    Returns the import time in ms of module and its handler, and the cumulative ms of each top-level package it pulled in.
+    The fastest of repeat runs is kept.
+    """
+    startup = {name for name, depth, _ in run_importtime(app_dir, 'pass') if depth == 0}
+    best = None
+    for _ in range(repeat):
+        entries = run_importtime(app_dir, f'import {module}; getattr({module}, {handler!r})')
+        total_ms = sum(cumulative for name, depth, cumulative in entries if depth == 0 and name not in startup) / 1000
+        if best is None or total_ms < best[0]:
+            packages = {}
+            for name, depth, cumulative in entries:
+                if '.' not in name and name not in startup and name != module:
+                    packages[name] = max(packages.get(name, 0), cumulative / 1000)
+            best = (total_ms, packages)
+    return best
+
+
+def run_importtime(app_dir, code):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=app_dir, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'{code!r} failed in {app_dir}:\n{result.stderr[-2000:]}')
+    return parse_importtime(result.stderr)
+
+
+def measure_app_dir(app_dir, repeat, top):
+    results = {}
+    for handler, modules in ENTRY_POINTS.items():
+        module = next(module for module in modules if os.path.exists(os.path.join(app_dir, f'{module}.py')))
+        total_ms, packages = measure_entry_point(app_dir, module, handler, repeat)
+        heaviest = sorted(packages.items(), key=lambda item: -item[1])[:top]
+        results[handler] = {'module': module, 'total_ms': total_ms, 'heaviest_packages_ms': dict(heaviest)}
+    return results
+
+
+def export_app_dir(ref, target_dir):
+    """
+    Extracts lambda/app of a git revision into target_dir and returns its path.
+    """
+    repo_dir = subprocess.run(['git', 'rev-parse', '--show-toplevel'], cwd=APP_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    archive = os.path.join(target_dir, 'app.tar')
+    subprocess.run(['git', 'archive', '-o', archive, ref, 'lambda/app'], cwd=repo_dir, check=True)
+    with tarfile.open(archive) as tar:
+        tar.extractall(target_dir)
+    return os.path.join(target_dir, 'lambda', 'app')
+
+
+def format_report(after, before=None):
+    lines = ['| handler | entry module | import ms | heaviest packages (ms) |', '| --- | --- | --- | --- |']
+    if before is not None:
+        lines = ['| handler | before: module | before ms | after: module | after ms | after: heaviest packages (ms) |',
+                 '| --- | --- | --- | --- | --- | --- |']
+    for handler, result in after.items():
+        heaviest = ', '.join(f'{name} {ms:.0f}' for name, ms in result['heaviest_packages_ms'].items())
+        if before is None:
+            lines.append(f"| {handler} | {result['module']} | {result['total_ms']:.0f} | {heaviest} |")
+        else:
+            lines.append(f"| {handler} | {before[handler]['module']} | {before[handler]['total_ms']:.0f} | "
+                         f"{result['module']} | {result['total_ms']:.0f} | {heaviest} |")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--before', default=None, help='git revision to compare against, e.g. HEAD~1')
+    parser.add_argument('--repeat', type=int, default=3, help='imports per entry point, the fastest is kept')
+    parser.add_argument('--top', type=int, default=5, help='number of heaviest packages listed per entry point')
+    parser.add_argument('--output', default=None, help='optional path of a markdown (.md) or JSON (.json) report')
+    args = parser.parse_args()
+
+    after = measure_app_dir(APP_DIR, args.repeat, args.top)
+    before = None
+    if args.before:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            before = measure_app_dir(export_app_dir(args.before, tmp_dir), args.repeat, args.top)
+
+    report = format_report(after, before)
+    print(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            if args.output.endswith('.json'):
+                json.dump({'after': after, 'before': before}, f, indent=2)
+            else:
+                f.write(report + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Parity of the NumPy-only final model predictor (app/linear_predictor.py) with the scikit-learn models it replaces.
+
+Each model is fitted on the feature columns of retrain-codes/assets/df10.csv (or --data), exported with the training
+job's exporter (lr_search.export_coefficients) and read back with LinearPredictor.load. Checks:
+    - probabilities & flags match predict_proba & predict on the df10 rows, random feature vectors in [0, 1] and
+      large-magnitude vectors (for the numerical stability of the sigmoid)
+    - the SGDClassifier of the online update converts with LinearPredictor.from_model
+    - the coefficient file is read without importing scikit-learn or pandas
+    - the matching functions score with the coefficient file in storage, and convert the pickled model without it or
+      when it was exported from another model (its model_sha256 differs), with a different final model version each time
+Reports the time of scoring one feature vector and --rows vectors against scikit-learn.
+
+Usage:
+    $ python linear_predictor_parity.py
+    $ python linear_predictor_parity.py --rows 100000
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+TRAIN_CODES_DIR = os.path.normpath(os.path.join(BENCHMARKS_DIR, '..', '..', 'retrain-codes', 'train-custom-ml', 'container', 'codes'))
+TOLERANCE = 1e-12
+
+
+def check(condition, message):
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    return condition
+
+
+def get_models(X, y):
+    import numpy as np
+    from sklearn.linear_model import LogisticRegression, SGDClassifier
+    from sklearn.model_selection import GridSearchCV
+
+    from lr_search import get_no_penalty, successive_halving_search
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        halving_model, _ = successive_halving_search(X, y, [{'penalty': ['l2', 'elasticnet'], 'C': np.logspace(-2, 2, 5),
+                                                             'solver': ['lbfgs', 'saga'], 'l1_ratio': [0.5]}], cv=3, min_iter=100, max_iter=900)
+        return {'LogisticRegression': LogisticRegression().fit(X, y),
+                'LogisticRegression (elasticnet, saga)': LogisticRegression(penalty='elasticnet', solver='saga', l1_ratio=0.5, max_iter=5000).fit(X, y),
+                'LogisticRegression (no penalty)': LogisticRegression(penalty=get_no_penalty(), max_iter=5000).fit(X, y),
+                'successive halving best model': halving_model,
+                'GridSearchCV': GridSearchCV(LogisticRegression(), {'C': [0.1, 1, 10]}, cv=3).fit(X, y),
+                'SGDClassifier (online update)': SGDClassifier(loss='log_loss', random_state=0).fit(X, y)}
+
+
+def check_without_sklearn(app_dir, coefficients_path, n_features):
+    """
+    Returns whether the coefficient file is read & scored in a fresh interpreter without importing scikit-learn or pandas.
+    """
+    code = (f"import sys; sys.path.insert(0, {app_dir!r}); from linear_predictor import LinearPredictor; "
+            f"predictor = LinearPredictor.load(open({coefficients_path!r}, 'rb')); predictor.predict([[0.5] * {n_features}]); "
+            "print(sorted(name for name in sys.modules if name.split('.')[0] in ['sklearn', 'pandas', 'scipy']))")
+    process = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+
+    return process.returncode == 0 and process.stdout.strip() == '[]'
+
+
+def check_matching_functions(model, other_model, feature_dict, coefficients_path):
+    """
+    Returns whether get_flag_score_prediction matches model on local storage, without and with a coefficient file, and
+    whether the coefficient file stops being used (and the final model version changes) once another final model is
+    uploaded without it.
+    """
+    import joblib
+    import pandas as pd
+
+    import compiled_functions as cf
+    from lr_search import export_coefficients
+    from server_load_test import FEATURE_COLUMNS
+
+    def get_expected(model):
+        feature_df = pd.DataFrame(feature_dict, index=[0])
+        return model.predict(feature_df)[0], model.predict_proba(feature_df)[0, 1]
+
+    def matches(prediction, expected):
+        return prediction[0] == expected[0] and abs(prediction[1] - expected[1]) <= TOLERANCE
+
+    local_file = os.path.join(tempfile.gettempdir(), 'final_model.joblib')
+    joblib.dump(model, local_file)
+    cf.upload_to_s3(local_file, cf.s3_bucket, cf.final_model_name)
+    converted = cf.get_flag_score_prediction(cf.final_model_name, feature_dict)
+    converted_version = cf.get_final_model_version(cf.s3_bucket, cf.final_model_name)
+
+    export_coefficients(model, FEATURE_COLUMNS, coefficients_path, model_filepath=local_file)
+    cf.upload_to_s3(coefficients_path, cf.s3_bucket, cf.get_coefficients_filepath(cf.final_model_name))
+    loaded = cf.get_flag_score_prediction(cf.final_model_name, feature_dict)
+    predictor = cf.load_final_predictor(cf.s3_bucket, cf.final_model_name)
+    coefficients_version = cf.get_final_model_version(cf.s3_bucket, cf.final_model_name)
+
+    joblib.dump(other_model, local_file)
+    cf.upload_to_s3(local_file, cf.s3_bucket, cf.final_model_name)
+    stale = cf.get_flag_score_prediction(cf.final_model_name, feature_dict)
+    stale_version = cf.get_final_model_version(cf.s3_bucket, cf.final_model_name)
+    os.remove(local_file)
+
+    return (predictor.metadata.get('sklearn_version') is not None and predictor.metadata.get('model_sha256') is not None
+            and matches(converted, get_expected(model)) and matches(loaded, get_expected(model)) and matches(stale, get_expected(other_model))
+            and len({converted_version, coefficients_version, stale_version}) == 3 and coefficients_version.startswith('coefficients:'))
+
+
+def time_call(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default=None, help='CSV with the feature columns and target (default df10.csv)')
+    parser.add_argument('--rows', type=int, default=10000, help='number of random feature vectors to compare & time')
+    args = parser.parse_args()
+
+    storage_dir = tempfile.mkdtemp()
+    os.environ.update({'LOCAL_STORAGE_DIR': storage_dir, 'WARM_UP_MODELS': '0'})
+    sys.path.insert(0, TRAIN_CODES_DIR)
+    from synthetic import APP_DIR, use_app_dir
+    use_app_dir()
+    import numpy as np
+    import pandas as pd
+
+    from linear_predictor import LinearPredictor
+    from lr_search import export_coefficients
+    from server_load_test import DF10_PATH, FEATURE_COLUMNS
+
+    df = pd.read_csv(args.data or DF10_PATH)
+    X, y = df[FEATURE_COLUMNS], df['target'].astype(int)
+    rng = np.random.default_rng(0)
+    inputs = {'df10 rows': X,
+              'random vectors': pd.DataFrame(rng.uniform(0, 1, (args.rows, len(FEATURE_COLUMNS))), columns=FEATURE_COLUMNS),
+              'large-magnitude vectors': pd.DataFrame(rng.uniform(-1000, 1000, (1000, len(FEATURE_COLUMNS))), columns=FEATURE_COLUMNS)}
+
+    passed = True
+    try:
+        models = get_models(X, y)
+        for name, model in models.items():
+            coefficients_path = os.path.join(storage_dir, 'final_model_coefficients.json')
+            export_coefficients(model, FEATURE_COLUMNS, coefficients_path, getattr(model, 'best_params_', None))
+            with open(coefficients_path, 'rb') as f:
+                predictor = LinearPredictor.load(f)
+            for input_name, features in inputs.items():
+                flags, scores = predictor.predict(features)
+                max_diff = float(np.abs(scores - model.predict_proba(features)[:, 1]).max())
+                passed &= check(max_diff <= TOLERANCE and (flags == model.predict(features)).all(),
+                                f'{name}: {input_name} match scikit-learn (max probability difference {max_diff:.1e})')
+
+        online_model = models['SGDClassifier (online update)']
+        flags, scores = LinearPredictor.from_model(online_model, FEATURE_COLUMNS).predict(inputs['random vectors'])
+        passed &= check(np.abs(scores - online_model.predict_proba(inputs['random vectors'])[:, 1]).max() <= TOLERANCE
+                        and (flags == online_model.predict(inputs['random vectors'])).all(),
+                        'the online SGDClassifier converts with LinearPredictor.from_model')
+
+        model = models['LogisticRegression']
+        export_coefficients(model, FEATURE_COLUMNS, coefficients_path)
+        passed &= check(check_without_sklearn(APP_DIR, coefficients_path, len(FEATURE_COLUMNS)),
+                        'the coefficient file is scored without importing scikit-learn, pandas or scipy')
+        feature_dict = {column: float(value) for column, value in X.iloc[0].items()}
+        passed &= check(check_matching_functions(model, models['LogisticRegression (no penalty)'], feature_dict, coefficients_path),
+                        'get_flag_score_prediction matches scikit-learn from the pickled model and from the coefficient file, '
+                        'and ignores a coefficient file exported from another model')
+
+        with open(coefficients_path, 'rb') as f:
+            predictor = LinearPredictor.load(f)
+        single_df = pd.DataFrame(feature_dict, index=[0])
+        sklearn_single = time_call(lambda: (model.predict(single_df), model.predict_proba(single_df)), 200)
+        numpy_single = time_call(lambda: predictor.predict(feature_dict), 200)
+        sklearn_batch = time_call(lambda: (model.predict(inputs['random vectors']), model.predict_proba(inputs['random vectors'])), 5)
+        numpy_batch = time_call(lambda: predictor.predict(inputs['random vectors']), 5)
+        print(f'     one feature vector: scikit-learn {sklearn_single * 1e6:.0f} us (DataFrame, predict + predict_proba), '
+              f'NumPy {numpy_single * 1e6:.0f} us (dict)')
+        print(f'     {args.rows} feature vectors: scikit-learn {sklearn_batch * 1e3:.2f} ms, NumPy {numpy_batch * 1e3:.2f} ms')
+    finally:
+        shutil.rmtree(storage_dir, ignore_errors=True)
+
+    print('all checks passed' if passed else 'some checks failed')
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
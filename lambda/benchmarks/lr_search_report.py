@@ -0,0 +1,112 @@
+"""
+Wall time and best F1 of the final model's hyperparameter search: the exhaustive GridSearchCV grid the custom-ml
+training job used to run, against the successive-halving search (lr_search.py) with an empty and a warm fold cache.
+
+Uses the feature columns of retrain-codes/assets/df10.csv (or --data), with the training job's train-test split.
+Reports the mean cross-validated F1 of the best candidate and the F1 of the refitted model on the held-out rows.
+
+Usage:
+    $ python lr_search_report.py --output lr_search_report.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import f1_score
+from sklearn.model_selection import GridSearchCV, train_test_split
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+TRAIN_CODES_DIR = os.path.join(BENCHMARKS_DIR, '..', '..', 'retrain-codes', 'train-custom-ml', 'container', 'codes')
+DF10_PATH = os.path.join(BENCHMARKS_DIR, '..', '..', 'retrain-codes', 'assets', 'df10.csv')
+FEATURE_COLUMNS = ['c_1', 'c_4', 'c_5', 'lcs_word', 'para_detect_score', 'direct_detect_score']
+
+os.environ.setdefault('PYTHONWARNINGS', 'ignore') # also silences the failing fits of the exhaustive grid in GridSearchCV's worker processes
+sys.path.insert(0, os.path.normpath(TRAIN_CODES_DIR))
+from lr_search import successive_halving_search
+
+# grid of the training job before successive halving, including its invalid solver/penalty pairs
+EXHAUSTIVE_PARAM_GRID = [
+    {'penalty': ['l2', 'elasticnet', 'none'],
+     'C': np.logspace(-4, 4, 20),
+     'solver': ['lbfgs', 'newton-cg', 'liblinear', 'sag', 'saga'],
+     'max_iter': [100, 1000, 2500, 5000]}
+]
+# grid of the training job with successive halving
+HALVING_PARAM_GRID = [
+    {'penalty': ['l2', 'elasticnet', 'none'],
+     'C': np.logspace(-4, 4, 20),
+     'solver': ['lbfgs', 'newton-cg', 'liblinear', 'sag', 'saga'],
+     'l1_ratio': [0.25, 0.5, 0.75]}
+]
+
+
+def run_exhaustive(X_train, y_train, X_test, y_test):
+    start = time.perf_counter()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        clf = GridSearchCV(LogisticRegression(), param_grid=EXHAUSTIVE_PARAM_GRID, cv=3, n_jobs=-1, scoring='f1', error_score=np.nan)
+        clf.fit(X_train, y_train)
+    seconds = time.perf_counter() - start
+    n_fits = len(clf.cv_results_['params']) * 3
+
+    return {'seconds': seconds,
+            'fits': n_fits,
+            'failed_fits': int(np.isnan(clf.cv_results_['mean_test_score']).sum()) * 3,
+            'best_cv_f1': float(clf.best_score_),
+            'test_f1': float(f1_score(y_test, clf.predict(X_test), zero_division=0)),
+            'best_params': {key: value.item() if hasattr(value, 'item') else value for key, value in clf.best_params_.items()}}
+
+
+def run_halving(X_train, y_train, X_test, y_test, cache):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        model, report = successive_halving_search(X_train, y_train, HALVING_PARAM_GRID, cv=3, min_iter=100, max_iter=5000, eta=3, cache=cache)
+
+    return {'seconds': report['seconds'],
+            'fits': report['fits'],
+            'cached_fits': report['cached_fits'],
+            'candidates': report['candidates'],
+            'pruned_combinations': report['pruned_combinations'],
+            'best_cv_f1': report['best_score'],
+            'test_f1': float(f1_score(y_test, model.predict(X_test), zero_division=0)),
+            'best_params': report['best_params']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default=DF10_PATH, help='CSV with the feature columns and target')
+    parser.add_argument('--skip-exhaustive', action='store_true', help='only run the successive-halving search')
+    parser.add_argument('--output', default=None, help='optional path of a JSON file to write the results to')
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.data, index_col=[0])
+    train, test = train_test_split(df, test_size=0.2, random_state=0)
+    data = (train[FEATURE_COLUMNS], train['target'], test[FEATURE_COLUMNS], test['target'])
+
+    results = {}
+    if not args.skip_exhaustive:
+        results['exhaustive grid'] = run_exhaustive(*data)
+    cache = {}
+    results['successive halving'] = run_halving(*data, cache)
+    results['successive halving (cached)'] = run_halving(*data, cache)
+
+    print('search | wall time (s) | fits | best CV F1 | test F1')
+    print('--- | --- | --- | --- | ---')
+    for name, result in results.items():
+        fits = f"{result['fits']}" + (f" ({result['failed_fits']} failed)" if 'failed_fits' in result else '') \
+            + (f" + {result['cached_fits']} cached" if result.get('cached_fits') else '')
+        print(f"{name} | {result['seconds']:.2f} | {fits} | {result['best_cv_f1']:.3f} | {result['test_f1']:.3f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, default=str)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+"""
+Memory of the matching pipeline against document size, from the memory profiling mode of the handlers (see app/metrics.py).
+
+Runs on local storage in a temporary directory (see server_load_test.py), with the HashingEncoder stand-in for the
+Sentence Transformer (or --model). For each of --sizes, a synthetic input & source document pair of that many words
+is uploaded as PDFs through the upload handler and matched through the 1-1 handler (result cache off), both with
+memory profiling on. The peak traced memory of every stage (pdf_parse, text_construction, count_vectors,
+bert_encoding, ...) and of each request is read from their EMF lines, and a line peak_mb = intercept + slope * words
+is fitted to each, along with the exponent of a power law fit (about 1 for linear growth, 2 for quadratic).
+
+--predict-words extrapolates the request peaks to larger documents and suggests a Lambda memory setting: the peak RSS
+of the process at the largest size, plus the extrapolated growth of the request peak, times --headroom. Traced memory
+does not include memory allocated outside of Python's allocators (e.g. PyTorch), which the RSS covers.
+
+With --baseline, metrics whose peak at a size exceeds the baseline's by more than --tolerance (and by at least
+--min-regression-mb) are flagged and the script exits with 1.
+
+Usage:
+    $ python memory_scaling.py
+    $ python memory_scaling.py --sizes 1000 4000 16000 64000 --predict-words 200000 --output memory_scaling.json
+    $ python memory_scaling.py --save-baseline memory_baseline.json
+    $ python memory_scaling.py --baseline memory_baseline.json
+"""
+import argparse
+import base64
+import io
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import redirect_stdout
+
+from synthetic import make_pdf, use_app_dir
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+class Context:
+    def __init__(self, request_id):
+        self.aws_request_id = request_id
+
+    def get_remaining_time_in_millis(self):
+        return 900000
+
+
+def call_handler(handler, event, request_id):
+    """
+    Returns the handler's response and the EMF record it logged.
+    """
+    from metrics import parse_metrics_line
+
+    output = io.StringIO()
+    with redirect_stdout(output):
+        response = handler(event, Context(request_id))
+    records = [record for record in map(parse_metrics_line, output.getvalue().splitlines()) if record is not None]
+
+    return response, records[-1]
+
+
+def get_memory_values(record, prefix):
+    """
+    Returns the memory metrics (MB) of an EMF record, prefixed with the request type.
+    """
+    names = [metric['Name'] for directive in record['_aws']['CloudWatchMetrics'] for metric in directive['Metrics']
+             if metric.get('Unit') == 'Megabytes']
+
+    return {f'{prefix}.{name}': record[name] for name in names}
+
+
+def profile_size(handlers, n_words, copy_rate, seed, tag=''):
+    """
+    Uploads & matches a synthetic pair of n_words words with memory profiling on. Returns metric -> MB and the top
+    allocation sites of the 1-1 request. Documents are named after tag & n_words.
+    """
+    from stage_benchmark import get_synthetic_pairs
+
+    upload, one_one = handlers
+    (input_doc, source_doc), = get_synthetic_pairs(n_words, 1, copy_rate, seed)
+    values = {}
+    doc_names = []
+    for role, doc in [('source', source_doc), ('input', input_doc)]:
+        doc_name = f'{tag}{role}_{n_words}.pdf'
+        event = {'body-json': base64.b64encode(make_pdf(doc)).decode('ascii'),
+                 'params': {'header': {'file_name': doc_name, 'user_id': 'memory-scaling', 'x_profile_memory': '1'}}}
+        response, record = call_handler(upload, event, f'upload-{tag}{role}-{n_words}')
+        if response['statusCode'] != 200:
+            raise RuntimeError(f"upload of {doc_name} failed: {response['body']}")
+        for name, value in get_memory_values(record, 'upload').items():
+            values[name] = max(values.get(name, 0), value)
+        doc_names.append(doc_name)
+
+    body = {'user_id': 'memory-scaling', 'source_doc_name': doc_names[0], 'input_doc_name': doc_names[1], 'profile_memory': True}
+    response, record = call_handler(one_one, {'body': json.dumps(body)}, f'1to1-{tag}{n_words}')
+    if response['statusCode'] != 200:
+        raise RuntimeError(f"1-1 matching of {n_words} words failed: {response['body']}")
+    values.update(get_memory_values(record, '1to1'))
+
+    return values, record.get('top_allocations', [])
+
+
+def fit_line(xs, ys):
+    """
+    Returns the least-squares (intercept, slope, r2) of ys against xs.
+    """
+    n = len(xs)
+    mean_x, mean_y = sum(xs) / n, sum(ys) / n
+    sxx = sum((x - mean_x) ** 2 for x in xs)
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    slope = sxy / sxx if sxx > 0 else 0.0
+    intercept = mean_y - slope * mean_x
+    ss_res = sum((y - intercept - slope * x) ** 2 for x, y in zip(xs, ys))
+    ss_tot = sum((y - mean_y) ** 2 for y in ys)
+
+    return intercept, slope, 1 - ss_res / ss_tot if ss_tot > 0 else 1.0
+
+
+def fit_curves(sizes, results):
+    """
+    Returns metric -> {intercept_mb, mb_per_1k_words, r2, exponent} of the peaks measured at each size. The exponent is
+    the slope of log(peak) against log(words), None if a peak is 0. max_rss_mb, the high-water mark of the process over
+    all sizes, is not fitted.
+    """
+    fits = {}
+    for metric in sorted({metric for values in results.values() for metric in values if not metric.endswith('max_rss_mb')}):
+        xs = [n_words for n_words in sizes if metric in results[str(n_words)]]
+        ys = [results[str(n_words)][metric] for n_words in xs]
+        if len(xs) < 2:
+            continue
+        intercept, slope, r2 = fit_line(xs, ys)
+        exponent = fit_line([math.log(x) for x in xs], [math.log(y) for y in ys])[1] if min(ys) > 0 else None
+        fits[metric] = {'intercept_mb': intercept, 'mb_per_1k_words': slope * 1000, 'r2': r2, 'exponent': exponent}
+
+    return fits
+
+
+def get_memory_suggestions(sizes, results, fits, predict_words, headroom):
+    """
+    Returns (words, request type, predicted request peak MB, suggested Lambda memory MB) for each of predict_words.
+    """
+    largest = results[str(max(sizes))]
+    suggestions = []
+    for n_words in predict_words:
+        for request in ['upload', '1to1']:
+            fit = fits.get(f'{request}.peak_mb')
+            if fit is None or f'{request}.max_rss_mb' not in largest:
+                continue
+            predicted = fit['intercept_mb'] + fit['mb_per_1k_words'] * n_words / 1000
+            growth = max(0.0, predicted - largest[f'{request}.peak_mb'])
+            memory = math.ceil((largest[f'{request}.max_rss_mb'] + growth) * headroom / 64) * 64
+            suggestions.append((n_words, request, predicted, memory))
+
+    return suggestions
+
+
+def compare_to_baseline(results, baseline, tolerance, min_regression_mb):
+    """
+    Returns the (size, metric, baseline MB, MB, ratio) of every peak of results above the baseline's by more than
+    tolerance (relative) and min_regression_mb (absolute).
+    """
+    regressions = []
+    for n_words, values in results.items():
+        for metric, value in values.items():
+            base = baseline.get(n_words, {}).get(metric)
+            if base is None:
+                continue
+            ratio = value / base if base > 0 else float('inf')
+            if ratio > 1 + tolerance and value - base >= min_regression_mb:
+                regressions.append((n_words, metric, base, value, ratio))
+
+    return regressions
+
+
+def format_table(sizes, results, fits):
+    lines = ['metric | ' + ' | '.join(f'{n_words} words (MB)' for n_words in sizes) + ' | intercept (MB) | MB per 1k words | exponent | r2',
+             ' | '.join(['---'] * (len(sizes) + 5))]
+    for metric, fit in fits.items():
+        peaks = ' | '.join(f"{results[str(n_words)][metric]:.2f}" if metric in results[str(n_words)] else '-' for n_words in sizes)
+        exponent = f"{fit['exponent']:.2f}" if fit['exponent'] is not None else '-'
+        lines.append(f"{metric} | {peaks} | {fit['intercept_mb']:.2f} | {fit['mb_per_1k_words']:.3f} | {exponent} | {fit['r2']:.3f}")
+
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 2000, 4000, 8000, 16000], help='words per synthetic document')
+    parser.add_argument('--copy-rate', type=float, default=0.2, help='fraction of synthetic input sentences copied from the source')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--model', default=None, help='local path of a trained_bert_model.joblib to use instead of the hashing encoder')
+    parser.add_argument('--predict-words', type=int, nargs='*', default=[50000, 100000], help='document sizes to suggest a memory setting for')
+    parser.add_argument('--headroom', type=float, default=1.5, help='factor applied to the predicted memory in the suggestions')
+    parser.add_argument('--output', default=None, help='optional path of a JSON file to write the results to')
+    parser.add_argument('--baseline', default=None, help='JSON results of an earlier run to compare against')
+    parser.add_argument('--save-baseline', default=None, help='optional path to write the results to as a baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='relative increase of a peak flagged as a regression')
+    parser.add_argument('--min-regression-mb', type=float, default=1.0, help='smallest absolute increase flagged as a regression')
+    args = parser.parse_args()
+
+    sizes = sorted(args.sizes)
+    storage_dir = tempfile.mkdtemp()
+    os.environ.update({'LOCAL_STORAGE_DIR': storage_dir, 'RESULT_CACHE': '0', 'WARM_UP_MODELS': '0', 'CASCADE_GATES': '0',
+                       'METRICS': '1', 'MEMORY_PROFILE': '0'})
+    invocation_dir = use_app_dir()
+    sys.path.insert(0, LAMBDA_DIR)
+    results, top_allocations = {}, {}
+    try:
+        import one_one_handler
+        import upload_handler
+        from server_load_test import populate_local_storage
+
+        populate_local_storage(args.model)
+        handlers = (upload_handler.file_upload_1ton, one_one_handler.plagiarism_detector_1to1)
+        profile_size(handlers, min(sizes), args.copy_rate, args.seed + 1, 'warm_up_') # loads the models & the lazy imports
+        for n_words in sizes:
+            results[str(n_words)], top_allocations[str(n_words)] = profile_size(handlers, n_words, args.copy_rate, args.seed)
+            print(f"{n_words} words: upload peak {results[str(n_words)].get('upload.peak_mb', 0):.2f} MB, "
+                  f"1-1 peak {results[str(n_words)].get('1to1.peak_mb', 0):.2f} MB", flush=True)
+    finally:
+        shutil.rmtree(storage_dir, ignore_errors=True)
+
+    fits = fit_curves(sizes, results)
+    suggestions = get_memory_suggestions(sizes, results, fits, args.predict_words, args.headroom)
+    print()
+    print(format_table(sizes, results, fits))
+    print()
+    print(f'top allocation sites of the 1-1 request at {max(sizes)} words:')
+    for site in top_allocations[str(max(sizes))]:
+        print(f"    {site['site']}: {site['mb']:.2f} MB in {site['blocks']} blocks")
+    print()
+    for n_words, request, predicted, memory in suggestions:
+        print(f'{n_words} words, {request}: predicted request peak {predicted:.1f} MB, suggested Lambda memory {memory} MB')
+
+    report = {'config': {'sizes': sizes, 'copy_rate': args.copy_rate, 'seed': args.seed, 'encoder': args.model or 'hashing'},
+              'results': results, 'fits': fits, 'top_allocations': top_allocations,
+              'suggestions': [{'words': n_words, 'request': request, 'predicted_peak_mb': predicted, 'memory_mb': memory}
+                              for n_words, request, predicted, memory in suggestions]}
+    passed = True
+    if args.baseline:
+        with open(os.path.join(invocation_dir, args.baseline)) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline['results'], args.tolerance, args.min_regression_mb)
+        report['regressions'] = [{'words': n_words, 'metric': metric, 'baseline_mb': base, 'mb': value, 'ratio': ratio}
+                                 for n_words, metric, base, value, ratio in regressions]
+        print()
+        for n_words, metric, base, value, ratio in regressions:
+            print(f'REGRESSION {n_words} words {metric}: {base:.2f} MB -> {value:.2f} MB ({(ratio - 1) * 100:+.1f}%)')
+        print(f'{len(regressions)} regression(s) beyond {args.tolerance * 100:.0f}%' if regressions else 'no regressions')
+        passed = not regressions
+
+    for path in [args.output, args.save_baseline]:
+        if path:
+            with open(os.path.join(invocation_dir, path), 'w') as f:
+                json.dump(report, f, indent=2)
+
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+Check of the per-request metrics (app/metrics.py) emitted by the handlers, on local storage.
+
+Local storage in a temporary directory holds the df10.csv documents and models (see server_load_test.py). The 1-1, 1-n
+and batch handlers are called and their stdout captured. Checks:
+    - every request logs exactly one EMF line, with every declared metric present and at most 100 metrics
+    - the lines carry the stage durations of the pipeline, sentence & source counts and result cache hits
+    - the stage durations of a request add up to no more than its total time (nested stages are not counted twice)
+    - metrics_collector.py summarises the lines
+    - a request asking for memory profiling (body field or header) logs the peak memory of its stages, others do not,
+      and tracemalloc is stopped after it
+Reports the cost of a timer inside and outside an instrumented request.
+
+Usage:
+    $ python metrics_check.py
+"""
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def check(condition, message):
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    return condition
+
+
+class Context:
+    def __init__(self, request_id):
+        self.aws_request_id = request_id
+
+    def get_remaining_time_in_millis(self):
+        return 900000
+
+
+def call_handler(handler, body, request_id):
+    """
+    Returns the handler's response and the lines it printed.
+    """
+    output = io.StringIO()
+    with redirect_stdout(output):
+        response = handler({'body': json.dumps(body)}, Context(request_id))
+
+    return response, output.getvalue().splitlines()
+
+
+def get_timer_cost(metrics, n=100000):
+    start = time.perf_counter()
+    for _ in range(n):
+        with metrics.timer('check'):
+            pass
+
+    return (time.perf_counter() - start) / n * 1e9
+
+
+def main():
+    storage_dir = tempfile.mkdtemp()
+    try:
+        os.environ.update({'LOCAL_STORAGE_DIR': storage_dir, 'RESULT_CACHE_DIR': os.path.join(storage_dir, 'result_cache'),
+                           'WARM_UP_MODELS': '0', 'METRICS': '1'})
+        from synthetic import use_app_dir
+        use_app_dir()
+        sys.path.insert(0, LAMBDA_DIR)
+        from server_load_test import populate_local_storage
+        input_doc_names, source_doc_names = populate_local_storage(None)
+
+        import batch_handler
+        import metrics
+        import one_many_handler
+        import one_one_handler
+        from metrics_collector import read_records, summarise_records
+
+        calls = [('1-1', one_one_handler.plagiarism_detector_1to1, {'user_id': 'check', 'input_doc_name': input_doc_names[0], 'source_doc_name': source_doc_names[0]}),
+                 ('1-1 repeated', one_one_handler.plagiarism_detector_1to1, {'user_id': 'check', 'input_doc_name': input_doc_names[0], 'source_doc_name': source_doc_names[0]}),
+                 ('1-n', one_many_handler.plagiarism_detector_1ton, {'user_id': 'check', 'input_doc_name': input_doc_names[1], 'incremental': False}),
+                 ('batch', batch_handler.plagiarism_detector_batch, {'user_id': 'check', 'input_doc_names': input_doc_names[:2], 'source_doc_names': source_doc_names[:2]}),
+                 ('missing key', one_one_handler.plagiarism_detector_1to1, {'user_id': 'check'})]
+
+        passed = True
+        records = {}
+        all_lines = []
+        for i, (name, handler, body) in enumerate(calls):
+            response, lines = call_handler(handler, body, f'request-{i}')
+            all_lines += lines
+            request_records = read_records(lines)
+            passed &= check(len(request_records) == 1 and request_records[0]['request_id'] == f'request-{i}'
+                            and request_records[0]['status_code'] == response['statusCode'],
+                            f'{name}: one EMF line with the request ID & status code {response["statusCode"]}')
+            record = request_records[0] if request_records else {'_aws': {'CloudWatchMetrics': [{'Metrics': []}]}}
+            definitions = record['_aws']['CloudWatchMetrics'][0]['Metrics']
+            passed &= check(all(definition['Name'] in record for definition in definitions) and len(definitions) <= 100,
+                            f'{name}: every declared metric is present ({len(definitions)} metrics)')
+            records[name] = record
+
+        stages = ['document_read_ms', 'sentence_splitting_ms', 'matcher_ms', 'paraphrase_ms', 'bert_encoding_ms', 'containment_ms',
+                  'lcs_ms', 'final_prediction_ms', 'model_load_ms', 'training_csv_write_ms', 'output_csv_write_ms']
+        missing = [stage for stage in stages if stage not in records['1-1']]
+        passed &= check(not missing and records['1-1']['input_sentences'] > 0 and records['1-1']['encoded_sentences'] > 0
+                        and records['1-1'].get('result_cache_misses') == 1,
+                        f'1-1: stage durations, sentence counts & a cache miss are recorded{f" (missing {missing})" if missing else ""}')
+        passed &= check(records['1-1 repeated'].get('result_cache_hits') == 1 and 'matcher_ms' not in records['1-1 repeated'],
+                        '1-1 repeated: a cache hit is recorded and matching is not')
+        passed &= check(records['1-n'].get('sources') == records['1-n'].get('sources_scored') == 2 and 'csv_read_ms' in records['1-n'],
+                        '1-n: source counts & the documents database read are recorded')
+        passed &= check('bert_encoding_ms' in records['batch'] and 'output_csv_write_ms' in records['batch'], 'batch: encoding & the output write are recorded')
+        exclusive = ['document_read_ms', 'matcher_ms', 'paraphrase_ms', 'containment_ms', 'lcs_ms', 'final_prediction_ms', 'training_csv_write_ms', 'output_csv_write_ms']
+        stage_sum = sum(records['1-1'].get(stage, 0) for stage in exclusive)
+        passed &= check(stage_sum <= records['1-1']['total_ms'],
+                        f"1-1: disjoint stages add up to {stage_sum:.1f} of {records['1-1']['total_ms']:.1f} ms")
+
+        summary, status_codes = summarise_records(read_records(all_lines))
+        passed &= check(summary['plagiarism_detector_1to1']['total_ms']['requests'] == 3 and status_codes['plagiarism_detector_1to1'] == {'200': 2, '400': 1},
+                        'metrics_collector.py summarises the requests per function')
+
+        body = {'user_id': 'check', 'input_doc_name': input_doc_names[2], 'source_doc_name': source_doc_names[2]}
+        _, lines = call_handler(one_one_handler.plagiarism_detector_1to1, dict(body, profile_memory=True), 'memory-body')
+        profiled = read_records(lines)[0]
+        peaks = ['peak_mb', 'max_rss_mb', 'matcher_peak_mb', 'count_vectors_peak_mb', 'bert_encoding_peak_mb']
+        passed &= check(all(profiled.get(name, -1) >= 0 for name in peaks) and profiled['count_vectors_peak_mb'] <= profiled['peak_mb']
+                        and profiled['top_allocations'] and not tracemalloc.is_tracing(),
+                        f"a profile_memory request logs stage memory peaks ({profiled.get('peak_mb')} MB) and stops tracemalloc")
+        with redirect_stdout(io.StringIO()) as output:
+            one_one_handler.plagiarism_detector_1to1({'body': json.dumps(body), 'headers': {'X-Profile-Memory': '1'}}, Context('memory-header'))
+        passed &= check('peak_mb' in read_records(output.getvalue().splitlines())[0] and 'peak_mb' not in records['1-1'],
+                        'an X-Profile-Memory header turns profiling on, which is off by default')
+
+        idle_ns = get_timer_cost(metrics)
+        token = metrics.current_metrics.set(metrics.RequestMetrics('check'))
+        active_ns = get_timer_cost(metrics)
+        metrics.current_metrics.reset(token)
+        print(f'     timer cost: {idle_ns:.0f} ns outside a request, {active_ns:.0f} ns inside')
+    finally:
+        shutil.rmtree(storage_dir, ignore_errors=True)
+
+    print('all checks passed' if passed else 'some checks failed')
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
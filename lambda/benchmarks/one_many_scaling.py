@@ -0,0 +1,241 @@
+"""
+Scaling of 1-n matching with the size of the documents database: latency, memory & recall of planted plagiarism.
+
+Runs on local storage in a temporary directory (see server_load_test.py), with the HashingEncoder stand-in for the
+Sentence Transformer (or --model; paraphrase recall is only meaningful with the trained model). A synthetic database
+of the largest of --sizes documents and --queries query documents with planted plagiarism are generated from the
+webis rows of df10.csv (see synthetic_corpus.py); the planted sources are among the first documents, so that the
+queries are the same at every size. For each size, the database is the first <size> documents (ONE_MANY_MAX_SOURCES=0
+lifts the top 2 rows limit), and each variant of 1-n matching runs every query, without incremental state & result
+cache. Variants:
+    sequential: get_one_many_matching_output with workers=1
+    parallel: get_one_many_matching_output with --workers worker processes
+New variants (e.g. a candidate index over the database) are added to get_variants.
+Reported per size & variant:
+    - latency: median, p95 & max ms per query, ms per source document, and the mean time of each stage
+    - memory: peak traced memory of one query (sequential variant, --memory) and the peak RSS of the process
+    - recall: fraction of the copied & paraphrased query sentences reported as plagiarised against their planted source,
+      of the planted sources among the reported sources, the precision of the reported plagiarised texts, and the
+      plagiarism flag rate of plagiarised & clean queries. The flag is computed from the features averaged over all
+      source documents, so its rate drops as the database grows.
+The median latency is fitted against the number of documents & extrapolated to --predict-docs.
+
+Usage:
+    $ python one_many_scaling.py
+    $ python one_many_scaling.py --sizes 10 100 1000 --queries 5 --variants sequential parallel --workers 4 --output scaling.json
+    $ python one_many_scaling.py --model ~/trained_bert_model.joblib --sizes 10 100
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from synthetic import percentile, use_app_dir
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+VARIANTS = ['sequential', 'parallel']
+
+
+def get_variants(cf, workers):
+    """
+    Returns variant name -> function returning the 1-n matching output of an input document name.
+    """
+    def one_many(workers):
+        return lambda input_doc_name: cf.get_one_many_matching_output(cf.sentbert_model_name, cf.final_model_name, cf.ngrams_lst,
+                                                                      input_doc_name, workers=workers, incremental=False)
+
+    return {'sequential': one_many(1),
+            'parallel': one_many(workers)}
+
+
+def store_queries(cf, queries):
+    """
+    Stores the query documents in local storage, as uploads would.
+    """
+    content_index = cf.read_content_index(cf.s3_bucket, cf.s3_content_index_filepath)
+    for query in queries:
+        text_hash = cf.get_text_hash(query['text'])
+        cf.add_document_artifacts(query['text'], text_hash, cf.s3_bucket)
+        content_index = cf.register_document(content_index, query['doc_name'], cf.get_bytes_hash(query['text'].encode('utf-8')), text_hash)
+    cf.write_s3_json(content_index, cf.s3_bucket, cf.s3_content_index_filepath)
+
+
+def write_database(cf, docs):
+    """
+    Makes docs the documents database.
+    """
+    import pandas as pd
+
+    webis_df = pd.DataFrame({'user_id': 'one-many-scaling', 'file_num': [doc['file_num'] for doc in docs], 'text': [doc['text'] for doc in docs]})
+    cf.boto3.client('s3').put_object(Bucket=cf.s3_bucket, Key=cf.s3_webis_data_filepath, Body=webis_df.to_csv(index=False))
+
+
+def run_query(function, query, profile_memory=False):
+    """
+    Returns the 1-n matching output of a query, its wall time in ms and its request metrics (stage durations & memory).
+    """
+    import metrics
+
+    request_metrics = metrics.RequestMetrics('one_many_scaling', query['doc_name'])
+    if profile_memory:
+        request_metrics.memory = metrics.MemoryProfile()
+    token = metrics.current_metrics.set(request_metrics)
+    start = time.perf_counter()
+    try:
+        output = function(query['doc_name'])
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        metrics.current_metrics.reset(token)
+        if request_metrics.memory is not None:
+            request_metrics.memory.stop()
+
+    return output, elapsed_ms, request_metrics
+
+
+def mean_or_none(values):
+    values = [value for value in values if value is not None]
+    return statistics.mean(values) if values else None
+
+
+def summarise_runs(n_docs, runs, peak_mb, queries):
+    """
+    Returns the latency, stage, memory & recall summary of the (output, ms, metrics, recall) runs of the queries.
+    """
+    latencies = [ms for _, ms, _, _ in runs]
+    stages = sorted({stage for _, _, request_metrics, _ in runs for stage in request_metrics.durations})
+    plagiarised = [output['plagiarism_flag'] for (output, _, _, _), query in zip(runs, queries) if query['source_doc_name']]
+    clean = [output['plagiarism_flag'] for (output, _, _, _), query in zip(runs, queries) if not query['source_doc_name']]
+    summary = {'docs': n_docs,
+               'queries': len(runs),
+               'median_ms': statistics.median(latencies),
+               'p95_ms': percentile(latencies, 95),
+               'max_ms': max(latencies),
+               'ms_per_doc': statistics.median(latencies) / n_docs,
+               'stages_ms': {stage: statistics.mean(request_metrics.durations.get(stage, 0.0) for _, _, request_metrics, _ in runs)
+                             for stage in stages},
+               'peak_mb': peak_mb,
+               'copy_recall': mean_or_none([recall['copy'] for _, _, _, recall in runs]),
+               'paraphrase_recall': mean_or_none([recall['paraphrase'] for _, _, _, recall in runs]),
+               'source_recall': mean_or_none([recall['source'] for _, _, _, recall in runs]),
+               'precision': mean_or_none([recall['precision'] for _, _, _, recall in runs]),
+               'flag_rate_plagiarised': mean_or_none([float(flag) for flag in plagiarised]),
+               'flag_rate_clean': mean_or_none([float(flag) for flag in clean])}
+    try:
+        import resource
+        summary['max_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        summary['max_rss_mb'] = None
+
+    return summary
+
+
+def format_value(value, spec):
+    return '-' if value is None else format(value, spec)
+
+
+def format_table(results):
+    lines = ['variant | docs | median (ms) | p95 (ms) | ms per doc | peak traced (MB) | max RSS (MB) | copy recall | paraphrase recall | source recall | precision | flagged (plagiarised) | flagged (clean)',
+             ' | '.join(['---'] * 13)]
+    for variant, sizes in results.items():
+        for summary in sizes:
+            lines.append(' | '.join([variant, str(summary['docs']), f"{summary['median_ms']:.0f}", f"{summary['p95_ms']:.0f}",
+                                     f"{summary['ms_per_doc']:.2f}", format_value(summary['peak_mb'], '.1f'),
+                                     format_value(summary['max_rss_mb'], '.0f'), format_value(summary['copy_recall'], '.2f'),
+                                     format_value(summary['paraphrase_recall'], '.2f'), format_value(summary['source_recall'], '.2f'),
+                                     format_value(summary['precision'], '.2f'), format_value(summary['flag_rate_plagiarised'], '.2f'),
+                                     format_value(summary['flag_rate_clean'], '.2f')]))
+
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000], help='numbers of documents in the database')
+    parser.add_argument('--queries', type=int, default=5, help='number of query documents')
+    parser.add_argument('--doc-words', type=int, default=300, help='words of background text per database document')
+    parser.add_argument('--query-words', type=int, default=300, help='words per query document')
+    parser.add_argument('--copy-rate', type=float, default=0.2, help='fraction of plagiarised query sentences copied verbatim')
+    parser.add_argument('--paraphrase-rate', type=float, default=0.2, help='fraction of plagiarised query sentences paraphrased')
+    parser.add_argument('--plagiarised-rate', type=float, default=0.8, help='fraction of queries with a planted source document')
+    parser.add_argument('--variants', nargs='+', default=['sequential'], choices=VARIANTS)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes of the parallel variant')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='skip the memory profiled run of the first query at each size (slower than the timed runs)')
+    parser.add_argument('--predict-docs', type=int, nargs='*', default=[100000, 500000], help='database sizes to extrapolate the latency to')
+    parser.add_argument('--model', default=None, help='local path of a trained_bert_model.joblib to use instead of the hashing encoder')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='optional path of a JSON file to write the results to')
+    args = parser.parse_args()
+
+    sizes = sorted(args.sizes)
+    storage_dir = tempfile.mkdtemp()
+    os.environ.update({'LOCAL_STORAGE_DIR': storage_dir, 'RESULT_CACHE': '0', 'WARM_UP_MODELS': '0', 'ONE_MANY_MAX_SOURCES': '0',
+                       'METRICS': '1'})
+    invocation_dir = use_app_dir()
+    sys.path.insert(0, LAMBDA_DIR)
+    results = {variant: [] for variant in args.variants}
+    try:
+        import compiled_functions as cf
+        from server_load_test import populate_local_storage
+        from synthetic_corpus import generate_corpus, get_planted_recall
+
+        populate_local_storage(args.model)
+        start = time.perf_counter()
+        docs, queries = generate_corpus(max(sizes), args.queries, args.doc_words, args.query_words, args.copy_rate, args.paraphrase_rate,
+                                        args.plagiarised_rate, planted_within=min(sizes), seed=args.seed)
+        print(f'generated {len(docs)} documents & {len(queries)} queries in {time.perf_counter() - start:.1f}s', flush=True)
+        store_queries(cf, queries)
+        variants = get_variants(cf, args.workers)
+
+        for n_docs in sizes:
+            write_database(cf, docs[:n_docs])
+            for variant in args.variants:
+                function = variants[variant]
+                function(queries[0]['doc_name']) # warm-up: model loads & the process pool
+                runs = []
+                for query in queries:
+                    output, elapsed_ms, request_metrics = run_query(function, query)
+                    runs.append((output, elapsed_ms, request_metrics, get_planted_recall(query, output)))
+                peak_mb = None
+                if args.memory and variant == 'sequential':
+                    peak_mb = run_query(function, queries[0], profile_memory=True)[2].memory.get_values()['peak_mb']
+                summary = summarise_runs(n_docs, runs, peak_mb, queries)
+                results[variant].append(summary)
+                print(f"{variant} {n_docs} docs: median {summary['median_ms']:.0f} ms, copy recall {format_value(summary['copy_recall'], '.2f')}, "
+                      f"source recall {format_value(summary['source_recall'], '.2f')}", flush=True)
+    finally:
+        shutil.rmtree(storage_dir, ignore_errors=True)
+
+    from memory_scaling import fit_line
+
+    print()
+    print(format_table(results))
+    fits = {}
+    for variant, summaries in results.items():
+        if len(summaries) < 2:
+            continue
+        intercept, slope, r2 = fit_line([summary['docs'] for summary in summaries], [summary['median_ms'] for summary in summaries])
+        fits[variant] = {'intercept_ms': intercept, 'ms_per_doc': slope, 'r2': r2,
+                         'predicted_ms': {n_docs: intercept + slope * n_docs for n_docs in args.predict_docs}}
+        print()
+        print(f'{variant}: {intercept:.0f} ms + {slope:.2f} ms per document (r2 {r2:.3f})')
+        for n_docs, predicted_ms in fits[variant]['predicted_ms'].items():
+            print(f'    {n_docs} documents: {predicted_ms / 1000:.0f} s per query')
+        stages = summaries[-1]['stages_ms']
+        print(f"    stages at {summaries[-1]['docs']} documents: " + ', '.join(f'{stage} {ms:.0f} ms' for stage, ms in sorted(stages.items(), key=lambda item: -item[1])))
+
+    if args.output:
+        report = {'config': {'sizes': sizes, 'queries': args.queries, 'doc_words': args.doc_words, 'query_words': args.query_words,
+                             'copy_rate': args.copy_rate, 'paraphrase_rate': args.paraphrase_rate, 'plagiarised_rate': args.plagiarised_rate,
+                             'workers': args.workers, 'encoder': args.model or 'hashing', 'seed': args.seed, 'cpus': os.cpu_count()},
+                  'results': results, 'fits': fits}
+        with open(os.path.join(invocation_dir, args.output), 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
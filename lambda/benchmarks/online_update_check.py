@@ -0,0 +1,130 @@
+"""
+Check of online updates of the final model (online_learning.py) on local storage.
+
+Local storage in a temporary directory holds the df10.csv documents and a final model fitted on df10.csv (see
+server_load_test.py), with a HashingEncoder stand-in for the Sentence Transformer. Checks:
+    - labelled 1-1 comparisons write one object per feature row under the online feature prefix; unlabelled ones do not
+    - rows written by concurrent requests are all kept
+    - an update publishes a versioned SGDClassifier started from the retrained model, which the matching functions load,
+      with a coefficient file tied to it
+    - an update without new rows publishes nothing; the next update continues from the published online model
+    - a row written late (keyed before the newest consumed row) is consumed by the next update, and only once
+    - after the final model is replaced (as by a full retrain), the next update restarts from it
+Reports the time of each update and the F1 of the published models on df10.csv.
+
+Usage:
+    $ python online_update_check.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def check(condition, message):
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    return condition
+
+
+def main():
+    storage_dir = tempfile.mkdtemp()
+    try:
+        os.environ.update({'LOCAL_STORAGE_DIR': storage_dir, 'RESULT_CACHE': '0', 'WARM_UP_MODELS': '0', 'ONLINE_BATCH_SIZE': '4'})
+        from synthetic import use_app_dir
+        use_app_dir()
+        from server_load_test import DF10_PATH, FEATURE_COLUMNS, populate_local_storage
+        input_doc_names, source_doc_names = populate_local_storage(None)
+
+        import joblib
+        import pandas as pd
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.metrics import f1_score
+
+        import compiled_functions as cf
+        import online_learning as ol
+
+        df = pd.read_csv(DF10_PATH)
+        targets = df['target'].astype(int).tolist()
+
+        def compare(i, target):
+            return cf.get_one_one_matching_output(cf.sentbert_model_name, cf.final_model_name, cf.ngrams_lst, source_doc_names[i],
+                                                  input_doc_names[i], target=target)
+
+        def update():
+            report = ol.update_online_model(cf.s3_bucket, cf.final_model_name)
+            model = cf.load_s3_model(cf.s3_bucket, cf.final_model_name)
+            f1 = f1_score(df['target'], model.predict(df[FEATURE_COLUMNS]))
+            print(f"     version {report['version']}: {report['labelled_rows']} rows, published {report['published']}, "
+                  f"rebased {report['rebased']}, {report['seconds'] * 1000:.0f} ms, F1 on df10 {f1:.3f}")
+            return report, model
+
+        def read_rows():
+            return ol.read_online_feature_rows(cf.s3_bucket, ol.list_online_feature_keys(cf.s3_bucket, cf.s3_online_features_filepath))
+
+        passed = True
+        compare(0, None)
+        passed &= check(read_rows() == [], 'unlabelled comparisons do not write feature rows')
+        for i in range(6):
+            compare(i, targets[i])
+        rows = read_rows()
+        passed &= check(len(rows) == 6 and all(column in rows[0] for column in FEATURE_COLUMNS + ['target'])
+                        and [row['input_doc_name'] for row in rows] == input_doc_names[:6],
+                        'labelled comparisons write their features & target, listed in creation order')
+
+        report, model = update()
+        passed &= check(report['published'] and report['rebased'] and report['version'] == 1 and type(model).__name__ == 'SGDClassifier',
+                        'the first update publishes an SGDClassifier started from the retrained model')
+        passed &= check(cf.read_s3_json(cf.s3_bucket, ol.online_model_state_filepath)['model_filepath'].endswith('final_model_v000001.joblib'),
+                        'the published model is kept under its version')
+        coefficients = cf.get_final_model_coefficients(cf.s3_bucket, cf.final_model_name)
+        passed &= check(coefficients is not None and coefficients.metadata.get('online_version') == 1,
+                        'the published coefficient file matches the published model and is scored from')
+
+        report, _ = update()
+        passed &= check(not report['published'] and report['version'] == 1, 'an update without new rows publishes nothing')
+
+        coef = model.coef_.copy()
+        features = {column: 0.5 for column in FEATURE_COLUMNS}
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda i: cf.add_online_feature_row(features, i % 2, f'source_{i}', f'concurrent_{i}', cf.s3_bucket,
+                                                                  cf.s3_online_features_filepath), range(40)))
+        written = [row for row in read_rows() if row['input_doc_name'].startswith('concurrent_')]
+        passed &= check(len(written) == 40, f'{len(written)} of 40 rows written by 8 concurrent threads are kept')
+        for i in range(6, len(df)):
+            compare(i, targets[i])
+        report, model = update()
+        passed &= check(report['published'] and not report['rebased'] and report['version'] == 2 and report['new_rows'] == 40 + len(df) - 6
+                        and (model.coef_ != coef).any(), 'the next update consumes the new rows and continues from the published online model')
+
+        state = cf.read_s3_json(cf.s3_bucket, ol.online_model_state_filepath)
+        late_key = cf.get_online_feature_key(cf.s3_online_features_filepath, state['watermark_ms'] - ol.online_late_row_ms // 2)
+        cf.write_s3_json(dict(rows[0], input_doc_name='late'), cf.s3_bucket, late_key)
+        report, _ = update()
+        late_report, _ = update()
+        passed &= check(report['published'] and report['new_rows'] == 1 and late_report['new_rows'] == 0,
+                        'a row written late, keyed before the newest consumed row, is consumed by the next update only')
+        start = time.perf_counter()
+        for i in range(20):
+            cf.add_online_feature_row(features, 1, 'source_0', f'timed_{i}', cf.s3_bucket, cf.s3_online_features_filepath)
+        print(f'     feature row write: {(time.perf_counter() - start) / 20 * 1000:.2f} ms with '
+              f'{len(ol.list_online_feature_keys(cf.s3_bucket, cf.s3_online_features_filepath)) - 20} rows already written')
+
+        retrained = LogisticRegression().fit(df[FEATURE_COLUMNS], df['target'])
+        local_file = os.path.join(tempfile.gettempdir(), 'final_model.joblib')
+        joblib.dump(retrained, local_file)
+        cf.upload_to_s3(local_file, cf.s3_bucket, cf.final_model_name)
+        compare(0, targets[0])
+        report, model = update()
+        passed &= check(report['published'] and report['rebased'] and report['version'] == 4 and report['new_rows'] == 21,
+                        'an update after a full retrain restarts from the retrained model')
+    finally:
+        shutil.rmtree(storage_dir, ignore_errors=True)
+
+    print('all checks passed' if passed else 'some checks failed')
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
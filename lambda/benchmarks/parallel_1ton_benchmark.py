@@ -0,0 +1,63 @@
+"""
+Scaling benchmark of parallel 1-n scoring across source documents.
+
+Builds a local synthetic corpus (no S3 access needed) and times get_parallel_matching_texts with 1, 2, 4 and 8
+worker processes, checking that every run merges to the same features and plagiarised texts as the sequential run.
+
+Usage:
+    $ python parallel_1ton_benchmark.py --sources 64 --source-words 2000 --input-words 1500 --workers 1 2 4 8
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+from synthetic import load_encoder, make_doc, use_app_dir
+
+INVOCATION_DIR = use_app_dir()
+
+from compiled_functions import (get_parallel_matching_texts, ngrams_lst,
+                                one_one_matching_texts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sources', type=int, default=64, help='number of synthetic source documents')
+    parser.add_argument('--source-words', type=int, default=2000, help='words per source document')
+    parser.add_argument('--input-words', type=int, default=1500, help='words in the input document')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--model', default=None, help='local path of a trained_bert_model.joblib to use instead of the hashing encoder')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='optional path of a JSON file to write the results to')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    source_lst = [(f'synthetic_{i}', make_doc(rng, args.source_words)) for i in range(args.sources)]
+    # plant a few copied passages so that matching has work to do
+    input_doc = make_doc(rng, args.input_words) + ' ' + ' '.join(doc[:300] for _, doc in source_lst[:5])
+    model = load_encoder(args.model)
+
+    start = time.perf_counter()
+    expected = [one_one_matching_texts(None, ngrams_lst, source_doc, source_doc_name, input_doc, model) for source_doc_name, source_doc in source_lst]
+    sequential_seconds = time.perf_counter() - start
+    print(f'sequential (in-process): {sequential_seconds:.2f}s')
+
+    results = {'sources': args.sources, 'source_words': args.source_words, 'input_words': args.input_words,
+               'sequential_seconds': sequential_seconds, 'workers': {}}
+
+    for workers in args.workers:
+        start = time.perf_counter()
+        matching_texts_lst = get_parallel_matching_texts(None, ngrams_lst, source_lst, input_doc, workers, model)
+        seconds = time.perf_counter() - start
+        consistent = json.dumps(matching_texts_lst, default=str) == json.dumps(expected, default=str)
+        results['workers'][workers] = {'seconds': seconds, 'speedup': sequential_seconds / seconds, 'consistent': consistent}
+        print(f'workers: {workers}, {seconds:.2f}s, speedup: {sequential_seconds / seconds:.2f}x, consistent: {consistent}')
+
+    if args.output:
+        with open(os.path.join(INVOCATION_DIR, args.output), 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
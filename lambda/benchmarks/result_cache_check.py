@@ -0,0 +1,132 @@
+"""
+Check of the 1-1 result cache (app/result_cache.py) on local storage.
+
+Local storage in a temporary directory holds the df10.csv documents (see server_load_test.py) with a HashingEncoder
+stand-in for the Sentence Transformer; the result cache is in another temporary directory. A comparison is a hit if it
+is answered without running the matching functions. Checks:
+    - a repeated comparison is a hit with the same response
+    - comparisons of identical content are hits under the requested names: a deduplicated upload (alias) and another
+      document with the same text
+    - a new final model, a new Sentence Transformer model, an extra n-gram size, streaming mode and other cascade
+      gates are misses, and the comparison is a hit again once recomputed
+Reports the time of a miss and of a hit.
+
+Usage:
+    $ python result_cache_check.py
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+
+def check(condition, message):
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    return condition
+
+
+def main():
+    storage_dir = tempfile.mkdtemp()
+    cache_dir = tempfile.mkdtemp()
+    passed = True
+    try:
+        os.environ.update({'LOCAL_STORAGE_DIR': storage_dir, 'RESULT_CACHE': '1', 'RESULT_CACHE_DIR': cache_dir,
+                           'WARM_UP_MODELS': '0', 'METRICS': '0'})
+        from synthetic import use_app_dir
+        use_app_dir()
+        from server_load_test import DF10_PATH, FEATURE_COLUMNS, populate_local_storage
+        input_doc_names, source_doc_names = populate_local_storage(None)
+
+        import joblib
+        import pandas as pd
+        from sklearn.linear_model import LogisticRegression
+
+        import compiled_functions as cf
+
+        computed = []
+        matching_functions = {name: getattr(cf, name) for name in ['one_one_matching_texts', 'stream_one_one_matching_texts']}
+
+        def counting(function):
+            def counting_function(*args, **kwargs):
+                computed.append(function.__name__)
+                return function(*args, **kwargs)
+            return counting_function
+
+        for name, function in matching_functions.items():
+            setattr(cf, name, counting(function))
+
+        def compare(input_doc_name=input_doc_names[0], source_doc_name=source_doc_names[0], ngrams_lst=None, streaming=False):
+            """
+            Returns whether the comparison was a hit, and its response as the handler serialises it.
+            """
+            del computed[:]
+            response = cf.get_one_one_matching_output(cf.sentbert_model_name, cf.final_model_name, ngrams_lst or cf.ngrams_lst,
+                                                      source_doc_name, input_doc_name, streaming=streaming)
+            return len(computed) == 0, json.loads(json.dumps(response, default=str))
+
+        start = time.perf_counter()
+        hit, response = compare()
+        miss_seconds = time.perf_counter() - start
+        passed &= check(not hit, 'the first comparison is a miss')
+        start = time.perf_counter()
+        hit, cached_response = compare()
+        hit_seconds = time.perf_counter() - start
+        passed &= check(hit and cached_response == response, 'a repeated comparison is a hit with the same response')
+
+        content_index = cf.read_content_index(cf.s3_bucket, cf.s3_content_index_filepath)
+        text_hash = content_index['documents'][input_doc_names[0]]['text_hash']
+        content_index = cf.register_alias(content_index, 'alias.pdf', input_doc_names[0])
+        content_index = cf.register_document(content_index, 'copy.pdf', 'copy-bytes-hash', text_hash)
+        cf.write_s3_json(content_index, cf.s3_bucket, cf.s3_content_index_filepath)
+        for doc_name in ['alias.pdf', 'copy.pdf']:
+            hit, renamed_response = compare(input_doc_name=doc_name)
+            passed &= check(hit and renamed_response['input_doc_name'] == doc_name
+                            and renamed_response['plagiarism_score'] == response['plagiarism_score'],
+                            f'identical content under another name ({doc_name}) is a hit, answered under that name')
+
+        df = pd.read_csv(DF10_PATH)
+        local_file = os.path.join(tempfile.gettempdir(), 'final_model.joblib')
+        joblib.dump(LogisticRegression(C=0.01).fit(df[FEATURE_COLUMNS], df['target']), local_file)
+        cf.upload_to_s3(local_file, cf.s3_bucket, cf.final_model_name)
+        os.remove(local_file)
+        hit, _ = compare()
+        rehit, _ = compare()
+        passed &= check(not hit and rehit, 'a new final model is a miss, then a hit once recomputed')
+
+        sentbert_model = cf.load_s3_model(cf.s3_bucket, cf.sentbert_model_name)
+        local_file = os.path.join(tempfile.gettempdir(), os.path.basename(cf.sentbert_model_name))
+        joblib.dump(sentbert_model, local_file)
+        cf.upload_to_s3(local_file, cf.s3_bucket, cf.sentbert_model_name)
+        os.remove(local_file)
+        hit, _ = compare()
+        rehit, _ = compare()
+        passed &= check(not hit and rehit, 'a new Sentence Transformer model is a miss, then a hit once recomputed')
+
+        hit, _ = compare(ngrams_lst=cf.ngrams_lst + [2])
+        rehit, _ = compare(ngrams_lst=cf.ngrams_lst + [2])
+        passed &= check(not hit and rehit, 'an extra n-gram size is a miss, then a hit once recomputed')
+        hit, _ = compare(streaming=True)
+        rehit, _ = compare(streaming=True)
+        passed &= check(not hit and rehit, 'streaming mode is a miss, then a hit once recomputed')
+
+        cascade_gates = cf.cascade_gates
+        cf.cascade_gates = dict(cascade_gates, enabled=not cascade_gates['enabled'])
+        hit, _ = compare()
+        cf.cascade_gates = cascade_gates
+        unchanged_hit, _ = compare()
+        passed &= check(not hit and unchanged_hit, 'other cascade gates are a miss; the previous gates are still a hit')
+        print(f'     miss {miss_seconds * 1000:.1f} ms, hit {hit_seconds * 1000:.1f} ms')
+        for name, function in matching_functions.items():
+            setattr(cf, name, function)
+    finally:
+        shutil.rmtree(storage_dir, ignore_errors=True)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    print('all checks passed' if passed else 'some checks failed')
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
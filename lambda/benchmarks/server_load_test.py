@@ -0,0 +1,164 @@
+"""
+Load test of the HTTP server: throughput and p50/p99 latency of 1-1 (or 1-n) requests at increasing concurrency.
+
+Without --url, the server runs in-process on a free port with local storage in a temporary directory, holding the
+df10.csv documents (text_para as input documents, text_og as source documents & documents database), a final model
+fitted on df10.csv and the Sentence Transformer model (--model, or a HashingEncoder stand-in). The result cache is
+disabled so that every request is matched. The report includes how many encode calls the micro-batcher coalesced.
+With --workers, the in-process server scores the source documents of 1-n requests on that many worker processes
+(ONE_MANY_WORKERS), which are forked with the micro-batcher. Requests failing or taking longer than --timeout count as errors.
+
+Usage:
+    $ python server_load_test.py --concurrency 1 2 4 8 16 --requests 40
+    $ python server_load_test.py --endpoint get_1ton_matches --workers 2 --concurrency 1 4 --requests 8
+    $ python server_load_test.py --url http://localhost:8080 --input-doc-names a.pdf --source-doc-names b.pdf
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from synthetic import percentile
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DF10_PATH = os.path.normpath(os.path.join(BENCHMARKS_DIR, '..', '..', 'retrain-codes', 'assets', 'df10.csv'))
+FEATURE_COLUMNS = ['c_1', 'c_4', 'c_5', 'lcs_word', 'para_detect_score', 'direct_detect_score']
+
+
+def populate_local_storage(model_path):
+    """
+    Fills LOCAL_STORAGE_DIR (already set in the environment) with df10.csv documents, data files & models.
+    Returns the input and source document names.
+    """
+    import joblib
+    import pandas as pd
+    from sklearn.linear_model import LogisticRegression
+
+    import compiled_functions as cf
+    from synthetic import HashingEncoder
+
+    s3_client = cf.boto3.client('s3')
+    df = pd.read_csv(DF10_PATH)
+
+    model = joblib.load(model_path) if model_path else HashingEncoder()
+    for s3_filepath, obj in [(cf.sentbert_model_name, model),
+                             (cf.final_model_name, LogisticRegression().fit(df[FEATURE_COLUMNS], df['target']))]:
+        local_file = os.path.join(tempfile.gettempdir(), os.path.basename(s3_filepath))
+        joblib.dump(obj, local_file)
+        cf.upload_to_s3(local_file, cf.s3_bucket, s3_filepath)
+
+    content_index = cf.read_content_index(cf.s3_bucket, cf.s3_content_index_filepath)
+    input_doc_names, source_doc_names = [], []
+    for i, row in df.iterrows():
+        for doc_name, doc in [(f'input_{i}.pdf', row['text_para']), (f'source_{i}.pdf', row['text_og'])]:
+            text_hash = cf.get_text_hash(doc)
+            cf.add_document_artifacts(doc, text_hash, cf.s3_bucket)
+            content_index = cf.register_document(content_index, doc_name, cf.get_bytes_hash(doc.encode('utf-8')), text_hash)
+        input_doc_names.append(f'input_{i}.pdf')
+        source_doc_names.append(f'source_{i}.pdf')
+    cf.write_s3_json(content_index, cf.s3_bucket, cf.s3_content_index_filepath)
+
+    webis_df = pd.DataFrame({'user_id': 'load-test', 'file_num': source_doc_names, 'text': df['text_og']})
+    s3_client.put_object(Bucket=cf.s3_bucket, Key=cf.s3_webis_data_filepath, Body=webis_df.to_csv(index=False))
+    s3_client.put_object(Bucket=cf.s3_bucket, Key=cf.s3_training_data_filepath, Body='file_num,text_og,text_para\n')
+    s3_client.put_object(Bucket=cf.s3_bucket, Key=cf.s3_output_data_filepath,
+                         Body='created_at,matching_type,user_id,source_doc_name,input_doc_name,plagiarism_flag,plagiarism_score,plagiarised_text\n')
+
+    return input_doc_names, source_doc_names
+
+
+def send_request(url, endpoint, body, timeout=None):
+    request = urllib.request.Request(f'{url}/{endpoint}', data=json.dumps(body).encode('utf-8'), method='POST',
+                                     headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except (urllib.error.URLError, TimeoutError):
+        status = None
+    return time.perf_counter() - start, status
+
+
+def get_batcher_stats():
+    import compiled_functions as cf
+    loaded = cf.loaded_models.get(cf.sentbert_model_name)
+    return dict(getattr(loaded['model'], 'stats', {})) if loaded else {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=None, help='URL of a running server (default: start one in-process)')
+    parser.add_argument('--endpoint', default='get_1to1_matches', choices=['get_1to1_matches', 'get_1ton_matches'])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--requests', type=int, default=40, help='requests per concurrency level')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes of 1-n requests in the in-process server (ONE_MANY_WORKERS)')
+    parser.add_argument('--timeout', type=float, default=120, help='seconds after which a request counts as an error')
+    parser.add_argument('--model', default=None, help='local path of a trained_bert_model.joblib to use instead of the hashing encoder')
+    parser.add_argument('--input-doc-names', nargs='+', default=None, help='documents to use with --url')
+    parser.add_argument('--source-doc-names', nargs='+', default=None, help='documents to use with --url')
+    parser.add_argument('--output', default=None, help='optional path of a JSON file to write the results to')
+    args = parser.parse_args()
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    storage_dir = None
+    url = args.url
+    if url is None:
+        storage_dir = tempfile.mkdtemp()
+        os.environ.update({'LOCAL_STORAGE_DIR': storage_dir, 'RESULT_CACHE': '0', 'WARM_UP_MODELS': '0'})
+        if args.workers is not None:
+            os.environ['ONE_MANY_WORKERS'] = str(args.workers)
+        from synthetic import use_app_dir
+        use_app_dir()
+        input_doc_names, source_doc_names = populate_local_storage(args.model)
+        from server import make_server
+        server = make_server('127.0.0.1', 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_address[1]}'
+    else:
+        input_doc_names, source_doc_names = args.input_doc_names, args.source_doc_names
+
+    bodies = [{'user_id': 'load-test', 'input_doc_name': input_doc_names[i % len(input_doc_names)],
+               'source_doc_name': source_doc_names[i % len(source_doc_names)]} for i in range(args.requests)]
+
+    results = {}
+    try:
+        for concurrency in args.concurrency:
+            stats_before = get_batcher_stats() if storage_dir else {}
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                responses = list(executor.map(lambda body: send_request(url, args.endpoint, body, args.timeout), bodies))
+            seconds = time.perf_counter() - start
+            stats_after = get_batcher_stats() if storage_dir else {}
+
+            latencies = [latency for latency, status in responses]
+            results[concurrency] = {'requests_per_sec': len(bodies) / seconds,
+                                    'p50_ms': percentile(latencies, 50) * 1000,
+                                    'p99_ms': percentile(latencies, 99) * 1000,
+                                    'errors': sum(status != 200 for latency, status in responses)}
+            if stats_after:
+                results[concurrency]['encode_calls'] = stats_after['calls'] - stats_before['calls']
+                results[concurrency]['encode_batches'] = stats_after['batches'] - stats_before['batches']
+            print(f"concurrency {concurrency}: {results[concurrency]['requests_per_sec']:.1f} req/s, "
+                  f"p50 {results[concurrency]['p50_ms']:.0f} ms, p99 {results[concurrency]['p99_ms']:.0f} ms, "
+                  f"errors {results[concurrency]['errors']}"
+                  + (f", encode calls {results[concurrency]['encode_calls']} in {results[concurrency]['encode_batches']} batches" if stats_after else ''))
+    finally:
+        if storage_dir:
+            shutil.rmtree(storage_dir, ignore_errors=True)
+
+    if output_path:
+        with open(output_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
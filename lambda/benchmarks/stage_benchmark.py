@@ -0,0 +1,255 @@
+"""
+Reproducible stage-level benchmark of the matching pipeline, with regression checks against a stored baseline.
+
+Runs on local storage in a temporary directory (see server_load_test.py), with the HashingEncoder stand-in for the
+Sentence Transformer (or --model) and a final model fitted on df10.csv. Cases:
+    df10: the text_para/text_og pairs of retrain-codes/assets/df10.csv
+    synthetic-<words>: --pairs synthetic input/source pairs of each of --sizes words, with --copy-rate of the input
+        sentences copied from the source, generated from --seed
+Stages, each timed over all pairs of a case:
+    sentence_splitting: get_preprocessed_sent of the input documents
+    text_construction: textmatcher.Text of the source documents
+    matcher: get_matching_texts (Text of every input sentence & Matcher against the source)
+    paraphrase: get_paraphrase_predictions of the sentences not directly matched
+    containment: get_containment_scores for ngrams_lst
+    lcs: get_lcm_score
+    lr_prediction: get_flag_score_prediction of the pairs' features
+    one_one_end_to_end: get_one_one_matching_output of the stored documents (result cache off)
+    one_many_end_to_end: get_one_many_matching_output of each input document against the case's source documents in the
+        document database (of which 1-n matching reads the first 2 rows), without incremental state
+Each stage runs once to warm up and then --repeat times; the median and fastest wall times are reported.
+
+With --baseline, stages whose median is more than --tolerance slower than in the baseline (and by at least
+--min-regression-ms) are flagged and the script exits with 1. Timings are only comparable on the same machine: save a
+baseline on the base revision, then compare the change against it.
+
+Usage:
+    $ python stage_benchmark.py --save-baseline stage_baseline.json
+    $ python stage_benchmark.py --baseline stage_baseline.json --output stage_results.json
+    $ python stage_benchmark.py --sizes 500 2000 8000 32000 --repeat 3 --stages matcher paraphrase
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from synthetic import iter_synthetic_doc, load_encoder, make_doc, use_app_dir
+
+STAGES = ['sentence_splitting', 'text_construction', 'matcher', 'paraphrase', 'containment', 'lcs', 'lr_prediction',
+          'one_one_end_to_end', 'one_many_end_to_end']
+
+
+def get_synthetic_pairs(n_words, n_pairs, copy_rate, seed):
+    """
+    Returns n_pairs (input document, source document) pairs of n_words words each, generated from seed.
+    """
+    pairs = []
+    for i in range(n_pairs):
+        rng = random.Random(seed * 1000003 + n_words * 101 + i)
+        source_doc = make_doc(rng, n_words)
+        source_sentences = [sentence.strip() + '.' for sentence in source_doc.split('.') if sentence.strip()]
+        input_doc = ''.join(iter_synthetic_doc(n_words, source_sentences, seed=rng.randint(0, 2 ** 31), copy_rate=copy_rate))
+        pairs.append((input_doc, source_doc))
+
+    return pairs
+
+
+def store_case_documents(cf, case, pairs):
+    """
+    Stores the documents of a case in local storage, as uploads would, and makes its source documents the document
+    database. Returns the stored input & source document names.
+    """
+    s3_client = cf.boto3.client('s3')
+    content_index = cf.read_content_index(cf.s3_bucket, cf.s3_content_index_filepath)
+    input_doc_names, source_doc_names = [], []
+    for i, (input_doc, source_doc) in enumerate(pairs):
+        for doc_name, doc, names in [(f'{case}_input_{i}.pdf', input_doc, input_doc_names), (f'{case}_source_{i}.pdf', source_doc, source_doc_names)]:
+            text_hash = cf.get_text_hash(doc)
+            cf.add_document_artifacts(doc, text_hash, cf.s3_bucket)
+            content_index = cf.register_document(content_index, doc_name, cf.get_bytes_hash(doc.encode('utf-8')), text_hash)
+            names.append(doc_name)
+    cf.write_s3_json(content_index, cf.s3_bucket, cf.s3_content_index_filepath)
+
+    import pandas as pd
+    webis_df = pd.DataFrame({'user_id': 'stage-benchmark', 'file_num': source_doc_names, 'text': [source_doc for _, source_doc in pairs]})
+    s3_client.put_object(Bucket=cf.s3_bucket, Key=cf.s3_webis_data_filepath, Body=webis_df.to_csv(index=False))
+
+    return input_doc_names, source_doc_names
+
+
+def get_stage_functions(cf, textmatcher, model, pairs, input_doc_names, source_doc_names):
+    """
+    Returns a function running each stage over all pairs of a case. Inputs of later stages (sentences, direct matches,
+    features) are computed once here, so that each stage is timed on its own.
+    """
+    input_text_lsts = [cf.get_preprocessed_sent(input_doc) for input_doc, _ in pairs]
+    nonmatch_lsts, features_lst = [], []
+    for (input_doc, source_doc), input_text_lst in zip(pairs, input_text_lsts):
+        _, match_lst = cf.get_matching_texts(input_text_lst, source_doc, 'source')
+        nonmatch_lsts.append(cf.get_non_direct_texts(input_text_lst, match_lst))
+        _, direct_avg_score, paraphrase_avg_score, containment_scores, lcm_score = cf.one_one_matching_texts(
+            None, cf.ngrams_lst, source_doc, 'source', input_doc, model)
+        features_lst.append(cf.get_feature_dict(containment_scores, lcm_score, direct_avg_score, paraphrase_avg_score))
+
+    return {
+        'sentence_splitting': lambda: [cf.get_preprocessed_sent(input_doc) for input_doc, _ in pairs],
+        'text_construction': lambda: [textmatcher.Text(source_doc) for _, source_doc in pairs],
+        'matcher': lambda: [cf.get_matching_texts(input_text_lst, source_doc, 'source')
+                            for input_text_lst, (_, source_doc) in zip(input_text_lsts, pairs)],
+        'paraphrase': lambda: [cf.get_paraphrase_predictions(model, [dict(sent) for sent in nonmatch_lst], source_doc, 'source', 0.7)
+                               for nonmatch_lst, (_, source_doc) in zip(nonmatch_lsts, pairs)],
+        'containment': lambda: [cf.get_containment_scores(input_doc, source_doc, cf.ngrams_lst, {}) for input_doc, source_doc in pairs],
+        'lcs': lambda: [cf.get_lcm_score(input_doc, source_doc) for input_doc, source_doc in pairs],
+        'lr_prediction': lambda: [cf.get_flag_score_prediction(cf.final_model_name, features) for features in features_lst],
+        'one_one_end_to_end': lambda: [cf.get_one_one_matching_output(cf.sentbert_model_name, cf.final_model_name, cf.ngrams_lst,
+                                                                      source_doc_name, input_doc_name)
+                                       for input_doc_name, source_doc_name in zip(input_doc_names, source_doc_names)],
+        'one_many_end_to_end': lambda: [cf.get_one_many_matching_output(cf.sentbert_model_name, cf.final_model_name, cf.ngrams_lst,
+                                                                        input_doc_name, workers=1, incremental=False)
+                                        for input_doc_name in input_doc_names],
+    }
+
+
+def time_stage(function, repeat):
+    """
+    Runs function once to warm up, then repeat times. Returns the median & fastest wall time in ms.
+    """
+    function()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+
+    return {'median_ms': statistics.median(times), 'min_ms': min(times), 'runs': repeat}
+
+
+def compare_to_baseline(results, baseline, tolerance, min_regression_ms):
+    """
+    Returns the (case, stage, baseline median, median, ratio) of every stage of results slower than in the baseline by
+    more than tolerance (relative) and min_regression_ms (absolute), and the stages of results missing from the baseline.
+    """
+    regressions, missing = [], []
+    for case, stages in results.items():
+        for stage, result in stages.items():
+            base = baseline.get(case, {}).get(stage)
+            if base is None:
+                missing.append((case, stage))
+                continue
+            ratio = result['median_ms'] / base['median_ms'] if base['median_ms'] > 0 else float('inf')
+            if ratio > 1 + tolerance and result['median_ms'] - base['median_ms'] >= min_regression_ms:
+                regressions.append((case, stage, base['median_ms'], result['median_ms'], ratio))
+
+    return regressions, missing
+
+
+def format_table(results, baseline=None):
+    lines = ['case | stage | median (ms) | min (ms)' + (' | baseline (ms) | change' if baseline else ''),
+             ' | '.join(['---'] * (6 if baseline else 4))]
+    for case, stages in results.items():
+        for stage, result in stages.items():
+            line = f"{case} | {stage} | {result['median_ms']:.2f} | {result['min_ms']:.2f}"
+            if baseline:
+                base = baseline.get(case, {}).get(stage)
+                line += f" | {base['median_ms']:.2f} | {(result['median_ms'] / base['median_ms'] - 1) * 100:+.1f}%" if base and base['median_ms'] > 0 else ' | - | -'
+            lines.append(line)
+
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 2000, 8000], help='words per synthetic document')
+    parser.add_argument('--pairs', type=int, default=3, help='synthetic pairs per size')
+    parser.add_argument('--copy-rate', type=float, default=0.2, help='fraction of synthetic input sentences copied from the source')
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per stage, after one warm-up run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--model', default=None, help='local path of a trained_bert_model.joblib to use instead of the hashing encoder')
+    parser.add_argument('--skip-df10', action='store_true', help='only run the synthetic cases')
+    parser.add_argument('--output', default=None, help='optional path of a JSON file to write the results to')
+    parser.add_argument('--baseline', default=None, help='JSON results of an earlier run to compare against')
+    parser.add_argument('--save-baseline', default=None, help='optional path to write the results to as a baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='relative slowdown of a stage median flagged as a regression')
+    parser.add_argument('--min-regression-ms', type=float, default=1.0, help='smallest absolute slowdown flagged as a regression')
+    args = parser.parse_args()
+
+    storage_dir = tempfile.mkdtemp()
+    os.environ.update({'LOCAL_STORAGE_DIR': storage_dir, 'RESULT_CACHE': '0', 'WARM_UP_MODELS': '0', 'CASCADE_GATES': '0'})
+    invocation_dir = use_app_dir()
+    random.seed(args.seed)
+    try:
+        import numpy as np
+        import pandas as pd
+
+        import compiled_functions as cf
+        import textmatcher
+        from server_load_test import DF10_PATH, populate_local_storage
+
+        np.random.seed(args.seed)
+        populate_local_storage(None)
+        if args.model:
+            cf.upload_to_s3(args.model, cf.s3_bucket, cf.sentbert_model_name)
+        model = load_encoder(args.model)
+
+        cases = {}
+        if not args.skip_df10:
+            df = pd.read_csv(DF10_PATH)
+            cases['df10'] = list(zip(df['text_para'], df['text_og']))
+        for n_words in args.sizes:
+            cases[f'synthetic-{n_words}'] = get_synthetic_pairs(n_words, args.pairs, args.copy_rate, args.seed)
+
+        results = {}
+        for case, pairs in cases.items():
+            input_doc_names, source_doc_names = store_case_documents(cf, case, pairs)
+            stage_functions = get_stage_functions(cf, textmatcher, model, pairs, input_doc_names, source_doc_names)
+            results[case] = {}
+            for stage in args.stages:
+                results[case][stage] = dict(time_stage(stage_functions[stage], args.repeat), pairs=len(pairs))
+                print(f"{case} {stage}: median {results[case][stage]['median_ms']:.2f} ms, min {results[case][stage]['min_ms']:.2f} ms", flush=True)
+    finally:
+        shutil.rmtree(storage_dir, ignore_errors=True)
+
+    report = {'config': {'sizes': args.sizes, 'pairs': args.pairs, 'copy_rate': args.copy_rate, 'repeat': args.repeat, 'seed': args.seed,
+                         'encoder': args.model or 'hashing', 'python': platform.python_version(), 'machine': platform.machine(),
+                         'cpus': os.cpu_count()},
+              'results': results}
+    baseline = None
+    if args.baseline:
+        with open(os.path.join(invocation_dir, args.baseline)) as f:
+            baseline = json.load(f)
+        if baseline.get('config', {}).get('encoder') != report['config']['encoder']:
+            print(f"warning: the baseline used the {baseline.get('config', {}).get('encoder')} encoder")
+
+    print()
+    print(format_table(results, baseline and baseline['results']))
+
+    passed = True
+    if baseline:
+        regressions, missing = compare_to_baseline(results, baseline['results'], args.tolerance, args.min_regression_ms)
+        report['regressions'] = [{'case': case, 'stage': stage, 'baseline_ms': base_ms, 'median_ms': median_ms, 'ratio': ratio}
+                                 for case, stage, base_ms, median_ms, ratio in regressions]
+        print()
+        for case, stage in missing:
+            print(f'not in baseline: {case} {stage}')
+        for case, stage, base_ms, median_ms, ratio in regressions:
+            print(f'REGRESSION {case} {stage}: {base_ms:.2f} ms -> {median_ms:.2f} ms ({(ratio - 1) * 100:+.1f}%)')
+        print(f'{len(regressions)} regression(s) beyond {args.tolerance * 100:.0f}%' if regressions else 'no regressions')
+        passed = not regressions
+
+    for path in [args.output, args.save_baseline]:
+        if path:
+            with open(os.path.join(invocation_dir, path), 'w') as f:
+                json.dump(report, f, indent=2)
+
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
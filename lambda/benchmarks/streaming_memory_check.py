@@ -0,0 +1,70 @@
+"""
+Checks that the streaming 1-1 matching pipeline runs in bounded memory.
+
+Streams a synthetic input document (1M words by default) through stream_one_one_matching_texts
+against a synthetic source document and fails if the peak resident set size of the process exceeds --max-rss-mb.
+
+By default a deterministic hashing encoder stands in for the Sentence Transformer model, so only the memory
+used by the pipeline itself is measured. Pass --model with a local trained_bert_model.joblib to use the real model.
+
+Usage:
+    $ python streaming_memory_check.py --words 1000000 --max-rss-mb 512
+"""
+import argparse
+import random
+import resource
+import sys
+import time
+
+from synthetic import iter_synthetic_doc, load_encoder, make_sentence, use_app_dir
+
+use_app_dir()
+
+from compiled_functions import ngrams_lst, stream_one_one_matching_texts
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--words', type=int, default=1000000, help='number of words in the synthetic input document')
+    parser.add_argument('--source-sentences', type=int, default=200, help='number of sentences in the synthetic source document')
+    parser.add_argument('--max-rss-mb', type=float, default=512, help='peak RSS bound in MB (the Lambda memory setting)')
+    parser.add_argument('--window-size', type=int, default=256, help='streaming window size in sentences')
+    parser.add_argument('--model', default=None, help='local path of a trained_bert_model.joblib to use instead of the hashing encoder')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    source_sentences = [make_sentence(rng, rng.randint(6, 20)) for _ in range(args.source_sentences)]
+    source_doc = ' '.join(source_sentences)
+    model = load_encoder(args.model)
+
+    baseline_rss = peak_rss_mb()
+    match_count = [0]
+
+    def count_matches(window_text):
+        match_count[0] += len(window_text)
+
+    start = time.perf_counter()
+    _, direct_avg_score, paraphrase_avg_score, containment_scores, lcm_score = stream_one_one_matching_texts(
+        model, ngrams_lst, source_doc, 'synthetic_source', iter_synthetic_doc(args.words, source_sentences, args.seed),
+        window_size=args.window_size, on_match=count_matches)
+    elapsed = time.perf_counter() - start
+    rss = peak_rss_mb()
+
+    print(f'words: {args.words}, elapsed: {elapsed:.1f}s, matches: {match_count[0]}')
+    print(f'direct_avg_score: {direct_avg_score:.4f}, paraphrase_avg_score: {paraphrase_avg_score:.4f}, '
+          f'containment: {containment_scores}, lcs: {lcm_score:.4f}')
+    print(f'peak RSS: {rss:.1f} MB (after imports: {baseline_rss:.1f} MB, bound: {args.max_rss_mb:.0f} MB)')
+
+    if rss > args.max_rss_mb:
+        print('FAILED: peak RSS exceeds bound', file=sys.stderr)
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Shared helpers for the benchmark scripts: a deterministic stand-in encoder, synthetic documents and PDFs, and percentiles.
+"""
+import os
+import random
+import sys
+import zlib
+
+import numpy as np
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+
+
+def use_app_dir():
+    """
+    Makes the Lambda app modules importable. textmatcher reads nltk_data/ relative to the working directory,
+    so the working directory is changed to the app directory as well.
+    Returns the original working directory, against which relative output paths should be resolved.
+    """
+    invocation_dir = os.getcwd()
+    sys.path.insert(0, APP_DIR)
+    os.chdir(APP_DIR)
+    return invocation_dir
+
+
+def percentile(values, q):
+    """
+    Returns the q-th percentile of values (nearest rank, without interpolation).
+    """
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+VOCAB = ['theater', 'poetry', 'nation', 'literature', 'writer', 'castle', 'farmer', 'family', 'window', 'soldier',
+         'chieftain', 'request', 'culture', 'drama', 'excellence', 'miserable', 'century', 'effort', 'scientific', 'russian',
+         'the', 'of', 'and', 'in', 'is', 'was', 'to', 'a', 'with', 'his']
+
+
+class HashingEncoder:
+    """
+    Deterministic bag-of-words encoder exposing the SentenceTransformer.encode interface.
+    """
+
+    def __init__(self, dim=64):
+        self.dim = dim
+
+    def encode(self, sentences, **kwargs):
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        embeddings = np.zeros((len(sentences), self.dim), dtype=np.float32)
+        for i, sentence in enumerate(sentences):
+            for word in sentence.lower().split():
+                embeddings[i, zlib.crc32(word.encode('utf-8')) % self.dim] += 1
+        return embeddings[0] if single else embeddings
+
+
+def load_encoder(model_path=None):
+    """
+    Returns the trained Sentence Transformer model at model_path, or a HashingEncoder if no path is given.
+    """
+    if model_path:
+        import joblib
+        return joblib.load(model_path)
+    return HashingEncoder()
+
+
+def make_sentence(rng, length):
+    return ' '.join(rng.choice(VOCAB) for _ in range(length)).capitalize() + '.'
+
+
+def make_doc(rng, n_words):
+    sentences = []
+    words = 0
+    while words < n_words:
+        length = rng.randint(6, 20)
+        sentences.append(make_sentence(rng, length))
+        words += length
+    return ' '.join(sentences)
+
+
+def iter_synthetic_doc(n_words, source_sentences, seed=0, copy_rate=0.05, chunk_words=5000):
+    """
+    Yields a synthetic document of n_words words in chunks, with a fraction of sentences copied from the source.
+    """
+    rng = random.Random(seed)
+    words = 0
+    chunk = []
+    chunk_len = 0
+    while words < n_words:
+        if rng.random() < copy_rate:
+            sentence = rng.choice(source_sentences)
+        else:
+            sentence = make_sentence(rng, rng.randint(6, 20))
+        chunk.append(sentence)
+        sentence_words = len(sentence.split())
+        words += sentence_words
+        chunk_len += sentence_words
+        if chunk_len >= chunk_words:
+            yield ' '.join(chunk) + ' '
+            chunk = []
+            chunk_len = 0
+    if chunk:
+        yield ' '.join(chunk)
+
+
+def make_pdf(text, words_per_line=12, lines_per_page=50):
+    """
+    Returns the bytes of a minimal PDF of text (ASCII) in Helvetica, for uploads without a PDF writer dependency.
+    """
+    words = text.split()
+    lines = [' '.join(words[i:i + words_per_line]) for i in range(0, len(words), words_per_line)] or ['']
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)]
+
+    n_pages = len(pages)
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>',
+               '<< /Type /Pages /Kids [' + ' '.join(f'{4 + 2 * i} 0 R' for i in range(n_pages)) + f'] /Count {n_pages} >>',
+               '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    for i, page_lines in enumerate(pages):
+        escaped = [line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)') for line in page_lines]
+        stream = 'BT /F1 10 Tf 12 TL 40 800 Td ' + ' '.join(f'({line}) Tj T*' for line in escaped) + ' ET'
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>')
+        objects.append(f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream')
+
+    pdf = '%PDF-1.4\n'
+    offsets = []
+    for i, obj in enumerate(objects):
+        offsets.append(len(pdf))
+        pdf += f'{i + 1} 0 obj\n{obj}\nendobj\n'
+    xref_offset = len(pdf)
+    pdf += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n' + ''.join(f'{offset:010d} 00000 n \n' for offset in offsets)
+    pdf += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n'
+
+    return pdf.encode('latin-1')
@@ -0,0 +1,208 @@
+"""
+Synthetic documents databases & query documents with planted plagiarism, built from the webis rows of df10.csv.
+
+Database documents are unrelated background text, sampled from the word frequencies of the df10.csv texts. Query
+documents are background text too, except for the plagiarised queries (--plagiarised-rate of them), each of which
+plants one database document as its source:
+    - the source document gets the text_og passage of a df10.csv row with target 1 inserted at a sentence boundary
+    - about --copy-rate of the query's sentences are verbatim copies of the source document's sentences
+    - about --paraphrase-rate of them are the sentences of the row's text_para, a paraphrase of the inserted passage
+The character spans of the planted sentences are recorded with each query, so that the recall of 1-n matching can be
+measured (see one_many_scaling.py). Generation is deterministic for a seed.
+
+Usage:
+    $ python synthetic_corpus.py --docs 1000 --queries 10 --output-dir corpus/
+which writes corpus/webis_db.csv (file_num, text, like the documents database) and corpus/queries.jsonl.
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import random
+import re
+
+from server_load_test import DF10_PATH
+
+word_pattern = re.compile(r"[A-Za-z][a-z]+")
+sentence_pattern = re.compile(r'(?<=[.!?])\s+')
+
+
+def load_webis_rows(path=DF10_PATH):
+    """
+    Returns the text_og, text_para & target of each row of a webis-style CSV, with whitespace normalised.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        return [{'text_og': ' '.join(row['text_og'].split()), 'text_para': ' '.join(row['text_para'].split()), 'target': int(row['target'])}
+                for row in csv.DictReader(f)]
+
+
+def split_sentences(text, min_words=4):
+    """
+    Returns the sentences of text with at least min_words words.
+    """
+    return [sentence for sentence in sentence_pattern.split(text) if len(sentence.split()) >= min_words]
+
+
+class BackgroundText:
+    """
+    Random sentences of words drawn from the word frequencies of the rows' texts.
+    """
+
+    def __init__(self, rows):
+        counts = {}
+        for row in rows:
+            for word in word_pattern.findall(row['text_og'] + ' ' + row['text_para']):
+                counts[word.lower()] = counts.get(word.lower(), 0) + 1
+        self.words = sorted(counts)
+        self.cum_weights = list(itertools.accumulate(counts[word] for word in self.words))
+
+    def make_sentence(self, rng):
+        words = rng.choices(self.words, cum_weights=self.cum_weights, k=rng.randint(8, 20))
+        return ' '.join(words).capitalize() + '.'
+
+    def make_sentences(self, rng, n_words):
+        sentences, words = [], 0
+        while words < n_words:
+            sentences.append(self.make_sentence(rng))
+            words += len(sentences[-1].split())
+        return sentences
+
+
+def join_sentences(sentences):
+    """
+    Returns the text of (kind, sentence) tuples joined by spaces, and the (kind, start, end) character span of each
+    planted (non-background) sentence, end inclusive like the start/end_char_index of the matching output.
+    """
+    text, spans, position = [], [], 0
+    for kind, sentence in sentences:
+        if kind != 'background':
+            spans.append({'kind': kind, 'start': position, 'end': position + len(sentence) - 1})
+        text.append(sentence)
+        position += len(sentence) + 1
+
+    return ' '.join(text), spans
+
+
+def generate_corpus(n_docs, n_queries, doc_words=300, query_words=300, copy_rate=0.2, paraphrase_rate=0.2, plagiarised_rate=0.8,
+                    planted_within=None, seed=0, rows=None):
+    """
+    Returns a synthetic documents database and query documents with planted plagiarism.
+
+    Args:
+        n_docs (int): Number of database documents.
+        n_queries (int): Number of query documents.
+        doc_words (int): Words of background text per database document.
+        query_words (int): Words per query document.
+        copy_rate (float): Fraction of the sentences of a plagiarised query copied verbatim from its source document.
+        paraphrase_rate (float): Fraction of the sentences of a plagiarised query paraphrasing its source document.
+        plagiarised_rate (float): Fraction of the queries with a planted source document.
+        planted_within (int): Plant the sources among the first planted_within database documents, so that the queries
+            are the same for every prefix of the database of at least that many documents. Defaults to all documents.
+        seed (int): Random seed.
+        rows (list[dict]): Webis rows (see load_webis_rows). Defaults to the rows of df10.csv.
+
+    Returns:
+        docs (list[dict]): Database documents with keys file_num & text.
+        queries (list[dict]): Query documents with keys doc_name, text, source_doc_name (None for unplagiarised
+            queries) & planted (character spans of the copied & paraphrased sentences, see join_sentences).
+    """
+    rows = rows or load_webis_rows()
+    background = BackgroundText(rows)
+    passages = [(split_sentences(row['text_og']), split_sentences(row['text_para'])) for row in rows if row['target'] == 1]
+
+    # each database document has its own random generator, so that a database is a prefix of any larger one
+    doc_sentences = [[('background', sentence) for sentence in background.make_sentences(random.Random(seed * 1000003 + i), doc_words)]
+                     for i in range(n_docs)]
+    rng = random.Random(seed)
+    n_candidates = min(planted_within or n_docs, n_docs)
+    planted_positions = rng.sample(range(n_candidates), min(round(n_queries * plagiarised_rate), n_candidates))
+
+    queries = []
+    for q in range(n_queries):
+        source = None
+        if q < len(planted_positions):
+            og_sentences, para_sentences = passages[q % len(passages)]
+            source = doc_sentences[planted_positions[q]]
+            insert_at = rng.randint(0, len(source))
+            source[insert_at:insert_at] = [('source', sentence) for sentence in og_sentences]
+            para_iter = itertools.cycle(para_sentences)
+
+        sentences, words = [], 0
+        while words < query_words:
+            draw = rng.random()
+            if source is not None and draw < copy_rate:
+                sentence = ('copy', rng.choice(source)[1])
+            elif source is not None and draw < copy_rate + paraphrase_rate:
+                sentence = ('paraphrase', next(para_iter))
+            else:
+                sentence = ('background', background.make_sentence(rng))
+            sentences.append(sentence)
+            words += len(sentence[1].split())
+        text, planted = join_sentences(sentences)
+        queries.append({'doc_name': f'query_{q:04d}.pdf', 'text': text, 'planted': planted,
+                        'source_doc_name': f'corpus_{planted_positions[q]:06d}' if source is not None else None})
+
+    docs = [{'file_num': f'corpus_{i:06d}', 'text': join_sentences(sentences)[0]} for i, sentences in enumerate(doc_sentences)]
+
+    return docs, queries
+
+
+def get_overlap(start, end, span):
+    return max(0, min(end, span['end']) - max(start, span['start']) + 1)
+
+
+def get_planted_recall(query, output, min_overlap=0.5):
+    """
+    Returns the recall & precision of the planted plagiarism of a query in a 1-n matching output. A planted sentence is
+    found if plagiarised texts reported against the planted source document cover at least min_overlap of its characters.
+
+    Returns:
+        recall (dict): Fraction of the copied & of the paraphrased sentences found (None if the query has none), whether
+            the planted source document is among the reported sources, and the fraction of reported plagiarised texts
+            that are against the planted source & overlap a planted sentence (None if none are reported).
+    """
+    reported = output['plagiarised_text']
+    source_spans = [(text['start_char_index'], text['end_char_index']) for text in reported
+                    if query['source_doc_name'] and text.get('source_doc_name') == query['source_doc_name']]
+    recall = {}
+    for kind in ['copy', 'paraphrase']:
+        planted = [span for span in query['planted'] if span['kind'] == kind]
+        found = sum(sum(get_overlap(start, end, span) for start, end in source_spans) >= min_overlap * (span['end'] - span['start'] + 1)
+                    for span in planted)
+        recall[kind] = found / len(planted) if planted else None
+    recall['source'] = bool(source_spans) if query['source_doc_name'] else None
+    true_reports = sum(any(get_overlap(start, end, span) > 0 for span in query['planted']) for start, end in source_spans)
+    recall['precision'] = true_reports / len(reported) if reported else None
+
+    return recall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=1000, help='number of database documents')
+    parser.add_argument('--queries', type=int, default=10, help='number of query documents')
+    parser.add_argument('--doc-words', type=int, default=300, help='words of background text per database document')
+    parser.add_argument('--query-words', type=int, default=300, help='words per query document')
+    parser.add_argument('--copy-rate', type=float, default=0.2, help='fraction of plagiarised query sentences copied verbatim')
+    parser.add_argument('--paraphrase-rate', type=float, default=0.2, help='fraction of plagiarised query sentences paraphrased')
+    parser.add_argument('--plagiarised-rate', type=float, default=0.8, help='fraction of queries with a planted source document')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output-dir', required=True, help='directory to write webis_db.csv & queries.jsonl to')
+    args = parser.parse_args()
+
+    docs, queries = generate_corpus(args.docs, args.queries, args.doc_words, args.query_words, args.copy_rate, args.paraphrase_rate,
+                                    args.plagiarised_rate, seed=args.seed)
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(os.path.join(args.output_dir, 'webis_db.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, ['file_num', 'text'])
+        writer.writeheader()
+        writer.writerows(docs)
+    with open(os.path.join(args.output_dir, 'queries.jsonl'), 'w', encoding='utf-8') as f:
+        for query in queries:
+            f.write(json.dumps(query) + '\n')
+    print(f'{len(docs)} documents & {len(queries)} queries written to {args.output_dir}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Local collector of the per-request metrics the handlers log (see app/metrics.py).
+
+Reads log files (or stdin), e.g. the output of the on-prem server or `aws logs tail /aws/lambda/<function>`, picks out
+the EMF metric lines and summarises every stage duration & count per function: number of requests reporting it, mean,
+p50, p95 and max. Non-metric lines are skipped.
+
+Usage:
+    $ python server.py --port 8080 | tee server.log
+    $ python metrics_collector.py server.log
+    $ aws logs tail /aws/lambda/plagiarism_detector_1ton --since 1h | python metrics_collector.py --output metrics.json
+"""
+import argparse
+import json
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app'))
+
+from metrics import parse_metrics_line
+
+
+def read_records(lines, function_name=None):
+    """
+    Returns the EMF records of the log lines, optionally only those of one function.
+    """
+    records = []
+    for line in lines:
+        record = parse_metrics_line(line)
+        if record is not None and (function_name is None or record.get('function') == function_name):
+            records.append(record)
+
+    return records
+
+
+def get_percentile(values, percentile):
+    """
+    Returns the nearest-rank percentile of values.
+    """
+    values = sorted(values)
+    rank = max(1, math.ceil(percentile / 100 * len(values)))
+
+    return values[rank - 1]
+
+
+def summarise_records(records):
+    """
+    Returns function -> metric -> {unit, requests, mean, p50, p95, max} of the EMF records, and the number of requests
+    of each function by status code.
+    """
+    values = {}
+    status_codes = {}
+    for record in records:
+        function_name = record.get('function', 'unknown')
+        codes = status_codes.setdefault(function_name, {})
+        codes[str(record.get('status_code'))] = codes.get(str(record.get('status_code')), 0) + 1
+        for directive in record['_aws']['CloudWatchMetrics']:
+            for metric in directive['Metrics']:
+                if isinstance(record.get(metric['Name']), (int, float)):
+                    values.setdefault(function_name, {}).setdefault(metric['Name'], (metric.get('Unit'), []))[1].append(record[metric['Name']])
+
+    summary = {}
+    for function_name, metrics in values.items():
+        summary[function_name] = {}
+        for name, (unit, metric_values) in sorted(metrics.items()):
+            summary[function_name][name] = {'unit': unit,
+                                            'requests': len(metric_values),
+                                            'mean': sum(metric_values) / len(metric_values),
+                                            'p50': get_percentile(metric_values, 50),
+                                            'p95': get_percentile(metric_values, 95),
+                                            'max': max(metric_values)}
+
+    return summary, status_codes
+
+
+def format_summary(summary, status_codes):
+    lines = []
+    for function_name, metrics in summary.items():
+        codes = ', '.join(f'{code}: {n}' for code, n in sorted(status_codes[function_name].items()))
+        lines += ['', f'{function_name} ({codes})', 'metric | requests | mean | p50 | p95 | max', '--- | --- | --- | --- | --- | ---']
+        for name, stats in metrics.items():
+            lines.append(f"{name} | {stats['requests']} | {stats['mean']:.2f} | {stats['p50']:.2f} | {stats['p95']:.2f} | {stats['max']:.2f}")
+
+    return '\n'.join(lines).strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('logs', nargs='*', help='log files to read (default stdin)')
+    parser.add_argument('--function', default=None, help='only summarise the requests of this handler')
+    parser.add_argument('--output', default=None, help='optional path of a JSON file to write the summary to')
+    args = parser.parse_args()
+
+    records = []
+    if args.logs:
+        for path in args.logs:
+            with open(path) as f:
+                records += read_records(f, args.function)
+    else:
+        records = read_records(sys.stdin, args.function)
+
+    summary, status_codes = summarise_records(records)
+    print(f'{len(records)} requests')
+    print(format_summary(summary, status_codes))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'requests': len(records), 'status_codes': status_codes, 'metrics': summary}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
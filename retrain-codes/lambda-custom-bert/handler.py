@@ -12,6 +12,9 @@ def main(event, context):
     job['ResourceConfig']['InstanceType'] = os.environ['instance_type']
     job['ResourceConfig']['InstanceCount'] = int(os.environ['instance_count'])
 
+    # SageMaker syncs /opt/ml/checkpoints of the job with this S3 location, so a restarted job resumes from its last checkpoint
+    checkpoint_args = {'CheckpointConfig': job['CheckpointConfig']} if 'CheckpointConfig' in job else {}
+
     print("Starting training job %s" % training_job_name)
 
     if 'VpcConfig' in job:
@@ -21,7 +24,8 @@ def main(event, context):
             ResourceConfig=job['ResourceConfig'], StoppingCondition=job['StoppingCondition'],
             HyperParameters=job['HyperParameters'] if 'HyperParameters' in job else {},
             VpcConfig=job['VpcConfig'],
-            Tags=job['Tags'] if 'Tags' in job else [])
+            Tags=job['Tags'] if 'Tags' in job else [],
+            **checkpoint_args)
     else:
         # Because VpcConfig cannot be empty like HyperParameters or Tags :-/
         resp = sm.create_training_job(
@@ -29,6 +33,7 @@ def main(event, context):
             InputDataConfig=job['InputDataConfig'], OutputDataConfig=job['OutputDataConfig'],
             ResourceConfig=job['ResourceConfig'], StoppingCondition=job['StoppingCondition'],
             HyperParameters=job['HyperParameters'] if 'HyperParameters' in job else {},
-            Tags=job['Tags'] if 'Tags' in job else [])
+            Tags=job['Tags'] if 'Tags' in job else [],
+            **checkpoint_args)
 
     print(resp)
\ No newline at end of file
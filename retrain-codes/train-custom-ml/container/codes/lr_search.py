@@ -0,0 +1,288 @@
+"""
+Successive-halving hyperparameter search for the final logistic regression model.
+
+Candidates are the valid solver/penalty combinations of a scikit-learn style parameter grid, with max_iter used as
+the halving resource: every round trains the surviving candidates for more iterations, warm-starting each fold's
+model from the previous round, and keeps the best 1/eta of them by mean cross-validated F1. Fold results are cached
+by data, fold, parameters and resource, so a repeated job on the same data reuses them.
+
+The best model is also exported as a coefficient file (see get_coefficients), which the Lambda scores with NumPy only.
+"""
+import hashlib
+import json
+import math
+import time
+import warnings
+from datetime import datetime, timezone
+
+import numpy as np
+import sklearn
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import f1_score
+from sklearn.model_selection import check_cv
+
+# penalties supported by each solver
+SOLVER_PENALTIES = {
+    'lbfgs': ['l2', 'none'],
+    'newton-cg': ['l2', 'none'],
+    'liblinear': ['l1', 'l2'],
+    'sag': ['l2', 'none'],
+    'saga': ['l1', 'l2', 'elasticnet', 'none'],
+}
+COEFFICIENTS_FORMAT_VERSION = 1 # format of the coefficient file, as read by lambda/app/linear_predictor.py
+# solvers that continue from the previous coefficients with warm_start (liblinear restarts every fit)
+WARM_START_SOLVERS = {'lbfgs', 'newton-cg', 'sag', 'saga'}
+
+
+def get_no_penalty():
+    """
+    Returns the value of the penalty parameter for no regularisation: None since scikit-learn 1.2, 'none' before.
+    """
+    major, minor = (int(part) for part in sklearn.__version__.split('.')[:2])
+    return None if (major, minor) >= (1, 2) else 'none'
+
+
+def get_param_candidates(param_grid):
+    """
+    Expands a parameter grid into the valid, distinct LogisticRegression parameter combinations.
+    Solver/penalty pairs the solver does not support are pruned, C is dropped without a penalty (it has no effect) and
+    elasticnet is crossed with the grid's l1_ratio values (default [0.5]). max_iter is not part of the candidates, as it
+    is the resource of the search.
+
+    Args:
+        param_grid (list[dict]): Parameter grid, as for GridSearchCV.
+
+    Returns:
+        candidates (list[dict]): LogisticRegression parameters of each candidate.
+        n_pruned (int): Number of grid combinations (excluding max_iter) that were invalid.
+    """
+    candidates = []
+    n_pruned = 0
+
+    for grid in param_grid:
+        for penalty in grid.get('penalty', ['l2']):
+            for solver in grid.get('solver', ['lbfgs']):
+                n_combinations = len(grid.get('C', [1.0])) * (len(grid.get('l1_ratio', [0.5])) if penalty == 'elasticnet' else 1)
+                if penalty not in SOLVER_PENALTIES[solver]:
+                    n_pruned += n_combinations
+                    continue
+                if penalty == 'none':
+                    params_lst = [{'penalty': get_no_penalty(), 'solver': solver}]
+                elif penalty == 'elasticnet':
+                    params_lst = [{'penalty': penalty, 'solver': solver, 'C': float(C), 'l1_ratio': float(l1_ratio)}
+                                  for C in grid.get('C', [1.0]) for l1_ratio in grid.get('l1_ratio', [0.5])]
+                else:
+                    params_lst = [{'penalty': penalty, 'solver': solver, 'C': float(C)} for C in grid.get('C', [1.0])]
+                for params in params_lst:
+                    if params not in candidates:
+                        candidates.append(params)
+
+    return candidates, n_pruned
+
+
+def get_resources(min_iter, max_iter, eta):
+    """
+    Returns the max_iter of each round: min_iter, min_iter * eta, ... up to and including max_iter.
+    """
+    resources = []
+    resource = min_iter
+    while resource < max_iter:
+        resources.append(resource)
+        resource *= eta
+    resources.append(max_iter)
+
+    return resources
+
+
+def get_data_hash(X, y, folds):
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(X, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(y).astype(np.int64).tobytes())
+    for train_index, test_index in folds:
+        digest.update(np.asarray(test_index, dtype=np.int64).tobytes())
+
+    return digest.hexdigest()
+
+
+def get_fold_cache_key(data_hash, fold, params, resource):
+    config = {'data_hash': data_hash, 'fold': fold, 'params': params, 'resource': resource, 'sklearn': sklearn.__version__}
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def ignore_fit_warnings():
+    """
+    Silences the warnings every fit of the search would log: non-convergence within the round's max_iter (expected,
+    the next round continues) and the deprecation of the penalty parameter in scikit-learn 1.8.
+    """
+    warnings.simplefilter('ignore', ConvergenceWarning)
+    warnings.simplefilter('ignore', FutureWarning)
+
+
+def fit_fold(model, X_train, y_train, X_test, y_test, max_iter):
+    """
+    Fits a fold's model for up to max_iter (further) iterations and returns its F1 score on the held-out fold and whether it converged.
+    """
+    model.set_params(max_iter=max_iter)
+    with warnings.catch_warnings():
+        ignore_fit_warnings()
+        model.fit(X_train, y_train)
+    converged = bool(np.max(model.n_iter_) < max_iter)
+
+    return f1_score(y_test, model.predict(X_test), zero_division=0), converged
+
+
+def restore_model(params, fold_result):
+    """
+    Returns a warm-startable model with the coefficients of a cached fold result.
+    """
+    model = LogisticRegression(**params, warm_start=True)
+    model.coef_ = np.array(fold_result['coef'])
+    model.intercept_ = np.array(fold_result['intercept'])
+    model.classes_ = np.array(fold_result['classes'])
+
+    return model
+
+
+def successive_halving_search(X, y, param_grid, cv=3, min_iter=100, max_iter=5000, eta=3, cache=None):
+    """
+    Searches the valid candidates of param_grid by successive halving over max_iter and refits the best one on all data.
+    Fold models whose solver converged are not trained further in later rounds.
+
+    Args:
+        X (array-like): Training features.
+        y (array-like): Training labels.
+        param_grid (list[dict]): Parameter grid, as for GridSearchCV. max_iter values are ignored (see min_iter & max_iter).
+        cv (int): Number of cross-validation folds.
+        min_iter (int): max_iter of the first round.
+        max_iter (int): max_iter of the last round.
+        eta (int): Factor by which the number of candidates shrinks and max_iter grows every round.
+        cache (dict): Fold results by key (see get_fold_cache_key), read & updated in place; results this search did not use are removed.
+
+    Returns:
+        best_model (LogisticRegression): Best candidate refitted on all data with max_iter.
+        report (dict): best_params, best_score (mean cross-validated F1), numbers of candidates, pruned combinations,
+            rounds, fits and cached fits, and the search time in seconds.
+    """
+    start = time.perf_counter()
+    X_input, y_input = X, y # the best model is refitted on these, to keep e.g. DataFrame feature names
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y)
+    if cache is None:
+        cache = {}
+
+    candidates, n_pruned = get_param_candidates(param_grid)
+    folds = list(check_cv(cv, y, classifier=True).split(X, y))
+    data_hash = get_data_hash(X, y, folds)
+
+    # per candidate & fold: model, score, whether it converged
+    states = [[{'model': None, 'score': 0.0, 'converged': False} for _ in folds] for _ in candidates]
+    alive = list(range(len(candidates)))
+    n_fits = n_cached = 0
+    used_keys = set()
+    rounds = []
+    previous_resource = 0
+
+    for resource in get_resources(min_iter, max_iter, eta):
+        for candidate in alive:
+            params = candidates[candidate]
+            for fold, (train_index, test_index) in enumerate(folds):
+                state = states[candidate][fold]
+                if state['converged']:
+                    continue
+
+                key = get_fold_cache_key(data_hash, fold, params, resource)
+                used_keys.add(key)
+                if key in cache:
+                    state.update(score=cache[key]['score'], converged=cache[key]['converged'], model=None, cached=cache[key])
+                    n_cached += 1
+                    continue
+
+                if state['model'] is None:
+                    state['model'] = restore_model(params, state['cached']) if 'cached' in state else LogisticRegression(**params, warm_start=True)
+                warm = params['solver'] in WARM_START_SOLVERS and hasattr(state['model'], 'coef_')
+                state['score'], state['converged'] = fit_fold(state['model'], X[train_index], y[train_index], X[test_index], y[test_index],
+                                                              resource - previous_resource if warm else resource)
+                n_fits += 1
+                cache[key] = state['cached'] = {'score': state['score'],
+                                                'converged': state['converged'],
+                                                'coef': state['model'].coef_.tolist(),
+                                                'intercept': state['model'].intercept_.tolist(),
+                                                'classes': state['model'].classes_.tolist()}
+
+        scores = {candidate: float(np.mean([state['score'] for state in states[candidate]])) for candidate in alive}
+        alive = sorted(alive, key=lambda candidate: (-scores[candidate], candidate))
+        rounds.append({'max_iter': resource, 'candidates': len(alive), 'best_score': scores[alive[0]]})
+        if resource < max_iter:
+            alive = alive[:max(1, math.ceil(len(alive) / eta))]
+        previous_resource = resource
+
+    # drop fold results of other data, so the cache only grows with the search
+    for key in set(cache) - used_keys:
+        del cache[key]
+
+    best = alive[0]
+    best_model = LogisticRegression(**candidates[best], max_iter=max_iter)
+    with warnings.catch_warnings():
+        ignore_fit_warnings()
+        best_model.fit(X_input, y_input)
+
+    report = {'best_params': dict(candidates[best], max_iter=max_iter),
+              'best_score': scores[best],
+              'candidates': len(candidates),
+              'pruned_combinations': n_pruned,
+              'rounds': rounds,
+              'fits': n_fits,
+              'cached_fits': n_cached,
+              'seconds': time.perf_counter() - start}
+
+    return best_model, report
+
+
+def get_coefficients(model, feature_names, params=None, model_sha256=None):
+    """
+    Returns the coefficient file content of a fitted binary linear classifier: its weights in feature order, intercept
+    and classes, with the file's format version and the model's provenance.
+
+    Args:
+        model (LogisticRegression): Fitted binary classifier (or a GridSearchCV of one).
+        feature_names (list[str]): Names of the model's features, in the order of its coefficients.
+        params (dict): Hyperparameters of the model, e.g. the search's best_params.
+        model_sha256 (str): SHA-256 of the pickled model file, which the Lambda checks the coefficient file against
+            before scoring with it (see get_file_sha256).
+
+    Returns:
+        coefficients (dict): JSON-serialisable coefficient file content.
+    """
+    model = getattr(model, 'best_estimator_', model)
+    if model.coef_.shape != (1, len(feature_names)):
+        raise ValueError(f'Expected a binary classifier over {len(feature_names)} features, got coefficients of shape {model.coef_.shape}')
+
+    return {'format_version': COEFFICIENTS_FORMAT_VERSION,
+            'model_type': type(model).__name__,
+            'feature_names': list(feature_names),
+            'coef': [float(value) for value in model.coef_[0]],
+            'intercept': float(model.intercept_[0]),
+            'classes': [value.item() if hasattr(value, 'item') else value for value in model.classes_],
+            'params': {key: value.item() if hasattr(value, 'item') else value for key, value in (params or {}).items()},
+            'model_sha256': model_sha256,
+            'sklearn_version': sklearn.__version__,
+            'created_at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}
+
+
+def get_file_sha256(filepath):
+    """
+    Returns the SHA-256 hex digest of a file.
+    """
+    with open(filepath, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def export_coefficients(model, feature_names, filepath, params=None, model_filepath=None):
+    """
+    Writes the coefficient file of a fitted binary linear classifier (see get_coefficients) to filepath, tied to the
+    pickled model file at model_filepath if given.
+    """
+    model_sha256 = get_file_sha256(model_filepath) if model_filepath else None
+    with open(filepath, 'w') as f:
+        json.dump(get_coefficients(model, feature_names, params, model_sha256), f, indent=2)